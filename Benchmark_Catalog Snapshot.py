@@ -0,0 +1,112 @@
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+# Loads "Test_Restaurant Browsing.py" by path; the space in its name rules out a plain import
+def load_browsing_module():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Test_Restaurant Browsing.py")
+    spec = importlib.util.spec_from_file_location("restaurant_browsing", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["restaurant_browsing"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+restaurant_browsing = load_browsing_module()
+
+CUISINES = ["Italian", "Japanese", "Fast Food", "Mexican", "Chinese", "Indian", "Thai", "French"]
+LOCATIONS = ["Downtown", "Midtown", "Uptown", "Harbor", "Old Town", "University", "Airport", "Riverside"]
+WORDS = ["Golden", "Garden", "House", "Kitchen", "Palace", "Corner", "Express", "Bistro", "Grill", "Cafe"]
+
+
+def generate_restaurants(count, seed=1):
+    rng = random.Random(seed)
+    for number in range(count):
+        yield {
+            "name": f"{rng.choice(WORDS)} {rng.choice(WORDS)} {number}",
+            "cuisine": rng.choice(CUISINES),
+            "location": rng.choice(LOCATIONS),
+            "rating": round(rng.uniform(1.0, 5.0), 1),
+            "price_range": rng.choice(["$", "$$", "$$$"]),
+            "delivery": rng.random() < 0.6,
+            "lat": rng.uniform(40.55, 40.95),
+            "lon": rng.uniform(-74.1, -73.7),
+        }
+
+
+def private_kib():
+    # Pages only this process has touched; shared page-cache pages of the mapped snapshot are not counted.
+    try:
+        with open("/proc/self/smaps_rollup") as smaps:
+            return sum(int(line.split()[1]) for line in smaps if line.startswith(("Private_Clean", "Private_Dirty")))
+    except OSError:
+        return None
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def worker(path, results):
+    before = private_kib()
+    database, open_seconds = timed(restaurant_browsing.ColumnarRestaurantDatabase.open_snapshot, path, verify=False)
+    browsing = restaurant_browsing.RestaurantBrowsing(database)
+    _, query_seconds = timed(browsing.search_nearby, 40.75, -73.98, 1.0, k=10, cuisine_type="Thai")
+    after = private_kib()
+    results.put((open_seconds, query_seconds, None if before is None else after - before))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start of the restaurant catalog: rebuild vs mapped snapshot.")
+    parser.add_argument("--restaurants", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=4, help="processes opening the same snapshot")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, "catalog.json")
+        snapshot_path = os.path.join(directory, "catalog.bin")
+        with open(json_path, "w") as json_file:
+            json.dump(list(generate_restaurants(args.restaurants)), json_file)
+
+        def rebuild():
+            with open(json_path) as json_file:
+                database = restaurant_browsing.ColumnarRestaurantDatabase(json.load(json_file))
+            database.geo_index, database.name_index
+            return database
+
+        database, rebuild_seconds = timed(rebuild)
+        _, save_seconds = timed(database.save_snapshot, snapshot_path)
+        _, verified_seconds = timed(restaurant_browsing.ColumnarRestaurantDatabase.open_snapshot, snapshot_path)
+        _, open_seconds = timed(restaurant_browsing.ColumnarRestaurantDatabase.open_snapshot, snapshot_path, verify=False)
+        print(f"restaurants: {args.restaurants:,}  snapshot: {os.path.getsize(snapshot_path) / 2**20:,.1f} MiB")
+        print(f"rebuild from JSON with indexes: {rebuild_seconds * 1000:10,.1f} ms")
+        print(f"save_snapshot:                  {save_seconds * 1000:10,.1f} ms")
+        print(f"open_snapshot (crc32 checked):  {verified_seconds * 1000:10,.1f} ms")
+        print(f"open_snapshot (verify=False):   {open_seconds * 1000:10,.1f} ms")
+
+        # Spawned, not forked, so the workers do not inherit the catalog built above.
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        processes = [context.Process(target=worker, args=(snapshot_path, results)) for _ in range(args.workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        for number in range(args.workers):
+            worker_open, worker_query, private = results.get()
+            memory = "n/a" if private is None else f"{private:,} KiB"
+            print(f"worker {number}: open {worker_open * 1000:.2f} ms, first nearby query {worker_query * 1000:.2f} ms, "
+                  f"private memory added {memory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import importlib.util
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Loads "Test_Order Placement.py" by path and registers it, so pool workers can unpickle solve_zone
+def load_order_module():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Test_Order Placement.py")
+    spec = importlib.util.spec_from_file_location("order_placement", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["order_placement"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+order_placement = load_order_module()
+
+
+def build(orders, couriers, restaurants, executor, span_degrees=0.3, seed=1):
+    rng = random.Random(seed)
+    dispatcher = order_placement.DispatchScheduler(executor=executor)
+
+    def point():
+        return 40.6 + rng.random() * span_degrees, -74.1 + rng.random() * span_degrees
+
+    for restaurant in range(restaurants):
+        dispatcher.add_restaurant(restaurant, *point())
+    for number in range(orders):
+        address = f"order-{number}"
+        dispatcher.geocoder.add(address, *point())
+        dispatcher.submit(number, rng.randrange(restaurants), address)
+    for courier in range(couriers):
+        dispatcher.update_courier(courier, *point())
+    return dispatcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time one DispatchScheduler.tick over many active orders.")
+    parser.add_argument("--orders", type=int, nargs="+", default=[5000, 20000, 50000])
+    parser.add_argument("--restaurants", type=int, default=2000)
+    parser.add_argument("--budget", type=float, default=1.0, help="tick time budget in seconds")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("fork")
+    print(f"{'orders':>8} {'workers':>8} {'assigned':>9} {'tick s':>8}")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+        for orders in args.orders:
+            for executor, workers in ((None, 1), (pool, args.workers)):
+                dispatcher = build(orders, orders // 2, args.restaurants, executor)
+                started = time.perf_counter()
+                assignments = dispatcher.tick(time_budget_seconds=args.budget)
+                elapsed = time.perf_counter() - started
+                print(f"{orders:>8} {workers:>8} {len(assignments):>9} {elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
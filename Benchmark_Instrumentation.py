@@ -0,0 +1,74 @@
+import argparse
+import threading
+import time
+
+from instrumentation import Counter, Histogram, MetricsRegistry
+
+
+def per_call_ns(function, calls):
+    started = time.perf_counter_ns()
+    for value in range(calls):
+        function(value)
+    return (time.perf_counter_ns() - started) / calls
+
+
+def threaded_per_call_ns(function, calls, thread_count):
+    barrier = threading.Barrier(thread_count + 1)
+
+    def worker():
+        barrier.wait()
+        for value in range(calls):
+            function(value)
+
+    threads = [threading.Thread(target=worker) for _ in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter_ns()
+    for thread in threads:
+        thread.join()
+    return (time.perf_counter_ns() - started) / (calls * thread_count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-call cost of the metrics hooks on the hot paths.")
+    parser.add_argument("--calls", type=int, default=1_000_000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--budget-ns", type=float, default=1000, help="target cost of one Histogram.record")
+    args = parser.parse_args()
+
+    metrics = MetricsRegistry()
+    histogram = Histogram()
+    counter = Counter(metrics)
+    timer_histogram = metrics.histogram("bench_seconds")
+
+    def timed_block(value):
+        with metrics.timer("bench_seconds"):
+            pass
+
+    cases = [
+        ("Histogram.record", histogram.record),
+        ("Counter.inc", lambda value: counter.inc()),
+        ("MetricsRegistry.timer", timed_block),
+    ]
+    print(f"{'hook':<24} {'threads':>8} {'ns/call':>10}")
+    for name, function in cases:
+        for thread_count in args.threads:
+            if thread_count == 1:
+                cost = per_call_ns(function, args.calls)
+            else:
+                cost = threaded_per_call_ns(function, args.calls // thread_count, thread_count)
+            print(f"{name:<24} {thread_count:>8} {cost:>10,.0f}")
+
+    metrics.enabled = False
+    print(f"{'timer, registry disabled':<24} {1:>8} {per_call_ns(timed_block, args.calls):>10,.0f}")
+    metrics.enabled = True
+
+    record_ns = per_call_ns(histogram.record, args.calls)
+    verdict = "within" if record_ns < args.budget_ns else "OVER"
+    print(f"Histogram.record: {record_ns:,.0f} ns/call, {verdict} the {args.budget_ns:,.0f} ns budget "
+          f"({timer_histogram.count:,} timed blocks recorded)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import importlib.util
+import os
+import random
+import threading
+import time
+
+
+# Loads "Test_Order Placement.py" by path; the space in its name rules out a plain import
+def load_order_module():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Test_Order Placement.py")
+    spec = importlib.util.spec_from_file_location("order_placement", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+order_placement = load_order_module()
+
+
+# Placeholder for the per-item locks when the global-lock baseline already serializes everything
+class _NoLock:
+    def acquire(self):
+        return True
+
+    def release(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+# Same reservation logic, but every operation holds one shared lock: the baseline per-item locks are measured against
+class GlobalLockReservations(order_placement.InventoryReservations):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._global_lock = threading.Lock()
+
+    def _lock_for(self, name):
+        return _NoLock()
+
+    def reserve(self, quantities):
+        with self._global_lock:
+            return super().reserve(quantities)
+
+    def release(self, reservation_id):
+        with self._global_lock:
+            return super().release(reservation_id)
+
+
+def run(reservations_class, thread_count, item_count, operations, items_per_order=3):
+    names = [f"item-{number}" for number in range(item_count)]
+    menu = order_placement.RestaurantMenu(items=[
+        {"id": name, "name": name, "price": "1.00", "stock": thread_count * operations * items_per_order}
+        for name in names
+    ])
+    inventory = reservations_class(menu)
+    barrier = threading.Barrier(thread_count + 1)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        barrier.wait()
+        for operation in range(operations):
+            order = {name: 1 for name in rng.sample(names, min(items_per_order, item_count))}
+            reservation = inventory.reserve(order)
+            # Half the orders pay, half abandon checkout, so both commit and release are exercised.
+            if operation % 2:
+                inventory.commit(reservation["reservation_id"])
+            else:
+                inventory.release(reservation["reservation_id"])
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return thread_count * operations / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-threaded throughput of InventoryReservations.")
+    parser.add_argument("--operations", type=int, default=2000, help="reserve+commit/release cycles per thread")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--items", type=int, nargs="+", default=[3, 32, 1024])
+    args = parser.parse_args()
+
+    print(f"{'items':>6} {'threads':>8} {'per-item locks':>16} {'global lock':>13}  (orders/s)")
+    for item_count in args.items:
+        for thread_count in args.threads:
+            per_item = run(order_placement.InventoryReservations, thread_count, item_count, args.operations)
+            global_lock = run(GlobalLockReservations, thread_count, item_count, args.operations)
+            print(f"{item_count:>6} {thread_count:>8} {per_item:>16,.0f} {global_lock:>13,.0f}")
+
+
+if __name__ == "__main__":
+    main()
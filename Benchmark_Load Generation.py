@@ -0,0 +1,364 @@
+import argparse
+import bisect
+import importlib.util
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Loads one of the feature modules by path; the spaces in their names rule out a plain import
+def load_module(filename, name):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+restaurant_browsing = load_module("Test_Restaurant Browsing.py", "restaurant_browsing")
+user_registration = load_module("Test_User Registration.py", "user_registration")
+order_placement = load_module("Test_Order Placement.py", "order_placement")
+payment_processing = load_module("Test_Payment Processing.py", "payment_processing")
+
+CUISINES = ["Italian", "Japanese", "Fast Food", "Mexican", "Chinese", "Indian", "Thai", "French", "Korean",
+            "Mediterranean", "Vietnamese", "Greek", "Ethiopian", "Spanish", "Turkish", "Brazilian"]
+LOCATIONS = ["Downtown", "Midtown", "Uptown", "Harbor", "Old Town", "University", "Airport", "Riverside",
+             "Chinatown", "Westside", "Eastside", "Northgate", "Southpark", "Hillcrest", "Lakeside", "Market"]
+PRICE_RANGES = ["$", "$$", "$$$", "$$$$"]
+CARD = {"card_number": "4111111111111111", "expiry_date": "12/25", "cvv": "123"}
+
+
+# ZipfSampler Class: rank r is drawn with weight 1 / r**exponent, so a few keys dominate like real traffic
+class ZipfSampler:
+    def __init__(self, population, exponent=1.1, rng=None):
+        self.population = population
+        self.rng = rng or random.Random()
+        self._cumulative = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, len(population) + 1)))
+
+    def __call__(self):
+        point = self.rng.random() * self._cumulative[-1]
+        return self.population[bisect.bisect_right(self._cumulative, point)]
+
+
+def generate_restaurants(count, seed=1):
+    """Yield catalog rows: Zipf-skewed cuisines and neighbourhoods, ratings clustered around 4."""
+    rng = random.Random(seed)
+    cuisine = ZipfSampler(CUISINES, rng=rng)
+    location = ZipfSampler(LOCATIONS, rng=rng)
+    price_range = ZipfSampler(PRICE_RANGES, exponent=0.8, rng=rng)
+    for number in range(count):
+        yield {
+            "name": f"{cuisine()} Kitchen {number}",
+            "cuisine": cuisine(),
+            "location": location(),
+            "rating": round(min(5.0, max(1.0, rng.gauss(4.0, 0.5))), 1),
+            "price_range": price_range(),
+            "delivery": rng.random() < 0.7,
+            "lat": 40.6 + rng.random() * 0.3,
+            "lon": -74.1 + rng.random() * 0.3,
+        }
+
+
+def generate_users(count, hasher, distinct_passwords=16, seed=2):
+    """Yield (email, password, stored hash). Only distinct_passwords hashes are computed and then
+    shared between users, so millions of accounts load in seconds while each verify still pays the
+    real hashing cost."""
+    rng = random.Random(seed)
+    passwords = [f"password-{number:04d}" for number in range(distinct_passwords)]
+    hashes = [hasher.hash(password) for password in passwords]
+    for number in range(count):
+        choice = rng.randrange(distinct_passwords)
+        yield f"user{number}@example.com", passwords[choice], hashes[choice]
+
+
+def generate_menu(count, seed=3):
+    rng = random.Random(seed)
+    return [{"id": f"item-{number}", "name": f"Item {number}", "price": f"{rng.randint(300, 3000) / 100:.2f}"}
+            for number in range(count)]
+
+
+def generate_carts(count, menu, seed=4):
+    """Yield lists of (name, price, quantity): 1-6 lines, popular items far more likely."""
+    rng = random.Random(seed)
+    item = ZipfSampler(menu, rng=rng)
+    for _ in range(count):
+        lines = {}
+        for _ in range(rng.randint(1, 6)):
+            chosen = item()
+            lines[chosen["name"]] = (chosen["name"], chosen["price"], rng.choice((1, 1, 1, 2, 3)))
+        yield list(lines.values())
+
+
+def summarize(latencies_ns, elapsed_seconds=None):
+    ordered = sorted(latencies_ns)
+    count = len(ordered)
+    if not count:
+        return {"count": 0}
+
+    def percentile(fraction):
+        return ordered[min(count - 1, int(fraction * count))] / 1e6
+
+    summary = {
+        "count": count,
+        "mean_ms": sum(ordered) / count / 1e6,
+        "p50_ms": percentile(0.50),
+        "p99_ms": percentile(0.99),
+        "p999_ms": percentile(0.999),
+        "max_ms": ordered[-1] / 1e6,
+    }
+    if elapsed_seconds:
+        summary["throughput"] = count / elapsed_seconds
+    return summary
+
+
+def microbenchmark(operation, inputs, warmup=10):
+    inputs = list(inputs)
+    for value in inputs[:warmup]:
+        operation(value)
+    latencies = []
+    started = time.perf_counter()
+    for value in inputs:
+        begin = time.perf_counter_ns()
+        operation(value)
+        latencies.append(time.perf_counter_ns() - begin)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+# Environment Class: everything a simulated session touches, built once from the generators
+class Environment:
+    def __init__(self, restaurants, users, menu_items, catalog="rows", auth_hasher=None, seed=5):
+        database_class = (restaurant_browsing.ColumnarRestaurantDatabase if catalog == "columnar"
+                          else restaurant_browsing.RestaurantDatabase)
+        started = time.perf_counter()
+        database = database_class([])
+        database.add_restaurants(generate_restaurants(restaurants))
+        self.browsing = restaurant_browsing.RestaurantBrowsing(database)
+        self.load_seconds = {"restaurants": time.perf_counter() - started}
+
+        started = time.perf_counter()
+        self.hasher = auth_hasher or user_registration.PasswordHasher()
+        self.user_store = user_registration.ShardedUserStore()
+        self.users = []
+        for email, password, encoded in generate_users(users, self.hasher):
+            self.users.append((email, password))
+            self.user_store.save_user(email, encoded)
+        self.login = user_registration.UserLogin(self.user_store, hasher=self.hasher)
+        self.load_seconds["users"] = time.perf_counter() - started
+
+        self.menu_items = generate_menu(menu_items)
+        self.menu = order_placement.RestaurantMenu(items=self.menu_items)
+        self.inventory = order_placement.InventoryReservations(self.menu)
+        self.payments = payment_processing.PaymentProcessing()
+        self.rng = random.Random(seed)
+        self.cuisine = ZipfSampler(CUISINES, rng=self.rng)
+        self.location = ZipfSampler(LOCATIONS, rng=self.rng)
+        self.carts = generate_carts(sys.maxsize, self.menu_items, seed=seed)
+        self._lock = threading.Lock()  # generators and the shared Random are not thread-safe
+
+    def next_inputs(self):
+        with self._lock:
+            filters = {
+                "cuisine_type": self.cuisine(),
+                "location": self.location() if self.rng.random() < 0.5 else None,
+                "min_rating": self.rng.choice((None, 3.5, 4.0, 4.5)),
+                "delivery": self.rng.choice((None, True)),
+            }
+            return filters, next(self.carts)
+
+    def session(self, record):
+        """browse -> cart -> checkout -> pay; record(stage, nanoseconds) is called after each stage."""
+        filters, lines = self.next_inputs()
+        begin = time.perf_counter_ns()
+        self.browsing.search_by_filters(**filters)
+        after_browse = time.perf_counter_ns()
+        record("browse", after_browse - begin)
+
+        cart = order_placement.Cart()
+        for name, price, quantity in lines:
+            cart.add_item(name, price, quantity)
+        total = cart.calculate_total()["total"]
+        after_cart = time.perf_counter_ns()
+        record("cart", after_cart - after_browse)
+
+        order = order_placement.OrderPlacement(cart, order_placement.UserProfile("1 Bench St"), self.menu,
+                                               inventory=self.inventory)
+        order.confirm_order(order_placement.PaymentMethod())
+        after_checkout = time.perf_counter_ns()
+        record("checkout", after_checkout - after_cart)
+
+        self.payments.process_payment("credit_card", total, **CARD)
+        record("pay", time.perf_counter_ns() - after_checkout)
+
+
+def run_closed_loop(environment, concurrency, sessions):
+    """concurrency workers each start their next session as soon as the last one finishes."""
+    latencies = {}
+    lock = threading.Lock()
+    remaining = itertools.count()
+
+    def record(stage, nanoseconds):
+        with lock:
+            latencies.setdefault(stage, []).append(nanoseconds)
+
+    def worker():
+        while next(remaining) < sessions:
+            begin = time.perf_counter_ns()
+            environment.session(record)
+            record("session", time.perf_counter_ns() - begin)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {stage: summarize(values, elapsed) for stage, values in latencies.items()}
+
+
+def run_open_loop(environment, rate, duration_seconds, workers, seed=6):
+    """Sessions arrive as a Poisson process at `rate` per second regardless of how the system keeps up.
+
+    Session latency is measured from the scheduled arrival, not from when a worker picked it up,
+    so queueing delay shows up in the tail instead of being hidden (no coordinated omission).
+    """
+    rng = random.Random(seed)
+    latencies = {}
+    lock = threading.Lock()
+
+    def record(stage, nanoseconds):
+        with lock:
+            latencies.setdefault(stage, []).append(nanoseconds)
+
+    def arrival(scheduled_ns):
+        environment.session(record)
+        record("session", time.perf_counter_ns() - scheduled_ns)
+
+    started_ns = time.perf_counter_ns()
+    end_ns = started_ns + int(duration_seconds * 1e9)
+    next_ns = started_ns
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while next_ns < end_ns:
+            delay = (next_ns - time.perf_counter_ns()) / 1e9
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(arrival, next_ns)
+            next_ns += int(rng.expovariate(rate) * 1e9)
+    elapsed = (time.perf_counter_ns() - started_ns) / 1e9
+    results = {stage: summarize(values, elapsed) for stage, values in latencies.items()}
+    results["session"]["offered_rate"] = rate
+    return results
+
+
+def run_microbenchmarks(environment, samples, auth_samples):
+    rng = random.Random(7)
+    results = {}
+    filters = [environment.next_inputs()[0] for _ in range(samples)]
+    results["search_by_filters"] = microbenchmark(lambda kwargs: environment.browsing.search_by_filters(**kwargs),
+                                                  filters)
+
+    carts = []
+    for lines in itertools.islice(environment.carts, samples):
+        cart = order_placement.Cart()
+        for name, price, quantity in lines:
+            cart.add_item(name, price, quantity)
+        carts.append(cart)
+    results["cart_calculate_total"] = microbenchmark(lambda cart: cart.calculate_total(), carts)
+
+    credentials = [rng.choice(environment.users) for _ in range(auth_samples)]
+    results["user_authenticate"] = microbenchmark(lambda pair: environment.login.authenticate(*pair), credentials,
+                                                  warmup=1)
+
+    amounts = [rng.randint(100, 20000) / 100 for _ in range(samples)]
+    results["process_payment"] = microbenchmark(
+        lambda amount: environment.payments.process_payment("credit_card", amount, **CARD), amounts)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every p99 that grew, or throughput that fell, by more than tolerance."""
+    regressions = []
+    for group, entries in results.items():
+        for name, current in entries.items():
+            previous = baseline.get(group, {}).get(name)
+            if not previous:
+                continue
+            if "p99_ms" in previous and current.get("p99_ms", 0) > previous["p99_ms"] * (1 + tolerance):
+                regressions.append(f"{group}/{name}: p99 {previous['p99_ms']:.3f}ms -> {current['p99_ms']:.3f}ms")
+            if "throughput" in previous and current.get("throughput", 0) < previous["throughput"] * (1 - tolerance):
+                regressions.append(f"{group}/{name}: throughput {previous['throughput']:,.0f}/s -> "
+                                   f"{current['throughput']:,.0f}/s")
+    return regressions
+
+
+def print_table(title, entries):
+    print(f"\n{title}")
+    print(f"{'operation':>22} {'count':>8} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'p999 ms':>9}")
+    for name, summary in entries.items():
+        print(f"{name:>22} {summary['count']:>8} {summary.get('throughput', 0):>10,.0f} {summary['p50_ms']:>9.3f} "
+              f"{summary['p99_ms']:>9.3f} {summary['p999_ms']:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic load and microbenchmarks across all four modules.")
+    parser.add_argument("--restaurants", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--menu-items", type=int, default=500)
+    parser.add_argument("--catalog", choices=("rows", "columnar"), default="rows")
+    parser.add_argument("--samples", type=int, default=2000, help="calls per microbenchmark")
+    parser.add_argument("--auth-samples", type=int, default=20, help="authenticate calls (each pays a real hash)")
+    parser.add_argument("--sessions", type=int, default=2000, help="closed-loop sessions")
+    parser.add_argument("--concurrency", type=int, default=8, help="closed-loop workers")
+    parser.add_argument("--rate", type=float, default=200.0, help="open-loop arrivals per second")
+    parser.add_argument("--duration", type=float, default=5.0, help="open-loop seconds")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+    order_placement.configure_order_ids(0)  # a single benchmark process
+
+    environment = Environment(args.restaurants, args.users, args.menu_items, catalog=args.catalog)
+    print(f"loaded {args.restaurants:,} restaurants in {environment.load_seconds['restaurants']:.1f}s, "
+          f"{args.users:,} users in {environment.load_seconds['users']:.1f}s")
+
+    results = {
+        "micro": run_microbenchmarks(environment, args.samples, args.auth_samples),
+        "closed_loop": run_closed_loop(environment, args.concurrency, args.sessions),
+        "open_loop": run_open_loop(environment, args.rate, args.duration, args.concurrency),
+    }
+    for group, entries in results.items():
+        print_table(group, entries)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "arguments": vars(args),
+            "load_seconds": environment.load_seconds,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    print(f"\nwrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
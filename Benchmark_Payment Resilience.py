@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import importlib.util
+import os
+import time
+
+
+# Loads "Test_Payment Processing.py" by path; the space in its name rules out a plain import
+def load_payment_module():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Test_Payment Processing.py")
+    spec = importlib.util.spec_from_file_location("payment_processing", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+payment_processing = load_payment_module()
+
+CARD = {"card_number": "4111111111111111", "expiry_date": "12/25", "cvv": "123"}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def run(charges, concurrency, timeout, attempts, faults):
+    async with payment_processing.FaultyGatewayServer(latency_seconds=0.002, seed=1, **faults) as server:
+        client = server.client(timeout=timeout, max_connections=concurrency,
+                               breaker=payment_processing.CircuitBreaker(failure_threshold=50, reset_timeout=0.5))
+        processing = payment_processing.PaymentProcessing(
+            gateways={"credit_card": client},
+            retry_policy=payment_processing.RetryPolicy(attempts=attempts, base_delay=0.01, max_delay=0.2),
+        )
+        slots = asyncio.Semaphore(concurrency)
+        latencies, failures = [], 0
+
+        async def charge(number):
+            nonlocal failures
+            async with slots:
+                started = time.perf_counter()
+                try:
+                    await processing.process_payment_async("credit_card", 10.00, idempotency_key=f"order-{number}",
+                                                           **CARD)
+                except payment_processing.GatewayError:
+                    failures += 1
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*[charge(number) for number in range(charges)])
+        await client.close()
+    latencies.sort()
+    return {
+        "success": 1 - failures / charges,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "max": latencies[-1] * 1000,
+        "charged": len(server.charges),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tail latency and success rate of gateway charges under injected faults.")
+    parser.add_argument("--charges", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--timeout-ms", type=float, default=50.0)
+    parser.add_argument("--hang-rate", type=float, default=0.02)
+    parser.add_argument("--drop-rate", type=float, default=0.02)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    args = parser.parse_args()
+    faults = {"hang_rate": args.hang_rate, "hang_seconds": 1.0, "drop_rate": args.drop_rate,
+              "slow_rate": args.slow_rate, "slow_seconds": 0.03}
+
+    print(f"{'attempts':>8} {'success':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'charged':>8}")
+    for attempts in (1, 2, 4):
+        stats = asyncio.run(run(args.charges, args.concurrency, args.timeout_ms / 1000, attempts, faults))
+        print(f"{attempts:>8} {stats['success']:>8.1%} {stats['p50']:>8.1f} {stats['p99']:>8.1f} "
+              f"{stats['max']:>8.1f} {stats['charged']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import threading
+import unittest
+
+from instrumentation import Counter, Histogram, MetricsRegistry, SamplingProfiler
+
+
+# Unit tests for Histogram
+class TestHistogram(unittest.TestCase):
+    def test_small_values_are_exact_and_large_ones_within_precision(self):
+        histogram = Histogram()
+        for value in range(1, 32):
+            histogram.record(value)
+        self.assertEqual(histogram.percentile(0.5), 16)
+        histogram.reset()
+        for value in range(1, 100001):
+            histogram.record(value * 1000)
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 100000)
+        for quantile in (0.5, 0.9, 0.99, 0.999):
+            self.assertAlmostEqual(summary[quantile] / (quantile * 100000 * 1000), 1, delta=0.04)
+
+    def test_threads_record_without_losing_updates(self):
+        histogram = Histogram()
+        counter = Counter()
+
+        def work():
+            for value in range(20000):
+                histogram.record(value)
+                counter.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(histogram.count, 160000)
+        self.assertEqual(counter.value, 160000)
+        self.assertEqual(histogram.summary()["sum"], 8 * sum(range(20000)))
+
+
+# Unit tests for MetricsRegistry
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+
+    def test_timed_decorator_and_timer(self):
+        @self.metrics.timed("work_seconds", kind="decorated")
+        def work():
+            return 42
+
+        self.assertEqual(work(), 42)
+        with self.metrics.timer("work_seconds", kind="block"):
+            pass
+        self.assertEqual(self.metrics.histogram("work_seconds", kind="decorated").count, 1)
+        self.assertEqual(self.metrics.histogram("work_seconds", kind="block").count, 1)
+
+    def test_switching_off_at_runtime(self):
+        @self.metrics.timed("work_seconds")
+        def work():
+            pass
+
+        counter = self.metrics.counter("events_total")
+        self.metrics.enabled = False
+        work()
+        counter.inc()
+        with self.metrics.span(1, "stage"):
+            pass
+        self.metrics.enabled = True
+        work()
+        counter.inc()
+        self.assertEqual((self.metrics.histogram("work_seconds").count, counter.value), (1, 1))
+        self.assertEqual(list(self.metrics.spans), [])
+
+    def test_spans_group_by_trace(self):
+        for trace_id in (1, 2):
+            for stage in ("validate", "price", "pay"):
+                with self.metrics.span(trace_id, stage):
+                    pass
+        self.assertEqual([span[1] for span in self.metrics.trace(2)], ["validate", "price", "pay"])
+        self.assertEqual(self.metrics.histogram("span_duration_seconds", stage="pay").count, 2)
+
+    def test_prometheus_text(self):
+        self.metrics.counter("payments_total", method="paypal", outcome="success").inc(3)
+        self.metrics.histogram("payment_seconds", method="paypal").record(2_000_000)
+        text = self.metrics.prometheus_text(quantiles=(0.5,))
+        self.assertEqual(text.splitlines(), [
+            "# TYPE payments_total counter",
+            'payments_total{method="paypal",outcome="success"} 3',
+            "# TYPE payment_seconds summary",
+            'payment_seconds{method="paypal",quantile="0.5"} 0.001998848',
+            'payment_seconds_sum{method="paypal"} 0.002000000',
+            'payment_seconds_count{method="paypal"} 1',
+        ])
+
+
+# Unit tests for SamplingProfiler
+class TestSamplingProfiler(unittest.TestCase):
+    def test_samples_busy_threads(self):
+        stop = threading.Event()
+
+        def spin_in_hot_loop():
+            while not stop.is_set():
+                sum(range(1000))
+
+        worker = threading.Thread(target=spin_in_hot_loop)
+        worker.start()
+        try:
+            collapsed = MetricsRegistry().profile(0.2, interval=0.002)
+        finally:
+            stop.set()
+            worker.join()
+        self.assertIn("spin_in_hot_loop", collapsed)
+        self.assertRegex(collapsed.splitlines()[0], r" \d+$")
+        self.assertEqual(SamplingProfiler().collapsed(), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
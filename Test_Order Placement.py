@@ -1,71 +1,378 @@
+import asyncio
+import bisect
+import heapq
+import itertools
+import json
+import math
+import mmap
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
 import unittest
+import weakref
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, ROUND_HALF_UP
 from unittest import mock
 
+from instrumentation import METRICS
+from money import CENT, from_cents, to_cents
+
+
+def _divide_half_up(numerator, denominator):
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+# Pricing rules per region. Rates and amounts are strings so they parse exactly.
+REGION_RULES = {
+    "default": {
+        "tax_rate": "0.10",
+        "delivery_fee": {"flat": "5.00"},
+    },
+}
+
+
+# PriceEvaluator Class: one region's rules compiled into integer parameters
+class PriceEvaluator:
+    PPM = 1000000  # rates are stored as parts per million
+
+    def __init__(self, rules):
+        self.default_tax_ppm = self._ppm(rules.get("tax_rate", "0"))
+        self.tax_table_ppm = {category: self._ppm(rate) for category, rate in rules.get("tax_table", {}).items()}
+        self.delivery_fee = self._compile_delivery_fee(rules.get("delivery_fee", {"flat": "0"}))
+        self.promotions = {code.upper(): self._compile_promotion(promotion)
+                           for code, promotion in rules.get("promo_codes", {}).items()}
+
+    def _ppm(self, rate):
+        return int(Decimal(rate) * self.PPM)
+
+    def _compile_delivery_fee(self, rule):
+        if "flat" in rule:
+            flat_cents = to_cents(rule["flat"])
+            return lambda subtotal_cents, distance_km: flat_cents
+        if "per_km" in rule:
+            base_cents, per_km_cents = to_cents(rule.get("base", "0")), to_cents(rule["per_km"])
+            free_meters = int(Decimal(str(rule.get("free_km", 0))) * 1000)
+
+            def distance_fee(subtotal_cents, distance_km):
+                if distance_km is None:
+                    raise ValueError("This region prices delivery by distance; distance_km is required")
+                extra_meters = max(0, round(distance_km * 1000) - free_meters)
+                return base_cents + _divide_half_up(per_km_cents * extra_meters, 1000)
+            return distance_fee
+        if "by_subtotal" in rule:
+            # [[minimum subtotal, fee], ...]: the tier with the largest minimum not above the subtotal wins.
+            tiers = sorted((to_cents(minimum), to_cents(fee)) for minimum, fee in rule["by_subtotal"])
+            minimums = [minimum for minimum, _ in tiers]
+
+            def size_fee(subtotal_cents, distance_km):
+                position = bisect.bisect_right(minimums, subtotal_cents) - 1
+                return tiers[position][1] if position >= 0 else tiers[0][1]
+            return size_fee
+        raise ValueError(f"Unknown delivery fee rule: {rule}")
+
+    def _compile_promotion(self, promotion):
+        return {
+            "percent_off_ppm": self._ppm(promotion.get("percent_off", "0")) // 100,
+            "amount_off_cents": to_cents(promotion.get("amount_off", "0")),
+            "min_subtotal_cents": to_cents(promotion.get("min_subtotal", "0")),
+            "free_delivery": bool(promotion.get("free_delivery", False)),
+        }
+
+    def price(self, category_subtotals, distance_km=None, promo_code=None):
+        """Price a cart given {category: subtotal in cents}; every returned amount is in cents."""
+        subtotal = sum(category_subtotals.values())
+        # Tax is summed across categories at full precision and rounded once.
+        tax_numerator = sum(cents * self.tax_table_ppm.get(category, self.default_tax_ppm)
+                            for category, cents in category_subtotals.items())
+        delivery_fee = self.delivery_fee(subtotal, distance_km)
+        discount = 0
+        if promo_code:
+            promotion = self.promotions.get(promo_code.upper())
+            if promotion is None:
+                raise ValueError(f"Unknown promo code: {promo_code}")
+            if subtotal >= promotion["min_subtotal_cents"]:
+                discount = _divide_half_up(subtotal * promotion["percent_off_ppm"], self.PPM)
+                discount = min(subtotal, discount + promotion["amount_off_cents"])
+                if promotion["free_delivery"]:
+                    delivery_fee = 0
+        if subtotal:
+            # Discounts reduce every category proportionally, so tax shrinks by the same ratio.
+            tax = _divide_half_up(tax_numerator * (subtotal - discount), subtotal * self.PPM)
+        else:
+            tax = 0
+        return {
+            "subtotal": subtotal,
+            "discount": discount,
+            "tax": tax,
+            "delivery_fee": delivery_fee,
+            "total": subtotal - discount + tax + delivery_fee,
+        }
+
+
+# PricingEngine Class: compiles each region's rules once and reuses the evaluator
+class PricingEngine:
+    def __init__(self, region_rules=None):
+        self.region_rules = region_rules if region_rules is not None else REGION_RULES
+        self._evaluators = {}
+
+    def evaluator(self, region):
+        evaluator = self._evaluators.get(region)
+        if evaluator is None:
+            if region not in self.region_rules:
+                raise ValueError(f"No pricing rules for region {region}")
+            evaluator = self._evaluators[region] = PriceEvaluator(self.region_rules[region])
+        return evaluator
+
+    def price_carts(self, carts, region="default", promo_code=None, distance_km=None):
+        """Batch pricing: one evaluator lookup for the whole batch; amounts are returned in cents."""
+        evaluator = self.evaluator(region)
+        return [evaluator.price(cart.category_subtotals(), distance_km=distance_km, promo_code=promo_code)
+                for cart in carts]
+
+
+DEFAULT_PRICING = PricingEngine()
+
+
 # CartItem Class
 class CartItem:
-    def __init__(self, name, price, quantity):
+    __slots__ = ("name", "price_cents", "quantity", "category", "_cart")  # no per-item __dict__; carts can hold many items
+
+    def __init__(self, name, price, quantity, category=None):
         self.name = name
-        self.price = price
+        self.price_cents = to_cents(price)
         self.quantity = quantity
+        self.category = category
+        self._cart = None  # the Cart holding this item, which keeps running subtotals of it
+
+    @property
+    def price(self):
+        return from_cents(self.price_cents)
 
     def update_quantity(self, new_quantity):
-        self.quantity = new_quantity
+        if self._cart is not None:
+            self._cart._set_quantity(self, new_quantity)
+        else:
+            self.quantity = new_quantity
+
+    def get_subtotal_cents(self):
+        return self.price_cents * self.quantity
 
     def get_subtotal(self):
-        return self.price * self.quantity
+        return from_cents(self.get_subtotal_cents())
 
 
 # Cart Class
 class Cart:
-    def __init__(self):
-        self.items = []
-
-    def add_item(self, name, price, quantity):
-        for item in self.items:
-            if item.name == name:
-                item.update_quantity(item.quantity + quantity)
-                return f"Updated {name} quantity to {item.quantity}"
-        new_item = CartItem(name, price, quantity)
-        self.items.append(new_item)
+    def __init__(self, pricing=None, region="default"):
+        self.pricing = pricing or DEFAULT_PRICING
+        self.region = region
+        self._items = {}  # name -> CartItem, in the order items were first added
+        self._subtotals = {}  # category -> running subtotal in cents, adjusted on every mutation
+        self.version = 0  # bumped on every change, so a validated cart can be recognised cheaply
+
+    @property
+    def items(self):
+        # A live view: truthiness, len() and iteration work without copying the cart.
+        return self._items.values()
+
+    def add_item(self, name, price, quantity, category=None):
+        item = self._items.get(name)
+        if item is not None:
+            self._set_quantity(item, item.quantity + quantity)
+            return f"Updated {name} quantity to {item.quantity}"
+        new_item = CartItem(name, price, quantity, category)
+        new_item._cart = self
+        self._items[name] = new_item
+        self._adjust(new_item.category, new_item.get_subtotal_cents())
         return f"Added {name} to cart"
 
     def remove_item(self, name):
-        self.items = [item for item in self.items if item.name != name]
+        item = self._items.pop(name, None)
+        if item is not None:
+            item._cart = None
+            self._adjust(item.category, -item.get_subtotal_cents())
         return f"Removed {name} from cart"
 
     def update_item_quantity(self, name, new_quantity):
-        for item in self.items:
-            if item.name == name:
-                item.update_quantity(new_quantity)
-                return f"Updated {name} quantity to {new_quantity}"
-        return f"{name} not found in cart"
-
-    def calculate_total(self):
-        subtotal = sum(item.get_subtotal() for item in self.items)
-        tax = subtotal * 0.10  # Assume 10% tax rate.
-        delivery_fee = 5.00  # Flat delivery fee.
-        total = subtotal + tax + delivery_fee
-        return {"subtotal": subtotal, "tax": tax, "delivery_fee": delivery_fee, "total": total}
+        item = self._items.get(name)
+        if item is None:
+            return f"{name} not found in cart"
+        self._set_quantity(item, new_quantity)
+        return f"Updated {name} quantity to {new_quantity}"
+
+    def _set_quantity(self, item, new_quantity):
+        # Every quantity change, including CartItem.update_quantity, lands here so the running subtotals stay correct.
+        before = item.get_subtotal_cents()
+        item.quantity = new_quantity
+        self._adjust(item.category, item.get_subtotal_cents() - before)
+
+    def _adjust(self, category, delta_cents):
+        self._subtotals[category] = self._subtotals.get(category, 0) + delta_cents
+        self.version += 1
+
+    def category_subtotals(self):
+        return self._subtotals
+
+    def calculate_total_cents(self, promo_code=None, distance_km=None):
+        return self.pricing.evaluator(self.region).price(self._subtotals, distance_km=distance_km, promo_code=promo_code)
+
+    def calculate_total(self, promo_code=None, distance_km=None):
+        totals = self.calculate_total_cents(promo_code=promo_code, distance_km=distance_km)
+        result = {key: from_cents(totals[key]) for key in ("subtotal", "tax", "delivery_fee", "total")}
+        if totals["discount"]:
+            result["discount"] = from_cents(totals["discount"])
+        return result
 
     def view_cart(self):
         return [{"name": item.name, "quantity": item.quantity, "subtotal": item.get_subtotal()} for item in self.items]
 
 
+# SnowflakeIdGenerator Class: collision-free, time-ordered order ids without a shared counter
+class SnowflakeIdGenerator:
+    """64-bit ids laid out as | 41 bits ms since epoch | 10 bits worker | 12 bits sequence |.
+
+    Every process (or node) must be assigned its own worker_id; ids then never collide and need no
+    coordination. A forked child inherits its parent's worker_id, so after fork every generator refuses to
+    issue ids until assign_worker() gives it a new one.
+    Within one generator ids strictly increase: up to 4096 per millisecond, after which it moves on to
+    the next millisecond early. If the wall clock steps backwards it keeps counting from the last timestamp.
+    """
+
+    WORKER_BITS = 10
+    SEQUENCE_BITS = 12
+    MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+    MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+    EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+
+    def __init__(self, worker_id, clock=time.time, epoch_ms=EPOCH_MS):
+        self.clock = clock
+        self.epoch_ms = epoch_ms
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self.assign_worker(worker_id)
+        _GENERATORS.add(self)
+
+    def assign_worker(self, worker_id):
+        if not 0 <= worker_id <= self.MAX_WORKER_ID:
+            raise ValueError(f"worker_id must be between 0 and {self.MAX_WORKER_ID}")
+        self.worker_id = worker_id
+
+    def _now_ms(self):
+        return int(self.clock() * 1000) - self.epoch_ms
+
+    def next_id(self):
+        if self.worker_id is None:
+            raise RuntimeError("This process was forked; call assign_worker() before generating ids")
+        with self._lock:
+            now = max(self._now_ms(), self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & self.MAX_SEQUENCE
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond; borrow the next one instead of sleeping.
+                    now += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return (now << (self.WORKER_BITS + self.SEQUENCE_BITS)) | (self.worker_id << self.SEQUENCE_BITS) | self._sequence
+
+    def next_order_id(self):
+        return f"ORD{self.next_id()}"
+
+    @classmethod
+    def parse(cls, snowflake):
+        """Split an id (int or "ORD..." string) into (timestamp_ms, worker_id, sequence)."""
+        if isinstance(snowflake, str):
+            snowflake = int(snowflake[3:] if snowflake.startswith("ORD") else snowflake)
+        sequence = snowflake & cls.MAX_SEQUENCE
+        worker_id = (snowflake >> cls.SEQUENCE_BITS) & cls.MAX_WORKER_ID
+        timestamp_ms = (snowflake >> (cls.WORKER_BITS + cls.SEQUENCE_BITS)) + cls.EPOCH_MS
+        return timestamp_ms, worker_id, sequence
+
+
+_GENERATORS = weakref.WeakSet()
+
+
+def _forget_worker_ids():
+    # The child of a fork shares its parent's worker ids; it has to be given its own before issuing ids.
+    # The lock is replaced too, in case another thread held it at the moment of the fork.
+    for generator in list(_GENERATORS):
+        generator.worker_id = None
+        generator._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_worker_ids)
+
+# Default generator for orders placed without an id_generator; built on first use, never with a guessed worker id
+_order_ids = None
+
+
+def configure_order_ids(worker_id):
+    """Give this process its worker id; call at startup, and again in each forked child."""
+    global _order_ids
+    if _order_ids is None:
+        _order_ids = SnowflakeIdGenerator(worker_id)
+    else:
+        _order_ids.assign_worker(worker_id)
+    return _order_ids
+
+
+def default_order_ids():
+    """The process-wide generator, configured from ORDER_WORKER_ID unless configure_order_ids() was called."""
+    if _order_ids is None:
+        worker_id = os.environ.get("ORDER_WORKER_ID")
+        if worker_id is None:
+            raise RuntimeError("Set ORDER_WORKER_ID or call configure_order_ids() before placing orders")
+        configure_order_ids(int(worker_id))
+    return _order_ids
+
+
+# Metrics: counters are looked up once here so the hot path only pays for inc()
+TRACE_IDS = itertools.count(1)
+ORDER_OUTCOMES = {outcome: METRICS.counter("orders_total", outcome=outcome)
+                  for outcome in ("confirmed", "payment_failed", "validation_failed", "unavailable")}
+REFUND_FAILURES = METRICS.counter("order_refund_failures_total")
+VALIDATION_FAILURES = {reason: METRICS.counter("order_validation_failures_total", reason=reason)
+                       for reason in ("empty_cart", "item_unavailable")}
+
+
 # OrderPlacement Class
 class OrderPlacement:
-    def __init__(self, cart, user_profile, restaurant_menu):
+    def __init__(self, cart, user_profile, restaurant_menu, inventory=None, id_generator=None, eta_service=None,
+                 dispatcher=None, order_store=None):
         self.cart = cart
         self.user_profile = user_profile
         self.restaurant_menu = restaurant_menu
+        self.inventory = inventory  # optional InventoryReservations holding stock between validation and payment
+        self.id_generator = id_generator  # defaults to default_order_ids() when the first id is issued
+        self.eta_service = eta_service  # optional EtaService; without it orders get the flat default estimate
+        self.dispatcher = dispatcher  # optional DispatchScheduler that confirmed orders are queued on
+        self.order_store = order_store  # optional OrderStore recording the order's lifecycle events
+        if order_store is not None and eta_service is not None:
+            order_store.subscribe(eta_service.on_order_event)  # delivered/cancelled orders stop being tracked
+        self._validated_versions = None  # (menu version, cart version) of the last successful validation
+        self.trace_id = next(TRACE_IDS)  # groups this order's validate/price/pay spans in METRICS
 
     def validate_order(self):
         if not self.cart.items:
+            VALIDATION_FAILURES["empty_cart"].inc()
             return {"success": False, "message": "Cart is empty"}
-        for item in self.cart.items:
-            if not self.restaurant_menu.is_item_available(item.name):
-                return {"success": False, "message": f"{item.name} is not available"}
+        unavailable = self.restaurant_menu.check_availability({item.name: item.quantity for item in self.cart.items})
+        if unavailable:
+            VALIDATION_FAILURES["item_unavailable"].inc()
+            return {"success": False, "message": f"{unavailable[0]} is not available"}
+        self._validated_versions = (self.restaurant_menu.version, self.cart.version)
         return {"success": True, "message": "Order is valid"}
 
+    def is_validation_current(self):
+        # Neither the menu nor the cart changed since the last successful validation.
+        return self._validated_versions == (self.restaurant_menu.version, self.cart.version)
+
     def proceed_to_checkout(self):
         total_info = self.cart.calculate_total()
         return {
@@ -74,41 +381,1199 @@ class OrderPlacement:
             "delivery_address": self.user_profile.delivery_address,
         }
 
-    def confirm_order(self, payment_method):
-        if not self.validate_order()["success"]:
+    def prepare_order(self):
+        """Validate (unless still current) and hold stock; returns the reservation result or a failure."""
+        if not self.is_validation_current() and not self.validate_order()["success"]:
+            ORDER_OUTCOMES["validation_failed"].inc()
             return {"success": False, "message": "Order validation failed"}
-        payment_success = payment_method.process_payment(self.cart.calculate_total()["total"])
+        if self.inventory is None:
+            return {"success": True, "reservation_id": None}
+        reservation = self.inventory.reserve({item.name: item.quantity for item in self.cart.items})
+        if not reservation["success"]:
+            ORDER_OUTCOMES["unavailable"].inc()
+        return reservation
+
+    def settle_order(self, reservation_id, payment_success, refund=None):
+        """Commit or release the stock hold and report the order's outcome.
+
+        If the hold expired (and was swept) during a slow payment, the stock is reserved again. When it has
+        sold out in the meantime the paid order cannot be filled: refund() is called and the order fails,
+        reporting under "refunded" whether the refund went through.
+        """
+        if reservation_id is not None:
+            if not payment_success:
+                self.inventory.release(reservation_id)
+            elif not self.inventory.commit(reservation_id) and not self._reserve_again():
+                refunded = refund is not None and bool(refund())
+                ORDER_OUTCOMES["unavailable"].inc()
+                return {"success": False, "message": "Items sold out before the order was confirmed",
+                        "refunded": refunded}
+        ORDER_OUTCOMES["confirmed" if payment_success else "payment_failed"].inc()
         if payment_success:
+            order_id = (self.id_generator or default_order_ids()).next_order_id()
+            if self.order_store is not None:
+                self.order_store.record("created", order_id, self.user_profile.user_id,
+                                        self.restaurant_menu.restaurant_id, total=str(self.cart.calculate_total()["total"]))
+                self.order_store.record("paid", order_id)
+            if self.dispatcher is not None and self.restaurant_menu.restaurant_id is not None:
+                self.dispatcher.submit(order_id, self.restaurant_menu.restaurant_id, self.user_profile.delivery_address)
             return {
                 "success": True,
                 "message": "Order confirmed",
-                "order_id": "ORD123456",
-                "estimated_delivery": "45 minutes"
+                "order_id": order_id,
+                "estimated_delivery": f"{self.estimate_delivery_minutes(order_id)} minutes"
             }
         return {"success": False, "message": "Payment failed"}
 
+    def _reserve_again(self):
+        reservation = self.inventory.reserve({item.name: item.quantity for item in self.cart.items})
+        return reservation["success"] and self.inventory.commit(reservation["reservation_id"])
+
+    def estimate_delivery_minutes(self, order_id=None):
+        restaurant_id = self.restaurant_menu.restaurant_id
+        if self.eta_service is None or restaurant_id is None:
+            return DEFAULT_ETA_MINUTES
+        address = self.user_profile.delivery_address
+        if order_id is not None:
+            minutes = self.eta_service.track(order_id, restaurant_id, address)
+        else:
+            minutes = self.eta_service.estimate(restaurant_id, address)
+        return DEFAULT_ETA_MINUTES if minutes is None else minutes
+
+    @METRICS.timed("order_confirm_seconds")
+    def confirm_order(self, payment_method):
+        with METRICS.span(self.trace_id, "validate"):
+            prepared = self.prepare_order()
+        if not prepared["success"]:
+            return prepared
+        payment_success = False
+        try:
+            with METRICS.span(self.trace_id, "price"):
+                total = self.cart.calculate_total()["total"]
+            with METRICS.span(self.trace_id, "pay"):
+                payment_success = payment_method.process_payment(total)
+        finally:
+            result = self.settle_order(prepared["reservation_id"], payment_success,
+                                       refund=lambda: refund_payment(payment_method, total))
+        return result
+
+    async def confirm_order_async(self, payment_method):
+        with METRICS.span(self.trace_id, "validate"):
+            prepared = self.prepare_order()
+        if not prepared["success"]:
+            return prepared
+        payment_success = False
+        try:
+            with METRICS.span(self.trace_id, "price"):
+                total = self.cart.calculate_total()["total"]
+            with METRICS.span(self.trace_id, "pay"):
+                payment_success = await pay_async(payment_method, total)
+        finally:
+            result = self.settle_order(prepared["reservation_id"], payment_success,
+                                       refund=lambda: refund_payment(payment_method, total))
+        return result
+
 
 # PaymentMethod Class
 class PaymentMethod:
     def process_payment(self, amount):
-        if amount > 0:
+        # Amounts arrive as Decimal dollars; comparing whole cents avoids float rounding.
+        if to_cents(amount) > 0:
             return True
         return False
 
+    def refund(self, amount):
+        return to_cents(amount) > 0
+
+
+async def pay_async(payment_method, amount):
+    # Gateways with a native coroutine are awaited; blocking ones run on the default thread pool.
+    process_payment_async = getattr(payment_method, "process_payment_async", None)
+    if process_payment_async is not None:
+        return await process_payment_async(amount)
+    return await asyncio.get_running_loop().run_in_executor(None, payment_method.process_payment, amount)
+
+
+def refund_payment(payment_method, amount):
+    """Refund a captured charge; False, and counted in REFUND_FAILURES for follow-up, when it did not go through.
+
+    The customer has already paid at this point, so a method without refund() or one that raises is
+    reported rather than allowed to abort the order's settlement.
+    """
+    refund = getattr(payment_method, "refund", None)
+    try:
+        refunded = refund is not None and bool(refund(amount))
+    except Exception:
+        refunded = False
+    if not refunded:
+        REFUND_FAILURES.inc()
+    return refunded
+
+
+# StubPaymentGateway Class: local stand-in for a remote gateway with network latency
+class StubPaymentGateway(PaymentMethod):
+    def __init__(self, latency_seconds=0.01):
+        self.latency_seconds = latency_seconds
+        self.calls = 0
+        self.refunds = 0
+
+    def process_payment(self, amount):
+        self.calls += 1
+        time.sleep(self.latency_seconds)
+        return super().process_payment(amount)
+
+    async def process_payment_async(self, amount):
+        self.calls += 1
+        await asyncio.sleep(self.latency_seconds)
+        return super().process_payment(amount)
+
+    def refund(self, amount):
+        self.refunds += 1
+        return super().refund(amount)
+
 
 # UserProfile Class (for simulating the user's details)
 class UserProfile:
-    def __init__(self, delivery_address):
+    def __init__(self, delivery_address, user_id=None):
         self.delivery_address = delivery_address
+        self.user_id = user_id
+
 
+# MenuItem Class
+class MenuItem:
+    __slots__ = ("item_id", "name", "price_cents", "stock")
 
-# RestaurantMenu Class (for simulating available menu items)
+    def __init__(self, item_id, name, price=None, stock=None):
+        self.item_id = item_id
+        self.name = name
+        self.price_cents = to_cents(price) if price is not None else None
+        self.stock = stock  # None means unlimited
+
+
+# RestaurantMenu Class: menu items indexed by id and name, with a version bumped on every change
 class RestaurantMenu:
-    def __init__(self, available_items):
-        self.available_items = available_items
+    def __init__(self, available_items=None, items=None, restaurant_id=None):
+        self.restaurant_id = restaurant_id
+        self._by_id = {}
+        self._by_name = {}
+        self.version = 0
+        for name in available_items or []:
+            self.add_item(name, name)
+        for item in items or []:
+            self.add_item(item["id"], item["name"], price=item.get("price"), stock=item.get("stock"))
+
+    @property
+    def available_items(self):
+        return AvailableItems(self, [name for name, item in self._by_name.items() if item.stock is None or item.stock > 0])
+
+    @available_items.setter
+    def available_items(self, names):
+        # Kept from when the menu was a plain list of names: the listed names become unlimited-stock items.
+        names = list(names)
+        for name in set(self._by_name) - set(names):
+            self.remove_item(self._by_name[name].item_id)
+        for name in names:
+            if name not in self._by_name:
+                self.add_item(name, name)
+
+    def add_item(self, item_id, name, price=None, stock=None):
+        item = MenuItem(item_id, name, price, stock)
+        self._by_id[item_id] = item
+        self._by_name[name] = item
+        self.version += 1
+        return item
+
+    def remove_item(self, item_id):
+        item = self._by_id.pop(item_id)
+        del self._by_name[item.name]
+        self.version += 1
+        return item
+
+    def get_item(self, item_id):
+        return self._by_id[item_id]
+
+    def get_item_by_name(self, name):
+        return self._by_name.get(name)
+
+    def set_stock(self, item_id, stock):
+        self._by_id[item_id].stock = stock
+        self.version += 1
+
+    def adjust_stock(self, name, delta):
+        """Add delta to a stock-tracked item; the caller (InventoryReservations) holds the item's lock."""
+        item = self._by_name.get(name)
+        if item is not None and item.stock is not None:
+            item.stock += delta
+            self.version += 1
+
+    def set_price(self, item_id, price):
+        self._by_id[item_id].price_cents = to_cents(price)
+        self.version += 1
+
+    def is_item_available(self, item_name, quantity=1):
+        item = self._by_name.get(item_name)
+        return item is not None and (item.stock is None or item.stock >= quantity)
+
+    def check_availability(self, names):
+        """Return the requested names that cannot be served, in request order.
+
+        names is an iterable of item names, or a {name: quantity} mapping to check stock levels too.
+        """
+        quantities = names if isinstance(names, dict) else dict.fromkeys(names, 1)
+        by_name = self._by_name
+        unavailable = []
+        for name, quantity in quantities.items():
+            item = by_name.get(name)
+            if item is None or (item.stock is not None and item.stock < quantity):
+                unavailable.append(name)
+        return unavailable
+
+
+# AvailableItems Class: the list RestaurantMenu.available_items returns; adding or removing names edits the menu
+class AvailableItems(list):
+    def __init__(self, restaurant_menu, names):
+        super().__init__(names)
+        self._menu = restaurant_menu
+
+    def append(self, name):
+        if self._menu.get_item_by_name(name) is None:
+            self._menu.add_item(name, name)
+        super().append(name)
+
+    def extend(self, names):
+        for name in names:
+            self.append(name)
+
+    def remove(self, name):
+        super().remove(name)
+        self._menu.remove_item(self._menu.get_item_by_name(name).item_id)
+
+
+# InventoryReservations Class: all-or-nothing stock holds between validation and payment
+class InventoryReservations:
+    """Reserve, commit or release several menu items at once.
+
+    Each item has its own lock and multi-item reservations take them in sorted name order, so
+    orders for different items never wait on each other and overlapping orders cannot deadlock.
+    Holds expire after ttl_seconds; sweep() (or the background sweeper) returns their stock.
+    Reservation bookkeeping relies on single dict operations, which are atomic under the GIL.
+    """
+
+    def __init__(self, restaurant_menu, ttl_seconds=300.0, clock=time.monotonic):
+        self.restaurant_menu = restaurant_menu
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._item_locks = {}  # item name -> threading.Lock
+        self._reservations = {}  # reservation id -> (expires_at, {name: quantity})
+        self._ids = itertools.count(1)
+        self._sweeper = None
+        self._stop_sweeper = threading.Event()
+
+    def _lock_for(self, name):
+        lock = self._item_locks.get(name)
+        if lock is None:
+            lock = self._item_locks.setdefault(name, threading.Lock())
+        return lock
+
+    def reserve(self, quantities):
+        names = sorted(quantities)
+        locks = [self._lock_for(name) for name in names]
+        for lock in locks:
+            lock.acquire()
+        try:
+            items = [self.restaurant_menu.get_item_by_name(name) for name in names]
+            for name, item in zip(names, items):
+                if item is None or (item.stock is not None and item.stock < quantities[name]):
+                    return {"success": False, "message": f"{name} is not available"}
+            for name in names:
+                self.restaurant_menu.adjust_stock(name, -quantities[name])
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        reservation_id = next(self._ids)
+        self._reservations[reservation_id] = (self.clock() + self.ttl_seconds, dict(quantities))
+        return {"success": True, "reservation_id": reservation_id}
+
+    def commit(self, reservation_id):
+        """Make a hold permanent. Returns False if it already expired or was released."""
+        return self._reservations.pop(reservation_id, None) is not None
+
+    def release(self, reservation_id):
+        reservation = self._reservations.pop(reservation_id, None)
+        if reservation is None:
+            return False
+        self._restock(reservation[1])
+        return True
+
+    def _restock(self, quantities):
+        for name in sorted(quantities):
+            with self._lock_for(name):
+                self.restaurant_menu.adjust_stock(name, quantities[name])
+
+    def sweep(self):
+        """Release every expired hold; returns how many were reclaimed."""
+        now = self.clock()
+        reclaimed = 0
+        for reservation_id, (expires_at, _) in list(self._reservations.items()):
+            if expires_at <= now:
+                reservation = self._reservations.pop(reservation_id, None)
+                if reservation is not None:
+                    self._restock(reservation[1])
+                    reclaimed += 1
+        return reclaimed
+
+    def active_reservations(self):
+        return len(self._reservations)
+
+    def start_sweeper(self, interval_seconds=1.0):
+        if self._sweeper is not None:
+            return
+        self._stop_sweeper.clear()
+
+        def run():
+            while not self._stop_sweeper.wait(interval_seconds):
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=run, name="inventory-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        if self._sweeper is not None:
+            self._stop_sweeper.set()
+            self._sweeper.join()
+            self._sweeper = None
+
+
+DEFAULT_ETA_MINUTES = 45
+KM_PER_DEGREE = 111.32
+
+
+# LocalGeocoder Class: address -> (lat, lon) from a local lookup table
+class LocalGeocoder:
+    """Any object with geocode(address) -> (lat, lon) or None can replace this one."""
+
+    def __init__(self, table=None):
+        self._table = {}
+        for address, coordinates in (table or {}).items():
+            self.add(address, *coordinates)
+
+    @staticmethod
+    def normalize(address):
+        return " ".join(address.casefold().replace(",", " ").split())
+
+    def add(self, address, lat, lon):
+        self._table[self.normalize(address)] = (lat, lon)
+
+    def geocode(self, address):
+        return self._table.get(self.normalize(address))
+
+
+# TravelTimeGrid Class: precomputed courier travel minutes by grid-cell offset
+class TravelTimeGrid:
+    """Coordinates snap to cell_km cells on a local equirectangular projection around reference_lat.
+
+    Travel time only depends on the (|row offset|, |column offset|) between two cells, so the table
+    is computed once for offsets up to max_km and an estimate is a table lookup. detour_factor turns
+    straight-line distance into road distance; pairs beyond max_km fall back to the same formula.
+    """
+
+    def __init__(self, reference_lat, cell_km=0.25, max_km=30.0, speed_kmh=20.0, detour_factor=1.3):
+        self.cell_km = cell_km
+        self.speed_kmh = speed_kmh
+        self.detour_factor = detour_factor
+        self._km_per_lon_degree = KM_PER_DEGREE * math.cos(math.radians(reference_lat))
+        self.span = int(max_km / cell_km) + 1
+        self._minutes = [
+            [self._formula(math.hypot(rows, cols) * cell_km) for cols in range(self.span)]
+            for rows in range(self.span)
+        ]
+
+    def _formula(self, km):
+        return km * self.detour_factor / self.speed_kmh * 60
+
+    def cell(self, lat, lon):
+        return int(lat * KM_PER_DEGREE // self.cell_km), int(lon * self._km_per_lon_degree // self.cell_km)
+
+    def minutes_between_cells(self, origin, destination):
+        rows, cols = abs(origin[0] - destination[0]), abs(origin[1] - destination[1])
+        if rows < self.span and cols < self.span:
+            return self._minutes[rows][cols]
+        return self._formula(math.hypot(rows, cols) * self.cell_km)
+
+    def minutes(self, origin_lat, origin_lon, destination_lat, destination_lon):
+        return self.minutes_between_cells(self.cell(origin_lat, origin_lon), self.cell(destination_lat, destination_lon))
+
+
+# PrepTimeTracker Class: per-restaurant exponentially weighted moving average of prep minutes
+class PrepTimeTracker:
+    def __init__(self, alpha=0.2, default_minutes=15.0):
+        self.alpha = alpha
+        self.default_minutes = default_minutes
+        self._averages = {}
+
+    def record(self, restaurant_id, minutes):
+        average = self._averages.get(restaurant_id)
+        self._averages[restaurant_id] = minutes if average is None else average + self.alpha * (minutes - average)
+
+    def estimate(self, restaurant_id):
+        return self._averages.get(restaurant_id, self.default_minutes)
+
+
+# EtaService Class: delivery estimates from a few lookups instead of route computations
+class EtaService:
+    """minutes = max(kitchen ready, courier at restaurant) + travel + handoff, rounded up.
+
+      kitchen ready      = average prep * (1 + queued orders / kitchen_capacity)
+      courier arrival    = approach_minutes, plus courier_cycle_minutes per order queued ahead of
+                           this one once idle couriers run out, spread over all couriers
+      travel             = TravelTimeGrid lookup between restaurant and geocoded address
+
+    track() remembers open orders with their travel leg already resolved, and refresh() re-estimates
+    them all in one pass (computing each restaurant's pickup time once), e.g. once a minute. Orders are
+    forgotten on complete(), which an OrderStore calls on delivery or cancellation once subscribed
+    to it (OrderPlacement does that when given both).
+    """
+
+    def __init__(self, grid, geocoder=None, prep_times=None, kitchen_capacity=4, approach_minutes=5.0,
+                 courier_cycle_minutes=20.0, handoff_minutes=2.0):
+        self.grid = grid
+        self.geocoder = geocoder or LocalGeocoder()
+        self.prep_times = prep_times or PrepTimeTracker()
+        self.kitchen_capacity = kitchen_capacity
+        self.approach_minutes = approach_minutes
+        self.courier_cycle_minutes = courier_cycle_minutes
+        self.handoff_minutes = handoff_minutes
+        self._restaurant_cells = {}
+        self._queue_depths = {}
+        self.couriers_total = 0
+        self.couriers_idle = 0
+        self.orders_awaiting_courier = 0
+        self._open_orders = {}  # order id -> (restaurant id, travel minutes)
+        self._refresher = None
+        self._stop_refresher = threading.Event()
+
+    def add_restaurant(self, restaurant_id, lat, lon):
+        self._restaurant_cells[restaurant_id] = self.grid.cell(lat, lon)
+
+    def set_queue_depth(self, restaurant_id, depth):
+        self._queue_depths[restaurant_id] = depth
+
+    def set_courier_availability(self, total, idle, awaiting_courier=0):
+        self.couriers_total = total
+        self.couriers_idle = idle
+        self.orders_awaiting_courier = awaiting_courier
+
+    def record_prep_time(self, restaurant_id, minutes):
+        self.prep_times.record(restaurant_id, minutes)
+
+    def travel_minutes(self, restaurant_id, address):
+        restaurant_cell = self._restaurant_cells.get(restaurant_id)
+        coordinates = self.geocoder.geocode(address)
+        if restaurant_cell is None or coordinates is None:
+            return None
+        return self.grid.minutes_between_cells(restaurant_cell, self.grid.cell(*coordinates))
+
+    def courier_wait_minutes(self):
+        shortfall = self.orders_awaiting_courier - self.couriers_idle + 1
+        if shortfall <= 0:
+            return 0.0
+        return shortfall * self.courier_cycle_minutes / max(1, self.couriers_total)
+
+    def pickup_minutes(self, restaurant_id):
+        kitchen = self.prep_times.estimate(restaurant_id) * (
+            1 + self._queue_depths.get(restaurant_id, 0) / self.kitchen_capacity)
+        return max(kitchen, self.approach_minutes + self.courier_wait_minutes())
+
+    def estimate(self, restaurant_id, address):
+        """Whole minutes until delivery, or None if the restaurant or address cannot be located."""
+        travel = self.travel_minutes(restaurant_id, address)
+        if travel is None:
+            return None
+        return math.ceil(self.pickup_minutes(restaurant_id) + travel + self.handoff_minutes)
+
+    def track(self, order_id, restaurant_id, address):
+        travel = self.travel_minutes(restaurant_id, address)
+        if travel is None:
+            return None
+        self._open_orders[order_id] = (restaurant_id, travel)
+        return math.ceil(self.pickup_minutes(restaurant_id) + travel + self.handoff_minutes)
+
+    def complete(self, order_id):
+        return self._open_orders.pop(order_id, None) is not None
+
+    def on_order_event(self, event_type, order):
+        if event_type in ("delivered", "cancelled"):
+            self.complete(order["order_id"])
+
+    def open_orders(self):
+        return len(self._open_orders)
+
+    def refresh(self):
+        """Re-estimate every open order; returns {order_id: minutes}."""
+        pickups = {}
+        estimates = {}
+        # Request threads track() and complete() orders meanwhile; copying the items is a single C call
+        # under the GIL, so the loop works on a consistent snapshot.
+        for order_id, (restaurant_id, travel) in list(self._open_orders.items()):
+            pickup = pickups.get(restaurant_id)
+            if pickup is None:
+                pickup = pickups[restaurant_id] = self.pickup_minutes(restaurant_id)
+            estimates[order_id] = math.ceil(pickup + travel + self.handoff_minutes)
+        return estimates
+
+    def start_refresher(self, on_refresh, interval_seconds=60.0):
+        if self._refresher is not None:
+            return
+        self._stop_refresher.clear()
+
+        def run():
+            while not self._stop_refresher.wait(interval_seconds):
+                on_refresh(self.refresh())
+
+        self._refresher = threading.Thread(target=run, name="eta-refresher", daemon=True)
+        self._refresher.start()
+
+    def stop_refresher(self):
+        if self._refresher is not None:
+            self._stop_refresher.set()
+            self._refresher.join()
+            self._refresher = None
+
+
+def approximate_km(lat1, lon1, lat2, lon2):
+    # Equirectangular approximation; well within a percent of haversine at city scale.
+    x = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(lat2 - lat1, x) * KM_PER_DEGREE
+
+
+# CourierGrid Class: uniform grid over courier positions for nearest-courier lookups
+class CourierGrid:
+    def __init__(self, cell_km=1.0):
+        self.cell_km = cell_km
+        self.cells = {}  # (row, col) -> {courier_id: (lat, lon)}
+        self._cell_of = {}
+
+    def _cell(self, lat, lon):
+        return (int(lat * KM_PER_DEGREE // self.cell_km),
+                int(lon * KM_PER_DEGREE * math.cos(math.radians(lat)) // self.cell_km))
+
+    def add(self, courier_id, lat, lon):
+        self.discard(courier_id)
+        cell = self._cell(lat, lon)
+        self.cells.setdefault(cell, {})[courier_id] = (lat, lon)
+        self._cell_of[courier_id] = cell
+
+    def discard(self, courier_id):
+        cell = self._cell_of.pop(courier_id, None)
+        if cell is not None:
+            members = self.cells[cell]
+            del members[courier_id]
+            if not members:
+                del self.cells[cell]
+
+    def __len__(self):
+        return len(self._cell_of)
+
+    def nearest(self, lat, lon, k, max_km):
+        """Up to k (km, courier_id) pairs within max_km, closest first; rings stop once k are certain."""
+        row, col = self._cell(lat, lon)
+        scale = math.cos(math.radians(lat))
+        hypot = math.hypot
+        cells = self.cells
+        found = []
+        max_ring = int(max_km // self.cell_km) + 1
+        for ring in range(max_ring + 1):
+            for cell_row in range(row - ring, row + ring + 1):
+                edge = cell_row in (row - ring, row + ring)
+                for cell_col in (range(col - ring, col + ring + 1) if edge else (col - ring, col + ring)):
+                    members = cells.get((cell_row, cell_col))
+                    if members:
+                        for courier_id, (courier_lat, courier_lon) in members.items():
+                            km = hypot(courier_lat - lat, (courier_lon - lon) * scale) * KM_PER_DEGREE
+                            if km <= max_km:
+                                found.append((km, courier_id))
+            # Everything outside the rings searched so far is at least ring * cell_km away.
+            if len(found) >= k and heapq.nsmallest(k, found)[-1][0] <= ring * self.cell_km:
+                break
+        return heapq.nsmallest(k, found)
+
+
+def solve_zone(bundles, couriers, max_pickup_km, candidates_per_bundle, deadline):
+    """Assign bundles to couriers within one zone; a plain function so a process pool can run it.
+
+    bundles are (bundle_index, pickup_lat, pickup_lon) and couriers (courier_id, lat, lon). Cheapest
+    (bundle, courier) candidate pairs are taken greedily, then pairs of assignments that share a
+    candidate courier are swapped while that lowers the total pickup distance and time.monotonic()
+    is before deadline. Returns [(bundle_index, courier_id, pickup_km)].
+    """
+    grid = CourierGrid(cell_km=max(max_pickup_km / 10, 0.1))
+    positions = {}
+    for courier_id, lat, lon in couriers:
+        grid.add(courier_id, lat, lon)
+        positions[courier_id] = (lat, lon)
+    pickups = {}
+    candidates = {}
+    pairs = []
+    for bundle_index, lat, lon in bundles:
+        pickups[bundle_index] = (lat, lon)
+        nearest = grid.nearest(lat, lon, candidates_per_bundle, max_pickup_km)
+        candidates[bundle_index] = [courier_id for _, courier_id in nearest]
+        pairs.extend((km, bundle_index, courier_id) for km, courier_id in nearest)
+    pairs.sort()
+    courier_of = {}
+    bundle_of = {}
+    for km, bundle_index, courier_id in pairs:
+        if bundle_index not in courier_of and courier_id not in bundle_of:
+            courier_of[bundle_index] = courier_id
+            bundle_of[courier_id] = bundle_index
+
+    def cost(bundle_index, courier_id):
+        return approximate_km(*pickups[bundle_index], *positions[courier_id])
+
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for bundle_index, courier_id in list(courier_of.items()):
+            for other_courier in candidates[bundle_index]:
+                other_bundle = bundle_of.get(other_courier)
+                if other_bundle is None or other_bundle == bundle_index:
+                    continue
+                if courier_id not in candidates[other_bundle]:
+                    continue
+                before = cost(bundle_index, courier_id) + cost(other_bundle, other_courier)
+                after = cost(bundle_index, other_courier) + cost(other_bundle, courier_id)
+                if after < before - 1e-9:
+                    courier_of[bundle_index], courier_of[other_bundle] = other_courier, courier_id
+                    bundle_of[other_courier], bundle_of[courier_id] = bundle_index, other_bundle
+                    courier_id = other_courier
+                    improved = True
+    return [(bundle_index, courier_id, cost(bundle_index, courier_id)) for bundle_index, courier_id in courier_of.items()]
+
+
+# DispatchScheduler Class: matches confirmed orders to couriers in periodic ticks
+class DispatchScheduler:
+    """Each tick():
+      1. bundles pending orders from the same restaurant whose drop-offs lie within
+         bundle_radius_km of the bundle's first order (at most max_bundle_size per courier),
+      2. splits bundles into zone_km square zones by pickup position and offers every idle courier
+         to its own zone and to each zone within max_pickup_km of it, so a courier just across a
+         zone line still competes for a nearby bundle,
+      3. solves every zone independently with solve_zone, through executor.map when an executor
+         (e.g. a ProcessPoolExecutor) is given, inline otherwise,
+      4. keeps, for a courier matched in more than one zone, only its shortest pickup,
+      5. marks matched couriers busy and drops their orders from the pending set.
+    Orders left unmatched, including those whose courier went to another zone, stay pending for
+    the next tick.
+    """
+
+    def __init__(self, geocoder=None, zone_km=5.0, max_pickup_km=5.0, bundle_radius_km=1.0, max_bundle_size=3,
+                 candidates_per_bundle=8, executor=None):
+        self.geocoder = geocoder or LocalGeocoder()
+        self.zone_km = zone_km
+        self.max_pickup_km = max_pickup_km
+        self.bundle_radius_km = bundle_radius_km
+        self.max_bundle_size = max_bundle_size
+        self.candidates_per_bundle = candidates_per_bundle
+        self.executor = executor
+        self._restaurants = {}  # restaurant id -> (lat, lon)
+        self._couriers = {}  # courier id -> (lat, lon, idle)
+        self._pending = {}  # restaurant id -> {order id: (drop lat, drop lon)}
+
+    def add_restaurant(self, restaurant_id, lat, lon):
+        self._restaurants[restaurant_id] = (lat, lon)
+
+    def update_courier(self, courier_id, lat, lon, idle=True):
+        self._couriers[courier_id] = (lat, lon, idle)
+
+    def remove_courier(self, courier_id):
+        self._couriers.pop(courier_id, None)
+
+    def submit(self, order_id, restaurant_id, delivery_address):
+        """Queue a confirmed order; returns False if the restaurant or address cannot be located."""
+        dropoff = self.geocoder.geocode(delivery_address)
+        if restaurant_id not in self._restaurants or dropoff is None:
+            return False
+        self._pending.setdefault(restaurant_id, {})[order_id] = dropoff
+        return True
+
+    def pending_orders(self):
+        return sum(len(orders) for orders in self._pending.values())
+
+    def courier_availability(self):
+        """(total, idle, orders awaiting a courier), the inputs EtaService.set_courier_availability takes."""
+        idle = sum(1 for _, _, is_idle in self._couriers.values() if is_idle)
+        return len(self._couriers), idle, self.pending_orders()
+
+    def _bundles(self):
+        for restaurant_id, orders in self._pending.items():
+            remaining = list(orders.items())
+            while remaining:
+                (seed_id, seed), rest = remaining[0], remaining[1:]
+                bundle, remaining = [seed_id], []
+                for order_id, dropoff in rest:
+                    if len(bundle) < self.max_bundle_size and approximate_km(*seed, *dropoff) <= self.bundle_radius_km:
+                        bundle.append(order_id)
+                    else:
+                        remaining.append((order_id, dropoff))
+                yield restaurant_id, bundle
+
+    def _zone(self, lat, lon):
+        return (int(lat * KM_PER_DEGREE // self.zone_km),
+                int(lon * KM_PER_DEGREE * math.cos(math.radians(lat)) // self.zone_km))
+
+    def tick(self, time_budget_seconds=0.5):
+        """Run one assignment round; returns [{"courier_id", "restaurant_id", "order_ids", "pickup_km"}]."""
+        deadline = time.monotonic() + time_budget_seconds
+        bundles = list(self._bundles())
+        zones = {}
+        for bundle_index, (restaurant_id, _) in enumerate(bundles):
+            lat, lon = self._restaurants[restaurant_id]
+            zones.setdefault(self._zone(lat, lon), ([], []))[0].append((bundle_index, lat, lon))
+        reach = math.ceil(self.max_pickup_km / self.zone_km)
+        for courier_id, (lat, lon, idle) in self._couriers.items():
+            if not idle:
+                continue
+            row, col = self._zone(lat, lon)
+            for zone_row in range(row - reach, row + reach + 1):
+                for zone_col in range(col - reach, col + reach + 1):
+                    zone = zones.get((zone_row, zone_col))
+                    if zone is not None:
+                        zone[1].append((courier_id, lat, lon))
+        work = [zone for zone in zones.values() if zone[1]]
+        arguments = ([bundle_list for bundle_list, _ in work], [couriers for _, couriers in work],
+                     itertools.repeat(self.max_pickup_km), itertools.repeat(self.candidates_per_bundle),
+                     itertools.repeat(deadline))
+        solved = self.executor.map(solve_zone, *arguments) if self.executor is not None else map(solve_zone, *arguments)
+        matches = sorted((pickup_km, bundle_index, courier_id)
+                         for zone_assignments in solved for bundle_index, courier_id, pickup_km in zone_assignments)
+        assignments = []
+        for pickup_km, bundle_index, courier_id in matches:
+            if not self._couriers[courier_id][2]:
+                continue  # already matched in a neighbouring zone
+            restaurant_id, order_ids = bundles[bundle_index]
+            lat, lon, _ = self._couriers[courier_id]
+            self._couriers[courier_id] = (lat, lon, False)
+            pending = self._pending[restaurant_id]
+            for order_id in order_ids:
+                del pending[order_id]
+            if not pending:
+                del self._pending[restaurant_id]
+            assignments.append({"courier_id": courier_id, "restaurant_id": restaurant_id,
+                                "order_ids": order_ids, "pickup_km": pickup_km})
+        return assignments
 
-    def is_item_available(self, item_name):
-        return item_name in self.available_items
+
+# Order lifecycle events; the stored type code is the position in this tuple plus one
+ORDER_EVENTS = ("created", "paid", "dispatched", "delivered", "cancelled")
+ORDER_TRANSITIONS = {
+    None: {"created"},
+    "created": {"paid", "cancelled"},
+    "paid": {"dispatched", "cancelled"},
+    "dispatched": {"delivered"},
+    "delivered": set(),
+    "cancelled": set(),
+}
+
+# Event record: | crc32 of body | body length | body |, body = EVENT_BODY + order id + user + restaurant + data
+RECORD_HEADER = struct.Struct("<II")
+EVENT_BODY = struct.Struct("<BQdHHHI")  # type code, sequence, timestamp, three string lengths, data length
+# Snapshot: SNAPSHOT_HEADER, then one fixed-width SNAPSHOT_ORDER per order, then all their strings
+# back to back, then a JSON array with each order's data, so loading is one iter_unpack and one json.loads.
+SNAPSHOT_HEADER = struct.Struct("<4sHQQIQ")  # magic, version, log offset, last sequence, order count, strings size
+SNAPSHOT_ORDER = struct.Struct("<BddHHH")  # status code, created_at, updated_at, three string lengths
+SNAPSHOT_MAGIC = b"OSNP"
+
+
+def _encode_strings(*values):
+    return [b"" if value is None else str(value).encode() for value in values]
+
+
+def _decode_string(raw):
+    return raw.decode() if raw else None
+
+
+def encode_event(event_type, sequence, timestamp, order_id, user_id=None, restaurant_id=None, data=None):
+    order_bytes, user_bytes, restaurant_bytes = _encode_strings(order_id, user_id, restaurant_id)
+    data_bytes = json.dumps(data, separators=(",", ":")).encode() if data else b""
+    body = b"".join((
+        EVENT_BODY.pack(ORDER_EVENTS.index(event_type) + 1, sequence, timestamp, len(order_bytes), len(user_bytes),
+                        len(restaurant_bytes), len(data_bytes)),
+        order_bytes, user_bytes, restaurant_bytes, data_bytes,
+    ))
+    return RECORD_HEADER.pack(zlib.crc32(body), len(body)) + body
+
+
+def decode_events(buffer, offset=0):
+    """Yield (end offset, event dict) for each intact record; stops at a torn or corrupt tail."""
+    end = len(buffer)
+    while offset + RECORD_HEADER.size <= end:
+        crc, length = RECORD_HEADER.unpack_from(buffer, offset)
+        start = offset + RECORD_HEADER.size
+        if start + length > end or length < EVENT_BODY.size:
+            return
+        body = bytes(buffer[start:start + length])
+        if zlib.crc32(body) != crc:
+            return
+        code, sequence, timestamp, order_length, user_length, restaurant_length, data_length = EVENT_BODY.unpack_from(body)
+        position = EVENT_BODY.size
+        fields = []
+        for length_of_field in (order_length, user_length, restaurant_length, data_length):
+            fields.append(body[position:position + length_of_field])
+            position += length_of_field
+        offset = start + length
+        yield offset, {
+            "type": ORDER_EVENTS[code - 1],
+            "sequence": sequence,
+            "timestamp": timestamp,
+            "order_id": fields[0].decode(),
+            "user_id": _decode_string(fields[1]),
+            "restaurant_id": _decode_string(fields[2]),
+            "data": json.loads(fields[3]) if fields[3] else {},
+        }
+
+
+# OrderEventLog Class: buffered, append-only binary event log with batched fsync
+class OrderEventLog:
+    """Appends go through a userspace buffer; flush + fsync happen every sync_every records (and on
+    sync()/close()), so a crash loses at most the last unsynced batch. A torn record at the tail is
+    detected by its CRC on replay and cut off before new appends.
+    """
+
+    def __init__(self, path, sync_every=64, buffer_size=1 << 16):
+        self.path = path
+        self.sync_every = sync_every
+        self._file = open(path, "ab", buffering=buffer_size)
+        self._unsynced = 0
+        self.syncs = 0
+
+    def append(self, record):
+        self._file.write(record)
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        if self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self.syncs += 1
+
+    def tell(self):
+        return self._file.tell()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+
+# OrderStore Class: event-sourced order state with snapshots and in-memory indexes
+class OrderStore:
+    """Order state is rebuilt from directory/events.log, starting at the last snapshot.
+
+    Every snapshot_every events the full state is written to directory/snapshot.bin (atomically,
+    via a temp file and os.replace) together with the log offset it covers, so startup only replays
+    the events after it. Snapshots are read through mmap. Orders are indexed by id, user and
+    restaurant; record() rejects transitions ORDER_TRANSITIONS does not allow.
+    """
+
+    LOG_NAME = "events.log"
+    SNAPSHOT_NAME = "snapshot.bin"
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, directory, snapshot_every=10000, sync_every=64, clock=time.time):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.clock = clock
+        self.orders = {}  # order id -> state dict
+        self.by_user = {}
+        self.by_restaurant = {}
+        self.sequence = 0
+        self.replayed = 0  # events applied from the log at startup
+        self._since_snapshot = 0
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, self.LOG_NAME)
+        self.snapshot_path = os.path.join(directory, self.SNAPSHOT_NAME)
+        offset = self._load_snapshot()
+        self._replay(offset)
+        self.log = OrderEventLog(self.log_path, sync_every=sync_every)
+        self.listeners = []  # callables(event_type, order) run after every recorded event
+
+    def subscribe(self, listener):
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def _load_snapshot(self):
+        if not os.path.exists(self.snapshot_path) or os.path.getsize(self.snapshot_path) < SNAPSHOT_HEADER.size:
+            return 0
+        with open(self.snapshot_path, "rb") as snapshot_file, \
+                mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            magic, version, log_offset, sequence, count, strings_size = SNAPSHOT_HEADER.unpack_from(view, 0)
+            if magic != SNAPSHOT_MAGIC or version != self.SNAPSHOT_VERSION:
+                raise ValueError(f"{self.snapshot_path} is not an order snapshot")
+            records_start = SNAPSHOT_HEADER.size
+            strings_start = records_start + count * SNAPSHOT_ORDER.size
+            data_start = strings_start + strings_size
+            records = SNAPSHOT_ORDER.iter_unpack(view[records_start:strings_start])
+            strings = view[strings_start:data_start]
+            datas = json.loads(view[data_start:])
+        position = 0
+        for (code, created_at, updated_at, order_length, user_length, restaurant_length), data in zip(records, datas):
+            order_end = position + order_length
+            user_end = order_end + user_length
+            restaurant_end = user_end + restaurant_length
+            self._index({
+                "order_id": strings[position:order_end].decode(),
+                "user_id": strings[order_end:user_end].decode() if user_length else None,
+                "restaurant_id": strings[user_end:restaurant_end].decode() if restaurant_length else None,
+                "status": ORDER_EVENTS[code - 1],
+                "created_at": created_at,
+                "updated_at": updated_at,
+                "data": data,
+            })
+            position = restaurant_end
+        self.sequence = sequence
+        return log_offset
+
+    def _replay(self, offset):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, "rb") as log_file:
+            size = os.fstat(log_file.fileno()).st_size
+            good = offset
+            if size > offset:
+                with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    for good, event in decode_events(view, offset):
+                        self._apply(event)
+                        self.replayed += 1
+        if good < size:
+            # Torn or corrupt tail from a crash mid-append; drop it so new records follow good ones.
+            os.truncate(self.log_path, good)
+
+    def _index(self, order):
+        self.orders[order["order_id"]] = order
+        if order["user_id"] is not None:
+            self.by_user.setdefault(order["user_id"], set()).add(order["order_id"])
+        if order["restaurant_id"] is not None:
+            self.by_restaurant.setdefault(order["restaurant_id"], set()).add(order["order_id"])
+
+    def _apply(self, event):
+        self.sequence = event["sequence"]
+        order = self.orders.get(event["order_id"])
+        if order is None:
+            self._index({
+                "order_id": event["order_id"],
+                "user_id": event["user_id"],
+                "restaurant_id": event["restaurant_id"],
+                "status": event["type"],
+                "created_at": event["timestamp"],
+                "updated_at": event["timestamp"],
+                "data": dict(event["data"]),
+            })
+            return
+        order["status"] = event["type"]
+        order["updated_at"] = event["timestamp"]
+        order["data"].update(event["data"])
+
+    def record(self, event_type, order_id, user_id=None, restaurant_id=None, **data):
+        order = self.orders.get(order_id)
+        status = order["status"] if order is not None else None
+        if event_type not in ORDER_TRANSITIONS[status]:
+            raise ValueError(f"Cannot record {event_type} for order {order_id} in state {status}")
+        event = {
+            "type": event_type,
+            "sequence": self.sequence + 1,
+            "timestamp": self.clock(),
+            "order_id": order_id,
+            "user_id": user_id,
+            "restaurant_id": restaurant_id,
+            "data": data,
+        }
+        self.log.append(encode_event(event_type, event["sequence"], event["timestamp"], order_id, user_id,
+                                     restaurant_id, data))
+        self._apply(event)
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+        order = self.orders[order_id]
+        for listener in self.listeners:
+            listener(event_type, order)
+        return order
+
+    def get(self, order_id):
+        return self.orders.get(order_id)
+
+    def orders_for_user(self, user_id):
+        return [self.orders[order_id] for order_id in sorted(self.by_user.get(user_id, ()))]
+
+    def orders_for_restaurant(self, restaurant_id, status=None):
+        orders = [self.orders[order_id] for order_id in sorted(self.by_restaurant.get(restaurant_id, ()))]
+        return orders if status is None else [order for order in orders if order["status"] == status]
+
+    def snapshot(self):
+        self.log.sync()
+        log_offset = self.log.tell()
+        records = bytearray()
+        strings = bytearray()
+        for order in self.orders.values():
+            order_bytes, user_bytes, restaurant_bytes = _encode_strings(order["order_id"], order["user_id"],
+                                                                        order["restaurant_id"])
+            records += SNAPSHOT_ORDER.pack(ORDER_EVENTS.index(order["status"]) + 1, order["created_at"],
+                                           order["updated_at"], len(order_bytes), len(user_bytes), len(restaurant_bytes))
+            strings += order_bytes + user_bytes + restaurant_bytes
+        datas = json.dumps([order["data"] for order in self.orders.values()], separators=(",", ":")).encode()
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".snapshot-")
+        with os.fdopen(descriptor, "wb") as snapshot_file:
+            snapshot_file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, self.SNAPSHOT_VERSION, log_offset, self.sequence,
+                                                     len(self.orders), len(strings)))
+            snapshot_file.write(records)
+            snapshot_file.write(strings)
+            snapshot_file.write(datas)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        self._since_snapshot = 0
+
+    def close(self):
+        self.log.close()
+
+
+# OrderPipeline Class: validation -> pricing -> payment -> confirmation over bounded queues
+class OrderPipeline:
+    """Staged asyncio pipeline for OrderPlacement objects.
+
+    Each stage has its own worker count and hands orders on through an asyncio.Queue of queue_size.
+    When payment is slow its queue fills, pricing blocks on put(), and so on back to submit(), so
+    callers are throttled instead of piling up unbounded work. If a caller stops waiting (its future is
+    cancelled), an order that has not been charged yet is dropped and its stock released, while one that
+    has been charged still goes through confirmation; only its result is discarded. Use it as an async
+    context manager:
+
+        async with OrderPipeline(gateway, workers={"payment": 64}) as pipeline:
+            result = await pipeline.confirm(order)
+    """
+
+    STAGES = ("validation", "pricing", "payment", "confirmation")
+    DEFAULT_WORKERS = {"validation": 2, "pricing": 2, "payment": 32, "confirmation": 2}
+
+    def __init__(self, payment_method, workers=None, queue_size=128):
+        self.payment_method = payment_method
+        self.workers = {**self.DEFAULT_WORKERS, **(workers or {})}
+        self.queue_size = queue_size
+        self.processed = dict.fromkeys(self.STAGES, 0)
+        self._queues = None
+        self._tasks = []
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queues = {stage: asyncio.Queue(self.queue_size) for stage in self.STAGES}
+        handlers = {
+            "validation": self._validate,
+            "pricing": self._price,
+            "payment": self._pay,
+            "confirmation": self._confirm,
+        }
+        for index, stage in enumerate(self.STAGES):
+            following = self._queues[self.STAGES[index + 1]] if index + 1 < len(self.STAGES) else None
+            for _ in range(self.workers[stage]):
+                self._tasks.append(asyncio.create_task(self._run(stage, handlers[stage], following)))
+
+    async def close(self):
+        """Let every queued order finish, then stop the workers."""
+        for stage in self.STAGES:
+            await self._queues[stage].join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def submit(self, order):
+        """Enqueue an order; waits while the pipeline is full and returns a future for its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queues["validation"].put({"order": order, "future": future})
+        return future
+
+    async def confirm(self, order):
+        return await (await self.submit(order))
+
+    async def confirm_many(self, orders):
+        futures = [await self.submit(order) for order in orders]
+        return await asyncio.gather(*futures)
+
+    def queue_depths(self):
+        return {stage: queue.qsize() for stage, queue in self._queues.items()}
+
+    async def _run(self, stage, handler, following):
+        queue = self._queues[stage]
+        while True:
+            job = await queue.get()
+            try:
+                if job["future"].cancelled() and "paid" not in job:
+                    self._abandon(job)
+                else:
+                    await handler(job)
+                    self.processed[stage] += 1
+                    if following is not None and not job.get("finished"):
+                        await following.put(job)
+            except Exception as error:
+                self._fail(job, error)
+            finally:
+                queue.task_done()
+
+    def _resolve(self, job, result):
+        # Stages stop passing the job on once it is finished, whether or not anyone still awaits it.
+        job["finished"] = True
+        if not job["future"].done():
+            job["future"].set_result(result)
+
+    def _abandon(self, job):
+        reservation_id = job.pop("reservation_id", None)
+        if reservation_id is not None:
+            job["order"].inventory.release(reservation_id)
+        job["finished"] = True
+
+    def _fail(self, job, error):
+        reservation_id = job.get("reservation_id")
+        if reservation_id is not None:
+            job["order"].settle_order(reservation_id, False)
+            job["reservation_id"] = None
+        job["finished"] = True
+        if not job["future"].done():
+            job["future"].set_exception(error)
+
+    async def _validate(self, job):
+        prepared = job["order"].prepare_order()
+        if not prepared["success"]:
+            self._resolve(job, prepared)
+        else:
+            job["reservation_id"] = prepared["reservation_id"]
+
+    async def _price(self, job):
+        job["total"] = job["order"].cart.calculate_total()["total"]
+
+    async def _pay(self, job):
+        job["paid"] = await pay_async(self.payment_method, job["total"])
+
+    async def _confirm(self, job):
+        total = job["total"]
+        result = job["order"].settle_order(job.pop("reservation_id"), job["paid"],
+                                           refund=lambda: refund_payment(self.payment_method, total))
+        self._resolve(job, result)
+
+
+# The test process plays worker 1 for orders placed without their own generator
+def setUpModule():
+    configure_order_ids(1)
 
 
 # Unit tests for OrderPlacement class
@@ -142,7 +1607,7 @@ class TestOrderPlacement(unittest.TestCase):
         result = self.order.confirm_order(payment_method)
         self.assertTrue(result["success"])
         self.assertEqual(result["message"], "Order confirmed")
-        self.assertEqual(result["order_id"], "ORD123456")
+        self.assertRegex(result["order_id"], r"^ORD\d+$")
 
     def test_confirm_order_failed_payment(self):
         self.cart.add_item("Pizza", 12.99, 1)
@@ -155,5 +1620,834 @@ class TestOrderPlacement(unittest.TestCase):
             self.assertEqual(result["message"], "Payment failed")
 
 
+# Unit tests for Cart bookkeeping
+class TestCart(unittest.TestCase):
+    def setUp(self):
+        self.cart = Cart()
+
+    def test_items_are_keyed_by_name(self):
+        self.assertEqual(self.cart.add_item("Burger", 8.99, 1), "Added Burger to cart")
+        self.assertEqual(self.cart.add_item("Burger", 8.99, 2), "Updated Burger quantity to 3")
+        self.cart.add_item("Salad", 6.50, 1)
+        self.assertEqual([item.name for item in self.cart.items], ["Burger", "Salad"])
+        self.assertEqual(self.cart.update_item_quantity("Pizza", 2), "Pizza not found in cart")
+
+    def test_running_totals_match_a_full_recount(self):
+        self.cart.add_item("Burger", 8.99, 2)
+        self.cart.add_item("Pizza", 12.99, 1)
+        self.cart.add_item("Salad", 6.50, 3)
+        self.cart.update_item_quantity("Burger", 5)
+        self.cart.remove_item("Pizza")
+        self.cart.add_item("Salad", 6.50, 1)
+        expected_subtotal = sum(item.get_subtotal() for item in self.cart.items)
+        expected_tax = (expected_subtotal * Decimal("0.10")).quantize(CENT, rounding=ROUND_HALF_UP)
+        totals = self.cart.calculate_total()
+        self.assertEqual(totals["subtotal"], expected_subtotal)
+        self.assertEqual(totals["tax"], expected_tax)
+        self.assertEqual(totals["total"], expected_subtotal + expected_tax + Decimal("5.00"))
+        self.cart.remove_item("Burger")
+        self.cart.remove_item("Salad")
+        self.assertEqual(self.cart.calculate_total()["subtotal"], 0)
+        self.assertFalse(self.cart.items)
+
+    def test_item_quantity_changes_reach_the_cart(self):
+        self.cart.add_item("Burger", 8.99, 1)
+        burger = next(iter(self.cart.items))
+        version = self.cart.version
+        burger.update_quantity(3)
+        self.assertEqual(self.cart.calculate_total()["subtotal"], Decimal("26.97"))
+        self.assertGreater(self.cart.version, version)
+        self.cart.remove_item("Burger")
+        burger.update_quantity(5)
+        self.assertEqual((burger.quantity, self.cart.calculate_total()["subtotal"]), (5, 0))
+
+    def test_cart_item_has_no_instance_dict(self):
+        item = CartItem("Burger", 8.99, 1)
+        self.assertFalse(hasattr(item, "__dict__"))
+        with self.assertRaises(AttributeError):
+            item.note = "extra pickles"
+
+
+# Unit tests for exact money handling and regional pricing rules
+class TestPricing(unittest.TestCase):
+    def setUp(self):
+        self.pricing = PricingEngine({
+            "default": REGION_RULES["default"],
+            "metro": {
+                "tax_rate": "0.08875",
+                "tax_table": {"alcohol": "0.12", "grocery": "0"},
+                "delivery_fee": {"base": "1.99", "per_km": "0.45", "free_km": 2},
+                "promo_codes": {
+                    "SAVE10": {"percent_off": "10"},
+                    "FIVEOFF": {"amount_off": "5.00", "min_subtotal": "25.00"},
+                    "FREEDEL": {"free_delivery": True},
+                },
+            },
+            "suburb": {
+                "tax_rate": "0.06",
+                "delivery_fee": {"by_subtotal": [["0", "7.99"], ["20.00", "3.99"], ["50.00", "0"]]},
+            },
+        })
+
+    def test_default_totals_are_exact(self):
+        cart = Cart()
+        cart.add_item("Fries", 0.10, 1)
+        cart.add_item("Soda", 0.20, 1)
+        self.assertEqual(cart.calculate_total(), {"subtotal": Decimal("0.30"), "tax": Decimal("0.03"),
+                                                  "delivery_fee": Decimal("5.00"), "total": Decimal("5.33")})
+        cart.add_item("Pizza", 12.99, 1)
+        self.assertEqual(cart.calculate_total()["total"], Decimal("19.62"))
+        self.assertEqual(CartItem("Burger", "8.985", 1).price, Decimal("8.99"))
+
+    def test_tax_table_and_distance_fee(self):
+        cart = Cart(pricing=self.pricing, region="metro")
+        cart.add_item("Pasta", 15.99, 2)
+        cart.add_item("Wine", 24.00, 1, category="alcohol")
+        cart.add_item("Milk", 3.49, 1, category="grocery")
+        totals = cart.calculate_total_cents(distance_km=5.3)
+        self.assertEqual(totals["subtotal"], 5947)
+        self.assertEqual(totals["tax"], 572)  # 31.98 * 8.875% + 24.00 * 12% = 2.838 + 2.88
+        self.assertEqual(totals["delivery_fee"], 199 + 149)  # 3.3 km past the free 2 km at 0.45/km
+        with self.assertRaises(ValueError):
+            cart.calculate_total()
+
+    def test_subtotal_tiered_delivery_fee(self):
+        cart = Cart(pricing=self.pricing, region="suburb")
+        cart.add_item("Salad", 9.50, 1)
+        self.assertEqual(cart.calculate_total()["delivery_fee"], Decimal("7.99"))
+        cart.update_item_quantity("Salad", 3)
+        self.assertEqual(cart.calculate_total()["delivery_fee"], Decimal("3.99"))
+        cart.update_item_quantity("Salad", 6)
+        self.assertEqual(cart.calculate_total()["delivery_fee"], Decimal("0.00"))
+
+    def test_promo_codes(self):
+        cart = Cart(pricing=self.pricing, region="metro")
+        cart.add_item("Pasta", 10.00, 2)
+        self.assertEqual(cart.calculate_total_cents(distance_km=1, promo_code="save10")["discount"], 200)
+        self.assertEqual(cart.calculate_total_cents(distance_km=1, promo_code="FIVEOFF")["discount"], 0)
+        cart.add_item("Pasta", 10.00, 1)
+        totals = cart.calculate_total(distance_km=1, promo_code="FIVEOFF")
+        self.assertEqual(totals["discount"], Decimal("5.00"))
+        self.assertEqual(totals["tax"], Decimal("2.22"))  # 8.875% of the discounted 25.00
+        self.assertEqual(cart.calculate_total_cents(distance_km=9, promo_code="FREEDEL")["delivery_fee"], 0)
+        with self.assertRaises(ValueError):
+            cart.calculate_total(distance_km=1, promo_code="BOGUS")
+
+    def test_rules_are_compiled_once_and_batch_priced(self):
+        self.assertIs(self.pricing.evaluator("metro"), self.pricing.evaluator("metro"))
+        with self.assertRaises(ValueError):
+            self.pricing.evaluator("mars")
+        carts = []
+        for number in range(200):
+            cart = Cart(pricing=self.pricing, region="suburb")
+            cart.add_item("Bowl", 4.25, number % 7 + 1)
+            carts.append(cart)
+        self.assertEqual(self.pricing.price_carts(carts, region="suburb"),
+                         [cart.calculate_total_cents() for cart in carts])
+
+    def test_payment_method_takes_exact_amounts(self):
+        self.assertTrue(PaymentMethod().process_payment(Decimal("0.01")))
+        self.assertFalse(PaymentMethod().process_payment(Decimal("0.004")))
+
+
+# Unit tests for RestaurantMenu lookups and version-based revalidation
+class TestRestaurantMenu(unittest.TestCase):
+    def setUp(self):
+        self.restaurant_menu = RestaurantMenu(items=[
+            {"id": "m1", "name": "Burger", "price": "8.99", "stock": 3},
+            {"id": "m2", "name": "Pizza", "price": "12.99"},
+            {"id": "m3", "name": "Salad", "price": "6.50", "stock": 0},
+        ])
+        self.cart = Cart()
+        self.order = OrderPlacement(self.cart, UserProfile(delivery_address="123 Main St"), self.restaurant_menu)
+
+    def test_items_by_id_and_name(self):
+        self.assertEqual(self.restaurant_menu.get_item("m1").price_cents, 899)
+        self.assertEqual(self.restaurant_menu.get_item_by_name("Pizza").item_id, "m2")
+        self.assertEqual(self.restaurant_menu.available_items, ["Burger", "Pizza"])
+
+    def test_check_availability_in_one_call(self):
+        self.assertEqual(self.restaurant_menu.check_availability(["Pizza", "Salad", "Pasta", "Burger"]), ["Salad", "Pasta"])
+        self.assertEqual(self.restaurant_menu.check_availability({"Burger": 4, "Pizza": 50}), ["Burger"])
+        self.assertTrue(self.restaurant_menu.is_item_available("Burger", quantity=3))
+
+    def test_version_changes_with_the_menu(self):
+        version = self.restaurant_menu.version
+        self.restaurant_menu.set_stock("m3", 5)
+        self.restaurant_menu.set_price("m2", "13.49")
+        self.restaurant_menu.remove_item("m1")
+        self.assertEqual(self.restaurant_menu.version, version + 3)
+        self.assertFalse(self.restaurant_menu.is_item_available("Burger"))
+
+    def test_reservations_invalidate_earlier_validations(self):
+        self.cart.add_item("Burger", 8.99, 3)
+        self.assertTrue(self.order.validate_order()["success"])
+        InventoryReservations(self.restaurant_menu).reserve({"Burger": 1})
+        self.assertFalse(self.order.is_validation_current())
+        self.assertFalse(self.order.validate_order()["success"])
+
+    def test_available_items_list_stays_writable(self):
+        menu = RestaurantMenu(available_items=["Burger"])
+        menu.available_items.append("Pizza")
+        self.assertTrue(menu.is_item_available("Pizza"))
+        menu.available_items = ["Pizza", "Salad"]
+        self.assertEqual(menu.available_items, ["Pizza", "Salad"])
+        menu.available_items.remove("Salad")
+        self.assertEqual(menu.check_availability(["Burger", "Salad", "Pizza"]), ["Burger", "Salad"])
+
+    def test_checkout_skips_recheck_when_nothing_changed(self):
+        self.cart.add_item("Burger", 8.99, 2)
+        self.assertTrue(self.order.validate_order()["success"])
+        with mock.patch.object(self.restaurant_menu, "check_availability", wraps=self.restaurant_menu.check_availability) as check:
+            self.assertTrue(self.order.confirm_order(PaymentMethod())["success"])
+            check.assert_not_called()
+            self.restaurant_menu.set_stock("m1", 1)
+            result = self.order.confirm_order(PaymentMethod())
+            check.assert_called_once()
+        self.assertEqual(result["message"], "Order validation failed")
+
+    def test_cart_change_forces_recheck(self):
+        self.cart.add_item("Pizza", 12.99, 1)
+        self.order.validate_order()
+        self.cart.add_item("Salad", 6.50, 1)
+        self.assertFalse(self.order.is_validation_current())
+        self.assertFalse(self.order.confirm_order(PaymentMethod())["success"])
+
+
+# Unit tests for InventoryReservations
+class TestInventoryReservations(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.restaurant_menu = RestaurantMenu(items=[
+            {"id": "m1", "name": "Burger", "price": "8.99", "stock": 5},
+            {"id": "m2", "name": "Pizza", "price": "12.99", "stock": 1},
+            {"id": "m3", "name": "Salad", "price": "6.50"},
+        ])
+        self.inventory = InventoryReservations(self.restaurant_menu, ttl_seconds=60, clock=lambda: self.now)
+
+    def stock(self, name):
+        return self.restaurant_menu.get_item_by_name(name).stock
+
+    def test_reserve_is_all_or_nothing(self):
+        result = self.inventory.reserve({"Burger": 2, "Pizza": 2})
+        self.assertEqual(result, {"success": False, "message": "Pizza is not available"})
+        self.assertEqual((self.stock("Burger"), self.stock("Pizza")), (5, 1))
+        result = self.inventory.reserve({"Burger": 2, "Pizza": 1, "Salad": 10})
+        self.assertTrue(result["success"])
+        self.assertEqual((self.stock("Burger"), self.stock("Pizza"), self.stock("Salad")), (3, 0, None))
+
+    def test_commit_and_release(self):
+        kept = self.inventory.reserve({"Burger": 1})["reservation_id"]
+        dropped = self.inventory.reserve({"Burger": 2})["reservation_id"]
+        self.assertTrue(self.inventory.commit(kept))
+        self.assertTrue(self.inventory.release(dropped))
+        self.assertFalse(self.inventory.release(dropped))
+        self.assertEqual(self.stock("Burger"), 4)
+        self.assertEqual(self.inventory.active_reservations(), 0)
+
+    def test_expired_holds_are_swept(self):
+        reservation_id = self.inventory.reserve({"Pizza": 1})["reservation_id"]
+        self.assertEqual(self.inventory.sweep(), 0)
+        self.now = 61
+        self.assertEqual(self.inventory.sweep(), 1)
+        self.assertEqual(self.stock("Pizza"), 1)
+        self.assertFalse(self.inventory.commit(reservation_id))
+
+    def test_background_sweeper(self):
+        inventory = InventoryReservations(self.restaurant_menu, ttl_seconds=0)
+        inventory.reserve({"Burger": 5})
+        inventory.start_sweeper(interval_seconds=0.01)
+        self.addCleanup(inventory.stop_sweeper)
+        deadline = time.monotonic() + 5
+        while self.stock("Burger") != 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.stock("Burger"), 5)
+
+    def test_concurrent_reservations_never_oversell(self):
+        self.restaurant_menu.set_stock("m1", 200)
+        successes, barrier = [], threading.Barrier(8)
+
+        def grab():
+            barrier.wait()
+            for _ in range(50):
+                result = self.inventory.reserve({"Burger": 1, "Salad": 1})
+                if result["success"]:
+                    successes.append(result["reservation_id"])
+
+        threads = [threading.Thread(target=grab) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(successes), 200)
+        self.assertEqual(len(set(successes)), 200)
+        self.assertEqual(self.stock("Burger"), 0)
+
+    def test_confirm_order_holds_the_last_portion(self):
+        orders = []
+        for _ in range(2):
+            cart = Cart()
+            cart.add_item("Pizza", 12.99, 1)
+            order = OrderPlacement(cart, UserProfile(delivery_address="123 Main St"), self.restaurant_menu,
+                                   inventory=self.inventory)
+            self.assertTrue(order.validate_order()["success"])
+            orders.append(order)
+        self.assertTrue(orders[0].confirm_order(PaymentMethod())["success"])
+        # The first order's hold bumped the menu version, so the second one re-validates against the sold-out stock.
+        self.assertEqual(orders[1].confirm_order(PaymentMethod()), {"success": False, "message": "Order validation failed"})
+
+    def test_hold_expiring_during_payment(self):
+        def order_for(name):
+            cart = Cart()
+            cart.add_item(name, 12.99, 1)
+            return OrderPlacement(cart, UserProfile(delivery_address="123 Main St"), self.restaurant_menu,
+                                  inventory=self.inventory)
+
+        def slow_payment(competing_order=None):
+            gateway = StubPaymentGateway(latency_seconds=0)
+
+            def pay(amount):
+                self.now += 61
+                self.inventory.sweep()
+                if competing_order is not None:
+                    self.assertTrue(competing_order.confirm_order(PaymentMethod())["success"])
+                return True
+
+            gateway.process_payment = pay
+            return gateway
+
+        # Stock is still there after the sweep, so the order reserves it again.
+        self.assertTrue(order_for("Burger").confirm_order(slow_payment())["success"])
+        self.assertEqual((self.stock("Burger"), self.inventory.active_reservations()), (4, 0))
+        # Another order took the last pizza in the meantime: no oversell, and the charge is refunded.
+        gateway = slow_payment(competing_order=order_for("Pizza"))
+        result = order_for("Pizza").confirm_order(gateway)
+        self.assertEqual(result, {"success": False, "message": "Items sold out before the order was confirmed",
+                                  "refunded": True})
+        self.assertEqual((self.stock("Pizza"), gateway.refunds), (0, 1))
+
+    def test_refunds_that_do_not_go_through_are_reported(self):
+        class NoRefunds:
+            def process_payment(self, amount):
+                return True
+
+        class DecliningRefunds(PaymentMethod):
+            def refund(self, amount):
+                return False
+
+        class BrokenRefunds(PaymentMethod):
+            def refund(self, amount):
+                raise ConnectionError("gateway unreachable")
+
+        failures = REFUND_FAILURES.value
+        for payment_method in (NoRefunds(), DecliningRefunds(), BrokenRefunds()):
+            self.assertFalse(refund_payment(payment_method, Decimal("12.99")))
+        self.assertTrue(refund_payment(PaymentMethod(), Decimal("12.99")))
+        self.assertEqual(REFUND_FAILURES.value - failures, 3)
+        order = OrderPlacement(Cart(), UserProfile(delivery_address="123 Main St"), self.restaurant_menu,
+                               inventory=self.inventory)
+        with mock.patch.object(order.inventory, "commit", return_value=False):
+            with mock.patch.object(order, "_reserve_again", return_value=False):
+                result = order.settle_order("held", True, refund=lambda: refund_payment(NoRefunds(), Decimal("12.99")))
+        self.assertEqual((result["success"], result["refunded"]), (False, False))
+
+    def test_failed_payment_releases_stock(self):
+        cart = Cart()
+        cart.add_item("Burger", 8.99, 3)
+        order = OrderPlacement(cart, UserProfile(delivery_address="123 Main St"), self.restaurant_menu, inventory=self.inventory)
+        payment_method = PaymentMethod()
+        with mock.patch.object(payment_method, 'process_payment', return_value=False):
+            self.assertEqual(order.confirm_order(payment_method)["message"], "Payment failed")
+        with mock.patch.object(payment_method, 'process_payment', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                order.confirm_order(payment_method)
+        self.assertEqual(self.stock("Burger"), 5)
+
+
+# Unit tests for order ids and the async pipeline
+class TestOrderPipeline(unittest.TestCase):
+    def setUp(self):
+        self.restaurant_menu = RestaurantMenu(items=[
+            {"id": "burger", "name": "Burger", "price": "8.99", "stock": 50},
+            {"id": "pizza", "name": "Pizza", "price": "12.99"},
+        ])
+        self.inventory = InventoryReservations(self.restaurant_menu)
+
+    def make_order(self, name="Pizza", quantity=1):
+        cart = Cart()
+        cart.add_item(name, 12.99, quantity)
+        return OrderPlacement(cart, UserProfile(delivery_address="123 Main St"), self.restaurant_menu,
+                              inventory=self.inventory)
+
+    def test_snowflake_ids_are_unique_and_increasing(self):
+        generator = SnowflakeIdGenerator(worker_id=7)
+        ids = [generator.next_id() for _ in range(10000)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual(SnowflakeIdGenerator.parse(ids[0])[1], 7)
+        with self.assertRaises(ValueError):
+            SnowflakeIdGenerator(worker_id=1024)
+
+    def test_snowflake_rolls_over_a_full_millisecond(self):
+        generator = SnowflakeIdGenerator(worker_id=3, clock=lambda: 1800000000.0)
+        ids = [generator.next_id() for _ in range(5000)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual(SnowflakeIdGenerator.parse(ids[-1])[0], 1800000000001)
+
+    def test_snowflake_survives_a_clock_step_backwards(self):
+        now = [1800000000.0]
+        generator = SnowflakeIdGenerator(worker_id=1, clock=lambda: now[0])
+        first = generator.next_id()
+        now[0] -= 5
+        second = generator.next_id()
+        self.assertGreater(second, first)
+        self.assertEqual(SnowflakeIdGenerator.parse(f"ORD{second}")[0], 1800000000000)
+
+    def test_workers_never_collide(self):
+        first, second = SnowflakeIdGenerator(worker_id=1), SnowflakeIdGenerator(worker_id=2)
+        ids = [generator.next_id() for _ in range(2000) for generator in (first, second)]
+        self.assertEqual(len(set(ids)), len(ids))
+        with self.assertRaises(TypeError):
+            SnowflakeIdGenerator()
+
+    def test_default_generator_needs_a_configured_worker_id(self):
+        with mock.patch.dict(globals(), {"_order_ids": None}), mock.patch.dict(os.environ, clear=True):
+            with self.assertRaises(RuntimeError):
+                self.make_order().confirm_order(PaymentMethod())
+            os.environ["ORDER_WORKER_ID"] = "7"
+            order_id = self.make_order().confirm_order(PaymentMethod())["order_id"]
+            self.assertEqual(SnowflakeIdGenerator.parse(order_id)[1], 7)
+            self.assertEqual(SnowflakeIdGenerator.parse(configure_order_ids(8).next_order_id())[1], 8)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs os.fork")
+    def test_forked_children_need_their_own_worker_id(self):
+        generator = SnowflakeIdGenerator(worker_id=5)
+        generator.next_id()
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                try:
+                    generator.next_id()
+                    outcome = "issued"
+                except RuntimeError:
+                    generator.assign_worker(6)
+                    outcome = str(SnowflakeIdGenerator.parse(generator.next_id())[1])
+                os.write(write_end, outcome.encode())
+            finally:
+                os._exit(0)
+        os.close(write_end)
+        outcome = os.read(read_end, 64).decode()
+        os.close(read_end)
+        os.waitpid(pid, 0)
+        self.assertEqual(outcome, "6")
+        self.assertEqual(SnowflakeIdGenerator.parse(generator.next_id())[1], 5)
+
+    def test_confirm_order_async(self):
+        order = self.make_order()
+        result = asyncio.run(order.confirm_order_async(StubPaymentGateway(latency_seconds=0)))
+        self.assertTrue(result["success"])
+        failed = self.make_order()
+        with mock.patch.object(PaymentMethod, 'process_payment', return_value=False):
+            result = asyncio.run(failed.confirm_order_async(PaymentMethod()))
+        self.assertEqual(result["message"], "Payment failed")
+
+    def test_pipeline_confirms_orders_concurrently(self):
+        class CountingGateway(StubPaymentGateway):
+            in_flight = peak = 0
+
+            async def process_payment_async(self, amount):
+                self.in_flight += 1
+                self.peak = max(self.peak, self.in_flight)
+                try:
+                    return await super().process_payment_async(amount)
+                finally:
+                    self.in_flight -= 1
+
+        gateway = CountingGateway(latency_seconds=0.02)
+
+        async def scenario():
+            async with OrderPipeline(gateway, workers={"payment": 100}, queue_size=16) as pipeline:
+                return await pipeline.confirm_many([self.make_order() for _ in range(500)])
+
+        results = asyncio.run(scenario())
+        self.assertTrue(all(result["success"] for result in results))
+        self.assertEqual(len({result["order_id"] for result in results}), 500)
+        self.assertEqual(gateway.calls, 500)
+        # Payments overlap across the workers but never exceed the configured pool.
+        self.assertGreater(gateway.peak, 1)
+        self.assertLessEqual(gateway.peak, 100)
+
+    def test_slow_payment_applies_backpressure(self):
+        gateway = StubPaymentGateway(latency_seconds=0.05)
+
+        async def scenario():
+            async with OrderPipeline(gateway, workers={"payment": 1}, queue_size=2) as pipeline:
+                futures = [await pipeline.submit(self.make_order()) for _ in range(12)]
+                depths = pipeline.queue_depths()
+                return depths, await asyncio.gather(*futures)
+
+        depths, results = asyncio.run(scenario())
+        self.assertTrue(all(depth <= 2 for depth in depths.values()))
+        self.assertEqual(len(results), 12)
+
+    def test_pipeline_reports_failures_and_releases_stock(self):
+        async def scenario():
+            async with OrderPipeline(StubPaymentGateway(latency_seconds=0)) as pipeline:
+                short = await pipeline.confirm(self.make_order("Burger", 60))
+                with mock.patch.object(StubPaymentGateway, 'process_payment_async', side_effect=ConnectionError):
+                    with self.assertRaises(ConnectionError):
+                        await pipeline.confirm(self.make_order("Burger", 10))
+                return short
+
+        self.assertEqual(asyncio.run(scenario()), {"success": False, "message": "Order validation failed"})
+        self.assertEqual(self.restaurant_menu.get_item("burger").stock, 50)
+        self.assertEqual(self.inventory.active_reservations(), 0)
+
+    def test_cancelled_callers_still_settle_or_release(self):
+        class HeldGateway(StubPaymentGateway):
+            async def process_payment_async(self, amount):
+                self.calls += 1
+                self.charging.set()
+                await self.proceed.wait()
+                return True
+
+        gateway = HeldGateway(latency_seconds=0)
+
+        async def scenario():
+            gateway.charging, gateway.proceed = asyncio.Event(), asyncio.Event()
+            async with OrderPipeline(gateway, workers={"payment": 1}) as pipeline:
+                charged = asyncio.create_task(asyncio.wait_for(pipeline.confirm(self.make_order("Burger", 2)), 1))
+                await gateway.charging.wait()
+                queued = await pipeline.submit(self.make_order("Burger", 3))
+                await asyncio.sleep(0)
+                charged.cancel()
+                queued.cancel()
+                gateway.proceed.set()
+                with self.assertRaises(asyncio.CancelledError):
+                    await charged
+
+        asyncio.run(scenario())
+        # The charged order was still committed; the uncharged one gave its stock back.
+        self.assertEqual(gateway.calls, 1)
+        self.assertEqual(self.restaurant_menu.get_item("burger").stock, 48)
+        self.assertEqual(self.inventory.active_reservations(), 0)
+
+
+# Unit tests for delivery ETA estimation
+class TestEtaService(unittest.TestCase):
+    def setUp(self):
+        self.grid = TravelTimeGrid(reference_lat=40.7)
+        self.geocoder = LocalGeocoder({"123 Main St": (40.7300, -73.9950), "9 Far Rd": (40.8500, -73.9000)})
+        self.eta = EtaService(self.grid, self.geocoder, PrepTimeTracker(default_minutes=12))
+        self.eta.add_restaurant("r1", 40.7128, -74.0060)
+        self.eta.set_courier_availability(total=10, idle=5)
+
+    def test_grid_lookup_matches_the_formula(self):
+        km = math.hypot((40.7300 - 40.7128) * KM_PER_DEGREE, (-73.9950 + 74.0060) * KM_PER_DEGREE * math.cos(math.radians(40.7)))
+        expected = km * 1.3 / 20 * 60
+        self.assertAlmostEqual(self.grid.minutes(40.7128, -74.0060, 40.7300, -73.9950), expected, delta=1.5)
+        self.assertGreater(self.eta.travel_minutes("r1", "9 far rd"), self.eta.travel_minutes("r1", "123  main st"))
+
+    def test_prep_time_moving_average(self):
+        tracker = PrepTimeTracker(alpha=0.5, default_minutes=15)
+        self.assertEqual(tracker.estimate("r1"), 15)
+        tracker.record("r1", 10)
+        tracker.record("r1", 20)
+        self.assertEqual(tracker.estimate("r1"), 15)
+        tracker.record("r1", 25)
+        self.assertEqual(tracker.estimate("r1"), 20)
+
+    def test_kitchen_queue_and_courier_shortage_push_the_eta_out(self):
+        base = self.eta.estimate("r1", "123 Main St")
+        self.eta.set_queue_depth("r1", 8)
+        busy_kitchen = self.eta.estimate("r1", "123 Main St")
+        self.eta.set_queue_depth("r1", 0)
+        self.eta.set_courier_availability(total=2, idle=0, awaiting_courier=3)
+        no_couriers = self.eta.estimate("r1", "123 Main St")
+        self.assertLess(base, busy_kitchen)
+        self.assertEqual(busy_kitchen - base, 24)
+        self.assertLess(base, no_couriers)
+        self.assertIsNone(self.eta.estimate("r1", "1 Unknown Ave"))
+
+    def test_confirm_order_reports_the_service_estimate(self):
+        menu = RestaurantMenu(available_items=["Pizza"], restaurant_id="r1")
+        cart = Cart()
+        cart.add_item("Pizza", 12.99, 1)
+        order = OrderPlacement(cart, UserProfile(delivery_address="123 Main St"), menu, eta_service=self.eta)
+        result = order.confirm_order(PaymentMethod())
+        self.assertEqual(result["estimated_delivery"], f"{self.eta.estimate('r1', '123 Main St')} minutes")
+        self.assertEqual(self.eta.refresh(), {result["order_id"]: self.eta.estimate("r1", "123 Main St")})
+        lost = OrderPlacement(cart, UserProfile(delivery_address="1 Unknown Ave"), menu, eta_service=self.eta)
+        self.assertEqual(lost.confirm_order(PaymentMethod())["estimated_delivery"], "45 minutes")
+
+    def test_delivered_and_cancelled_orders_stop_being_tracked(self):
+        menu = RestaurantMenu(available_items=["Pizza"], restaurant_id="r1")
+        cart = Cart()
+        cart.add_item("Pizza", 12.99, 1)
+        with tempfile.TemporaryDirectory() as directory:
+            store = OrderStore(directory)
+            order_ids = [OrderPlacement(cart, UserProfile(delivery_address="123 Main St"), menu, eta_service=self.eta,
+                                        order_store=store).confirm_order(PaymentMethod())["order_id"] for _ in range(3)]
+            self.assertEqual((self.eta.open_orders(), len(store.listeners)), (3, 1))
+            store.record("dispatched", order_ids[0])
+            store.record("delivered", order_ids[0])
+            store.record("cancelled", order_ids[1])
+            store.close()
+        self.assertEqual(set(self.eta.refresh()), {order_ids[2]})
+
+    def test_refresher_survives_concurrent_tracking(self):
+        refreshes, errors = [], []
+        refresh = self.eta.refresh
+
+        def recording_refresh():
+            try:
+                return refresh()
+            except Exception as error:
+                errors.append(error)
+                raise
+
+        with mock.patch.object(self.eta, "refresh", recording_refresh):
+            self.eta.start_refresher(refreshes.append, interval_seconds=0)
+            self.addCleanup(self.eta.stop_refresher)
+            for round_number in range(20):
+                for number in range(500):
+                    self.eta.track((round_number, number), "r1", "123 Main St")
+                for number in range(500):
+                    self.eta.complete((round_number, number))
+            self.eta.stop_refresher()
+        self.assertEqual(errors, [])
+        self.assertTrue(refreshes)
+
+    def test_refresh_reestimates_all_open_orders(self):
+        for number in range(20000):
+            self.eta.track(number, "r1", "9 Far Rd" if number % 2 else "123 Main St")
+        self.eta.complete(0)
+        before = self.eta.refresh()
+        self.eta.set_queue_depth("r1", 4)
+        # Travel times are kept from track() and the pickup is worked out once per restaurant.
+        with mock.patch.object(self.eta, "pickup_minutes", wraps=self.eta.pickup_minutes) as pickup:
+            with mock.patch.object(self.eta, "travel_minutes", wraps=self.eta.travel_minutes) as travel:
+                after = self.eta.refresh()
+        self.assertEqual((pickup.call_count, travel.call_count), (1, 0))
+        self.assertEqual(len(after), 19999)
+        self.assertEqual(after[1] - before[1], 12)
+
+
+# Unit tests for courier dispatch
+class TestDispatchScheduler(unittest.TestCase):
+    def setUp(self):
+        self.geocoder = LocalGeocoder({
+            "1 Near St": (40.7130, -74.0050),
+            "2 Near St": (40.7135, -74.0045),
+            "9 Far Rd": (40.7400, -73.9700),
+        })
+        self.dispatcher = DispatchScheduler(self.geocoder, bundle_radius_km=1.0)
+        self.dispatcher.add_restaurant("r1", 40.7128, -74.0060)
+
+    def test_grid_returns_the_nearest_couriers_first(self):
+        grid = CourierGrid(cell_km=0.5)
+        for number in range(50):
+            grid.add(number, 40.70 + number * 0.001, -74.0)
+        grid.add(0, 40.80, -74.0)  # moved far away
+        self.assertEqual([courier_id for _, courier_id in grid.nearest(40.7255, -74.0, 3, 5.0)], [25, 26, 24])
+        self.assertEqual(grid.nearest(40.70, -74.0, 3, 0.05), [])
+
+    def test_swaps_improve_on_greedy(self):
+        # Greedy gives A the closest courier (c1, 1.0) and leaves B with c2 (4.1); swapping costs 3.1.
+        degree = 1 / KM_PER_DEGREE
+        bundles = [(0, 0.0, 0.0), (1, 0.0, 3 * degree)]
+        couriers = [("c1", 0.0, 1.0 * degree), ("c2", 0.0, -1.1 * degree)]
+        solved = {bundle: courier for bundle, courier, _ in solve_zone(bundles, couriers, 10.0, 4, time.monotonic() + 1)}
+        self.assertEqual(solved, {0: "c2", 1: "c1"})
+        greedy_only = {bundle: courier for bundle, courier, _ in solve_zone(bundles, couriers, 10.0, 4, 0)}
+        self.assertEqual(greedy_only, {0: "c1", 1: "c2"})
+
+    def test_nearby_orders_from_one_restaurant_share_a_courier(self):
+        for order_id, address in (("o1", "1 Near St"), ("o2", "2 Near St"), ("o3", "9 Far Rd")):
+            self.assertTrue(self.dispatcher.submit(order_id, "r1", address))
+        self.assertFalse(self.dispatcher.submit("o4", "r1", "1 Unknown Ave"))
+        self.dispatcher.update_courier("near", 40.7129, -74.0059)
+        assignments = self.dispatcher.tick()
+        self.assertEqual([(a["courier_id"], a["order_ids"]) for a in assignments], [("near", ["o1", "o2"])])
+        self.assertEqual(self.dispatcher.courier_availability(), (1, 0, 1))
+        self.dispatcher.update_courier("second", 40.7140, -74.0070)
+        self.assertEqual(self.dispatcher.tick()[0]["order_ids"], ["o3"])
+        self.assertEqual(self.dispatcher.pending_orders(), 0)
+
+    def test_confirmed_orders_are_queued_for_dispatch(self):
+        menu = RestaurantMenu(available_items=["Pizza"], restaurant_id="r1")
+        cart = Cart()
+        cart.add_item("Pizza", 12.99, 1)
+        order = OrderPlacement(cart, UserProfile(delivery_address="1 Near St"), menu, dispatcher=self.dispatcher)
+        order_id = order.confirm_order(PaymentMethod())["order_id"]
+        self.dispatcher.update_courier("near", 40.7129, -74.0059)
+        self.assertEqual(self.dispatcher.tick()[0]["order_ids"], [order_id])
+
+    def test_couriers_across_a_zone_line_are_candidates(self):
+        dispatcher = DispatchScheduler(self.geocoder, zone_km=1.0, max_pickup_km=1.0)
+        boundary = 41 / KM_PER_DEGREE  # first latitude of zone row 41
+        dispatcher.add_restaurant("r1", boundary + 0.0005, -74.0)
+        dispatcher.geocoder.add("Edge", boundary + 0.001, -74.0)
+        self.assertTrue(dispatcher.submit("o1", "r1", "Edge"))
+        dispatcher.update_courier("across", boundary - 0.0005, -74.0)
+        dispatcher.update_courier("far", boundary + 0.05, -74.0)
+        self.assertNotEqual(dispatcher._zone(boundary - 0.0005, -74.0), dispatcher._zone(boundary + 0.0005, -74.0))
+        self.assertEqual([a["courier_id"] for a in dispatcher.tick()], ["across"])
+
+    def test_a_courier_offered_to_two_zones_takes_one_bundle(self):
+        dispatcher = DispatchScheduler(self.geocoder, zone_km=1.0, max_pickup_km=1.0)
+        boundary = 41 / KM_PER_DEGREE
+        for restaurant_id, lat in (("south", boundary - 0.002), ("north", boundary + 0.001)):
+            dispatcher.add_restaurant(restaurant_id, lat, -74.0)
+            dispatcher.geocoder.add(restaurant_id, lat, -74.0)
+            self.assertTrue(dispatcher.submit(f"{restaurant_id}-1", restaurant_id, restaurant_id))
+        dispatcher.update_courier("only", boundary, -74.0)
+        self.assertEqual([a["restaurant_id"] for a in dispatcher.tick()], ["north"])
+        self.assertEqual(dispatcher.courier_availability(), (1, 0, 1))
+
+    def test_zones_solve_the_same_through_an_executor(self):
+        def build(executor):
+            rng = random.Random(5)
+            dispatcher = DispatchScheduler(executor=executor, zone_km=2.0, max_bundle_size=1)
+            for restaurant in range(40):
+                dispatcher.add_restaurant(restaurant, 40.70 + rng.random() * 0.1, -74.0 + rng.random() * 0.1)
+                for number in range(10):
+                    dispatcher.geocoder.add(f"{restaurant}-{number}", 40.70 + rng.random() * 0.1, -74.0 + rng.random() * 0.1)
+                    dispatcher.submit(f"{restaurant}-{number}", restaurant, f"{restaurant}-{number}")
+            for courier in range(300):
+                dispatcher.update_courier(courier, 40.70 + rng.random() * 0.1, -74.0 + rng.random() * 0.1)
+            return dispatcher
+
+        inline = build(None).tick(time_budget_seconds=5)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            pooled = build(executor).tick(time_budget_seconds=5)
+        key = lambda assignment: assignment["order_ids"]
+        self.assertEqual(sorted(inline, key=key), sorted(pooled, key=key))
+        self.assertGreater(len(inline), 150)
+        self.assertEqual(len({assignment["courier_id"] for assignment in inline}), len(inline))
+
+
+# Unit tests for the event-sourced order store
+class TestOrderStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.now = [1000.0]
+
+    def open_store(self, **kwargs):
+        store = OrderStore(self.directory.name, clock=lambda: self.now[0], **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+    def test_lifecycle_and_indexes(self):
+        store = self.open_store()
+        store.record("created", "ORD1", "alice", "r1", total="12.99")
+        store.record("created", "ORD2", "alice", "r2")
+        store.record("paid", "ORD1")
+        self.now[0] = 1060.0
+        order = store.record("dispatched", "ORD1", courier="c7")
+        self.assertEqual((order["status"], order["created_at"], order["updated_at"]), ("dispatched", 1000.0, 1060.0))
+        self.assertEqual(order["data"], {"total": "12.99", "courier": "c7"})
+        self.assertEqual([order["order_id"] for order in store.orders_for_user("alice")], ["ORD1", "ORD2"])
+        self.assertEqual([order["order_id"] for order in store.orders_for_restaurant("r2", status="created")], ["ORD2"])
+        with self.assertRaises(ValueError):
+            store.record("delivered", "ORD2")
+        with self.assertRaises(ValueError):
+            store.record("paid", "ORD3")
+
+    def test_records_are_compact(self):
+        record = encode_event("paid", 42, 1000.0, "ORD1234567890123456789")
+        self.assertEqual(len(record), RECORD_HEADER.size + EVENT_BODY.size + 22)
+        self.assertEqual(list(decode_events(record))[0][1]["sequence"], 42)
+
+    def test_reopen_replays_the_log(self):
+        store = self.open_store(sync_every=1000)
+        for number in range(100):
+            store.record("created", f"ORD{number}", f"user{number % 7}", "r1")
+        store.record("cancelled", "ORD5")
+        store.close()
+        self.assertLessEqual(store.log.syncs, 1)
+        reopened = self.open_store()
+        self.assertEqual(reopened.replayed, 101)
+        self.assertEqual(reopened.get("ORD5")["status"], "cancelled")
+        self.assertEqual(len(reopened.orders_for_user("user3")), 14)
+        self.assertEqual(reopened.record("created", "ORD100")["order_id"], "ORD100")
+        self.assertEqual(reopened.sequence, 102)
+
+    def test_snapshots_bound_replay(self):
+        store = self.open_store(snapshot_every=50)
+        for number in range(120):
+            store.record("created", f"ORD{number}", "alice", "r1", number=number)
+        store.close()
+        reopened = self.open_store(snapshot_every=50)
+        self.assertEqual(reopened.replayed, 20)
+        self.assertEqual(len(reopened.orders), 120)
+        self.assertEqual(reopened.get("ORD7")["data"], {"number": 7})
+        self.assertEqual(len(reopened.orders_for_restaurant("r1")), 120)
+
+    def test_torn_tail_is_dropped(self):
+        store = self.open_store()
+        store.record("created", "ORD1", "alice", "r1")
+        store.record("paid", "ORD1")
+        store.close()
+        with open(store.log_path, "ab") as log_file:
+            log_file.write(encode_event("dispatched", 3, 1000.0, "ORD1")[:-3])
+        reopened = self.open_store()
+        self.assertEqual(reopened.get("ORD1")["status"], "paid")
+        reopened.record("cancelled", "ORD1")
+        reopened.close()
+        self.assertEqual(self.open_store().get("ORD1")["status"], "cancelled")
+
+    def test_confirmed_orders_are_recorded(self):
+        store = self.open_store()
+        menu = RestaurantMenu(available_items=["Pizza"], restaurant_id="r1")
+        cart = Cart()
+        cart.add_item("Pizza", 12.99, 1)
+        order = OrderPlacement(cart, UserProfile(delivery_address="123 Main St", user_id="alice"), menu,
+                               order_store=store)
+        order_id = order.confirm_order(PaymentMethod())["order_id"]
+        self.assertEqual(store.get(order_id)["status"], "paid")
+        self.assertEqual(store.orders_for_user("alice")[0]["data"], {"total": "19.29"})
+
+
+# Unit tests for order metrics and spans
+class TestOrderInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.restaurant_menu = RestaurantMenu(available_items=["Burger", "Pizza"])
+        self.addCleanup(setattr, METRICS, "enabled", METRICS.enabled)
+        METRICS.enabled = True
+
+    def make_order(self, *names):
+        cart = Cart()
+        for name in names:
+            cart.add_item(name, 8.99, 1)
+        return OrderPlacement(cart, UserProfile(delivery_address="123 Main St"), self.restaurant_menu)
+
+    def test_confirm_order_records_stage_spans_and_outcomes(self):
+        confirmed = ORDER_OUTCOMES["confirmed"].value
+        failed = ORDER_OUTCOMES["payment_failed"].value
+        order = self.make_order("Burger")
+        order.confirm_order(PaymentMethod())
+        self.assertEqual([span[1] for span in METRICS.trace(order.trace_id)], ["validate", "price", "pay"])
+        declined = self.make_order("Pizza")
+        payment_method = PaymentMethod()
+        with mock.patch.object(payment_method, 'process_payment', return_value=False):
+            declined.confirm_order(payment_method)
+        self.assertEqual(ORDER_OUTCOMES["confirmed"].value, confirmed + 1)
+        self.assertEqual(ORDER_OUTCOMES["payment_failed"].value, failed + 1)
+        self.assertIn('orders_total{outcome="confirmed"}', METRICS.prometheus_text())
+
+    def test_validation_failures_are_counted_unless_disabled(self):
+        unavailable = VALIDATION_FAILURES["item_unavailable"]
+        before = unavailable.value
+        self.make_order("Pasta").confirm_order(PaymentMethod())
+        self.assertEqual(unavailable.value, before + 1)
+        METRICS.enabled = False
+        order = self.make_order("Pasta")
+        order.confirm_order(PaymentMethod())
+        self.assertEqual(unavailable.value, before + 1)
+        self.assertEqual(METRICS.trace(order.trace_id), [])
+
+
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
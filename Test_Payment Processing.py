@@ -1,23 +1,92 @@
 import unittest
 from unittest import mock
+import asyncio
+import csv
+import heapq
+import itertools
+import json
+import random
 import re
 import hashlib
+import os
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+
+from instrumentation import METRICS
+from money import from_cents, to_cents
+
+# Card validators, compiled once at import instead of on every charge
+CARD_NUMBER_PATTERN = re.compile(r"[0-9]{16}")
+EXPIRY_DATE_PATTERN = re.compile(r"(0[1-9]|1[0-2])/[0-9]{2}")
+CVV_PATTERN = re.compile(r"[0-9]{3,4}")
+APPLE_PAY_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9+/=_-]{16,}")
+
+
+def luhn_valid(card_number):
+    """Luhn mod-10 checksum over a string of digits."""
+    total = 0
+    for position, digit in enumerate(reversed(card_number)):
+        value = ord(digit) - 48
+        if position % 2:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return total % 10 == 0
+
+
+# Metrics shared by every PaymentProcessing instance
+PAYMENT_RETRIES = METRICS.counter("payment_retries_total")
+PAYMENTS_REJECTED_BY_CIRCUIT = METRICS.counter("payments_rejected_total", reason="circuit_open")
+
+
+def count_payment_outcome(payment_method, outcome):
+    METRICS.inc("payments_total", method=payment_method, outcome=outcome)
+
 
 # PaymentProcessing Class
 class PaymentProcessing:
-    def __init__(self):
-        self.valid_payment_methods = ["credit_card", "paypal", "apple_pay"]
+    """Validates and dispatches charges through a registry of payment methods.
+
+    methods maps a method name to (handler, required kwargs). A handler given as a string is looked
+    up on the instance at call time, so per-instance overrides (and mocks) still apply. Methods that
+    are valid but have no handler yet are rejected with "Payment method not supported.".
+    """
+
+    def __init__(self, verify_card_checksum=False, gateways=None, idempotency=None, retry_policy=None,
+                 ledger=None, batcher=None):
+        self.valid_payment_methods = {"credit_card", "paypal", "apple_pay"}
+        self.methods = {
+            "credit_card": ("process_credit_card_payment", ("card_number", "expiry_date", "cvv")),
+            "paypal": ("process_paypal_payment", ("paypal_id",)),
+            "apple_pay": ("process_apple_pay_payment", ("payment_token",)),
+        }
+        self.verify_card_checksum = verify_card_checksum  # Luhn check; off by default for test card numbers
+        self.gateways = gateways or {}  # payment method -> GatewayClient used by process_payment_async
+        self.idempotency = idempotency or IdempotencyStore()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._in_flight = {}  # idempotency key -> (request fingerprint, future of the charge running under it)
+        self.ledger = ledger  # optional SettlementLedger receiving every successful charge, sync or async
+        self.batcher = batcher  # optional SettlementBatcher grouping those charges into captures
+
+    def register_method(self, payment_method, handler, fields=()):
+        self.valid_payment_methods.add(payment_method)
+        self.methods[payment_method] = (handler, tuple(fields))
 
     def validate_payment_method(self, payment_method):
         if payment_method not in self.valid_payment_methods:
             raise ValueError(f"{payment_method} is not a valid payment method.")
 
     def validate_card_details(self, card_number, expiry_date, cvv):
-        if not re.match(r"^[0-9]{16}$", card_number):
+        if not CARD_NUMBER_PATTERN.fullmatch(card_number):
+            raise ValueError("Invalid card number.")
+        if self.verify_card_checksum and not luhn_valid(card_number):
             raise ValueError("Invalid card number.")
-        if not re.match(r"^(0[1-9]|1[0-2])/[0-9]{2}$", expiry_date):
+        if not EXPIRY_DATE_PATTERN.fullmatch(expiry_date):
             raise ValueError("Invalid expiry date.")
-        if not re.match(r"^[0-9]{3,4}$", cvv):
+        if not CVV_PATTERN.fullmatch(cvv):
             raise ValueError("Invalid CVV.")
 
     def process_credit_card_payment(self, amount, card_number, expiry_date, cvv):
@@ -29,14 +98,646 @@ class PaymentProcessing:
         # Simulate PayPal API interaction
         return {"status": "success", "message": "Payment successful"}
 
-    def process_payment(self, payment_method, amount, **kwargs):
+    def validate_apple_pay_token(self, payment_token):
+        if not isinstance(payment_token, str) or not APPLE_PAY_TOKEN_PATTERN.fullmatch(payment_token):
+            raise ValueError("Invalid Apple Pay token.")
+
+    def process_apple_pay_payment(self, amount, payment_token):
+        self.validate_apple_pay_token(payment_token)
+        # Simulate Apple Pay token decryption and authorization
+        return {"status": "success", "message": "Payment successful"}
+
+    def _handler_for(self, payment_method):
         self.validate_payment_method(payment_method)
+        method = self.methods.get(payment_method)
+        if method is None:
+            raise ValueError("Payment method not supported.")
+        handler, fields = method
+        if isinstance(handler, str):
+            handler = getattr(self, handler)
+        return handler, fields
+
+    def process_payment(self, payment_method, amount, idempotency_key=None, **kwargs):
+        # Metrics are labelled by registered method only, so bogus input cannot create new series.
+        label = payment_method if isinstance(payment_method, str) and payment_method in self.methods else "invalid"
+        with METRICS.timer("payment_seconds", method=label):
+            try:
+                result = self._process_payment(payment_method, amount, idempotency_key, **kwargs)
+            except Exception:
+                count_payment_outcome(label, "error")
+                raise
+        count_payment_outcome(label, result.get("status", "unknown"))
+        return result
+
+    def _process_payment(self, payment_method, amount, idempotency_key=None, **kwargs):
+        handler, fields = self._handler_for(payment_method)
+        if idempotency_key is None:
+            result = handler(amount, *[kwargs[field] for field in fields])
+            self._settle_local(payment_method, amount, None, result)
+            return result
+        details = {field: kwargs[field] for field in fields}
+        fingerprint = IdempotencyStore.fingerprint({"method": payment_method, "amount": str(amount), **details})
+        result = self.idempotency.get(idempotency_key, fingerprint)
+        if result is None:
+            result = handler(amount, *details.values())
+            self._settle_local(payment_method, amount, idempotency_key, result)
+            self.idempotency.put(idempotency_key, fingerprint, result)
+        return result
+
+    def _settle_local(self, payment_method, amount, idempotency_key, result):
+        # Local handlers return no transaction id; the idempotency key, or a fresh id, stands in for one.
+        if result.get("status") == "success":
+            transaction_id = result.get("transaction_id") or idempotency_key or uuid.uuid4().hex
+            self._settle(payment_method, to_cents(amount), transaction_id)
+
+    async def process_payment_async(self, payment_method, amount, idempotency_key=None, **kwargs):
+        """Validate locally, then charge through the gateway client registered for the method.
+
+        Every charge carries an idempotency key (generated if not given) that is also sent to the
+        gateway, so retries after a timeout can never charge twice. Transport errors are retried per
+        retry_policy; a declined charge is a final answer and is remembered under its key. A successful
+        charge is only remembered once it has been settled, so if settling fails a retry settles again.
+        """
+        _, fields = self._handler_for(payment_method)
+        details = {field: kwargs[field] for field in fields}
         if payment_method == "credit_card":
-            return self.process_credit_card_payment(amount, kwargs['card_number'], kwargs['expiry_date'], kwargs['cvv'])
-        elif payment_method == "paypal":
-            return self.process_paypal_payment(amount, kwargs['paypal_id'])
+            self.validate_card_details(details["card_number"], details["expiry_date"], details["cvv"])
+        elif payment_method == "apple_pay":
+            self.validate_apple_pay_token(details["payment_token"])
+        gateway = self.gateways.get(payment_method)
+        if gateway is None:
+            raise ValueError(f"No gateway configured for {payment_method}.")
+        amount_cents = to_cents(amount)
+        request = {"method": payment_method, "amount": str(from_cents(amount_cents)), **details}
+        key = idempotency_key or uuid.uuid4().hex
+        fingerprint = IdempotencyStore.fingerprint(request)
+        result = self.idempotency.get(key, fingerprint)
+        if result is not None:
+            return result
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            running_fingerprint, running = in_flight
+            if running_fingerprint != fingerprint:
+                raise ValueError("Idempotency key was already used for a different payment.")
+            return await asyncio.shield(running)
+        running = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (fingerprint, running)
+        try:
+            with METRICS.timer("payment_seconds", method=payment_method):
+                result = await self._charge_with_retries(gateway, {**request, "idempotency_key": key})
+            if result.get("status") == "success":
+                self._settle(gateway.name, amount_cents, result["transaction_id"])
+            self.idempotency.put(key, fingerprint, result)
+        except BaseException as error:
+            count_payment_outcome(payment_method, "error")
+            running.set_exception(error)
+            running.exception()  # mark retrieved; concurrent duplicates (if any) still see the error
+            raise
         else:
-            raise ValueError("Payment method not supported.")
+            count_payment_outcome(payment_method, result.get("status", "unknown"))
+            running.set_result(result)
+        finally:
+            del self._in_flight[key]
+        return result
+
+    def _settle(self, gateway_name, amount_cents, transaction_id):
+        entry = (transaction_id, from_cents(amount_cents), gateway_name)
+        if self.ledger is not None:
+            self.ledger.append(entry)
+        if self.batcher is not None:
+            self.batcher.add(gateway_name, entry)
+
+    async def _charge_with_retries(self, gateway, request):
+        attempt = 1
+        while True:
+            try:
+                return await gateway.charge(request)
+            except CircuitOpenError:
+                PAYMENTS_REJECTED_BY_CIRCUIT.inc()
+                raise
+            except GatewayError:
+                if attempt >= self.retry_policy.attempts:
+                    raise
+            PAYMENT_RETRIES.inc()
+            await asyncio.sleep(self.retry_policy.delay(attempt))
+            attempt += 1
+
+
+# IdempotencyStore Class: remembers final charge results per idempotency key
+class IdempotencyStore:
+    """Maps key -> (expires_at, request fingerprint, result) in a dict; lookups are O(1).
+
+    Reusing a key for a different request is a caller bug and raises ValueError rather than
+    returning another charge's result. Entries expire after ttl_seconds and are pruned lazily.
+    """
+
+    def __init__(self, ttl_seconds=24 * 3600, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._results = {}
+        self._puts = 0
+
+    @staticmethod
+    def fingerprint(request):
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key, fingerprint):
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        expires_at, stored_fingerprint, result = entry
+        if expires_at <= self.clock():
+            self._results.pop(key, None)
+            return None
+        if stored_fingerprint != fingerprint:
+            raise ValueError("Idempotency key was already used for a different payment.")
+        return result
+
+    def put(self, key, fingerprint, result):
+        now = self.clock()
+        self._results[key] = (now + self.ttl_seconds, fingerprint, result)
+        self._puts += 1
+        if self._puts % 1024 == 0:
+            for stale in [key for key, entry in self._results.items() if entry[0] <= now]:
+                del self._results[stale]
+
+    def __len__(self):
+        return len(self._results)
+
+
+# RetryPolicy Class: capped exponential backoff with full jitter
+class RetryPolicy:
+    def __init__(self, attempts=3, base_delay=0.05, max_delay=1.0, multiplier=2.0, rng=random.random):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.rng = rng
+
+    def delay(self, attempt):
+        """Sleep before retry number `attempt` (1-based): uniform in [0, min(max_delay, base * multiplier^(attempt-1))]."""
+        return self.rng() * min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+
+
+class GatewayError(RuntimeError):
+    pass
+
+
+class GatewayTimeoutError(GatewayError):
+    pass
+
+
+class CircuitOpenError(GatewayError):
+    pass
+
+
+# CircuitBreaker Class: fail fast while a gateway keeps failing
+class CircuitBreaker:
+    """closed -> open after failure_threshold consecutive failures; open rejects calls immediately.
+
+    After reset_timeout seconds one probe call is let through (half-open): success closes the
+    circuit, failure opens it for another reset_timeout. A probe that ends any other way, e.g.
+    cancelled or with an unexpected error, counts as a failure too, so the circuit never stays
+    half-open with no probe in flight.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=5.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+
+    def before_call(self):
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            return
+        self.rejected += 1
+        raise CircuitOpenError("Gateway circuit is open.")
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = self.clock()
+
+
+# ConnectionPool Class: keep-alive connections to one gateway, reused across charges
+class ConnectionPool:
+    def __init__(self, host, port, max_connections=10, connect_timeout=2.0):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self._idle = []  # (reader, writer) pairs ready for reuse, most recently used last
+        self._slots = asyncio.Semaphore(max_connections)
+        self.opened = 0
+
+    async def acquire(self):
+        await self._slots.acquire()
+        try:
+            while self._idle:
+                reader, writer = self._idle.pop()
+                if not writer.is_closing() and not reader.at_eof():
+                    return reader, writer
+                writer.close()
+            connection = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.connect_timeout)
+            self.opened += 1
+            return connection
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, connection, reusable=True):
+        if reusable and not connection[1].is_closing():
+            self._idle.append(connection)
+        else:
+            connection[1].close()
+        self._slots.release()
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+        for _, writer in idle:
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+# GatewayClient Class: async charges over pooled connections with a per-gateway timeout and limit
+class GatewayClient:
+    """Sends one JSON request per line and reads one JSON response line back.
+
+    max_connections bounds both the pool and the number of charges in flight against this gateway;
+    further callers wait for a free connection. A charge that exceeds timeout raises
+    GatewayTimeoutError and its connection is discarded, since a late reply would desync it.
+    Transport failures feed the gateway's CircuitBreaker; while it is open, charge() raises
+    CircuitOpenError without touching the network.
+    """
+
+    def __init__(self, host, port, timeout=2.0, max_connections=10, breaker=None, name=None):
+        self.name = name or f"{host}:{port}"
+        self.timeout = timeout
+        self.pool = ConnectionPool(host, port, max_connections=max_connections, connect_timeout=timeout)
+        self.breaker = breaker or CircuitBreaker()
+
+    async def charge(self, request):
+        self.breaker.before_call()
+        try:
+            response = await self._send(request)
+        except GatewayError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            if self.breaker.state == CircuitBreaker.HALF_OPEN:
+                self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return response
+
+    async def _send(self, request):
+        try:
+            reader, writer = connection = await self.pool.acquire()
+        except (OSError, asyncio.TimeoutError) as error:
+            raise GatewayError(f"Could not connect to gateway: {error!r}") from error
+        reusable = False
+        try:
+            writer.write(json.dumps(request).encode() + b"\n")
+            line = await asyncio.wait_for(self._exchange(reader, writer), self.timeout)
+            if not line:
+                raise GatewayError("Gateway closed the connection.")
+            reusable = True
+            return json.loads(line)
+        except asyncio.TimeoutError:
+            raise GatewayTimeoutError(f"Gateway did not answer within {self.timeout}s.") from None
+        except ConnectionError as error:
+            raise GatewayError(str(error)) from error
+        finally:
+            self.pool.release(connection, reusable)
+
+    @staticmethod
+    async def _exchange(reader, writer):
+        await writer.drain()
+        return await reader.readline()
+
+    async def close(self):
+        await self.pool.close()
+
+
+# FakeGatewayServer Class: local JSON-lines gateway for tests and benchmarks
+class FakeGatewayServer:
+    """Answers every request after latency_seconds; repeats of an idempotency_key get the first answer."""
+
+    def __init__(self, latency_seconds=0.0, decide=None):
+        self.latency_seconds = latency_seconds
+        self.decide = decide or (lambda request: "success")  # request -> "success" or "failure"
+        self.connections = 0
+        self.requests = []
+        self.charges = {}  # idempotency key -> response, i.e. what the gateway actually charged
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._transaction_ids = itertools.count(1)
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.host, self.port = self._server.sockets[0].getsockname()[:2]
+        return self
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def client(self, **kwargs):
+        return GatewayClient(self.host, self.port, **kwargs)
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                self.requests.append(request)
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                try:
+                    await asyncio.sleep(self.latency_seconds)
+                finally:
+                    self.in_flight -= 1
+                response = await self._respond(request, writer)
+                if response is None:
+                    break
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, request, writer):
+        key = request.get("idempotency_key")
+        if key is not None and key in self.charges:
+            return self.charges[key]
+        status = self.decide(request)
+        response = {
+            "status": status,
+            "message": "Payment successful" if status == "success" else "Payment declined",
+            "transaction_id": f"TX{next(self._transaction_ids)}",
+        }
+        if key is not None:
+            self.charges[key] = response
+        return response
+
+
+# FaultyGatewayServer Class: FakeGatewayServer that injects errors, hangs and latency spikes
+class FaultyGatewayServer(FakeGatewayServer):
+    """Each request independently:
+      - with hang_rate, charges but replies only after hang_seconds (a client-side timeout),
+      - with drop_rate, closes the connection without charging,
+      - with slow_rate, adds slow_seconds of latency before replying normally.
+    While `down` is True every request is dropped, to simulate an outage.
+    """
+
+    def __init__(self, latency_seconds=0.0, decide=None, hang_rate=0.0, hang_seconds=1.0, drop_rate=0.0,
+                 slow_rate=0.0, slow_seconds=0.1, seed=None):
+        super().__init__(latency_seconds, decide)
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.drop_rate = drop_rate
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.down = False
+        self.rng = random.Random(seed)
+        self.faults = {"hang": 0, "drop": 0, "slow": 0}
+
+    async def _respond(self, request, writer):
+        roll = self.rng.random()
+        if self.down or roll < self.drop_rate:
+            self.faults["drop"] += 1
+            return None
+        response = await super()._respond(request, writer)
+        if roll < self.drop_rate + self.hang_rate:
+            self.faults["hang"] += 1
+            await asyncio.sleep(self.hang_seconds)
+        elif roll < self.drop_rate + self.hang_rate + self.slow_rate:
+            self.faults["slow"] += 1
+            await asyncio.sleep(self.slow_seconds)
+        return response
+
+
+# SettlementLedger Class: append-only record of successful charges
+class SettlementLedger:
+    """Entries are (transaction_id, amount, gateway) tuples with Decimal amounts.
+
+    With a path, entries are appended to a CSV file and never rewritten, so the ledger can grow far
+    beyond memory; without one they are kept in a list (tests, small runs). As with OrderEventLog,
+    the file is flushed and fsync'd every sync_every entries and on sync()/close(), so a crash loses
+    at most the last unsynced batch.
+    """
+
+    def __init__(self, path=None, sync_every=64):
+        self.path = path
+        self.sync_every = sync_every
+        self._entries = [] if path is None else None
+        self.count = 0
+        if path is not None and os.path.exists(path):
+            with open(path, newline="") as ledger_file:
+                self.count = sum(1 for _ in csv.reader(ledger_file))
+        self._file = None if path is None else open(path, "a", newline="")
+        self._writer = None if path is None else csv.writer(self._file)
+        self._unsynced = 0
+        self.syncs = 0
+
+    def append(self, entry):
+        transaction_id, amount, gateway = entry
+        if self._writer is not None:
+            self._writer.writerow((transaction_id, amount, gateway))
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every:
+                self.sync()
+        else:
+            self._entries.append((transaction_id, Decimal(amount), gateway))
+        self.count += 1
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def sync(self):
+        if self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self.syncs += 1
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        if self._entries is not None:
+            return iter(self._entries)
+        self.flush()
+        return read_ledger_file(self.path)
+
+    def iter_sorted(self, run_size=100_000):
+        """Entries ordered by transaction id, via an external merge sort of run_size chunks."""
+        return external_sort(iter(self), run_size=run_size)
+
+
+def read_ledger_file(path):
+    with open(path, newline="") as ledger_file:
+        for transaction_id, amount, gateway in csv.reader(ledger_file):
+            yield transaction_id, Decimal(amount), gateway
+
+
+def read_settlement_file(path):
+    """Stream a gateway settlement CSV of (transaction_id, amount) rows as (str, Decimal) pairs."""
+    with open(path, newline="") as settlement_file:
+        for transaction_id, amount in csv.reader(settlement_file):
+            yield transaction_id, Decimal(amount)
+
+
+def external_sort(rows, run_size=100_000):
+    """Sort (transaction_id, amount, ...) rows by transaction id holding at most run_size in memory.
+
+    Full runs are sorted and spilled to temporary CSV files, then lazily merged with heapq.merge.
+    """
+    runs = []
+    try:
+        while True:
+            run = sorted(itertools.islice(rows, run_size), key=lambda row: row[0])
+            if not run:
+                break
+            if not runs and len(run) < run_size:
+                yield from run  # everything fit in one run; no need to touch the disk
+                return
+            spill = tempfile.TemporaryFile("w+", newline="")
+            csv.writer(spill).writerows(run)
+            spill.seek(0)
+            runs.append(spill)
+        readers = [((row[0], Decimal(row[1]), *row[2:]) for row in csv.reader(spill)) for spill in runs]
+        yield from heapq.merge(*readers, key=lambda row: row[0])
+    finally:
+        for spill in runs:
+            spill.close()
+
+
+# SettlementBatcher Class: groups captures per gateway into size- or time-bounded windows
+class SettlementBatcher:
+    """Collects ledger entries per gateway and hands each batch to capture(gateway, entries).
+
+    A gateway's window closes when it holds max_batch_size entries or when its oldest entry is
+    max_wait_seconds old. Size is checked on add(); age on add() and poll(), which callers should
+    invoke periodically. flush() closes every open window (e.g. at end of day or shutdown).
+    """
+
+    def __init__(self, capture, max_batch_size=500, max_wait_seconds=60.0, clock=time.monotonic):
+        self.capture = capture
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.clock = clock
+        self._windows = {}  # gateway -> (opened_at, [entries])
+        self.batches = 0
+        self.captured = 0
+
+    def add(self, gateway, entry):
+        window = self._windows.get(gateway)
+        if window is None:
+            window = self._windows[gateway] = (self.clock(), [])
+        window[1].append(entry)
+        if len(window[1]) >= self.max_batch_size or self.clock() - window[0] >= self.max_wait_seconds:
+            self._close(gateway)
+
+    def poll(self):
+        now = self.clock()
+        for gateway in [gateway for gateway, (opened_at, _) in self._windows.items()
+                        if now - opened_at >= self.max_wait_seconds]:
+            self._close(gateway)
+
+    def flush(self):
+        for gateway in list(self._windows):
+            self._close(gateway)
+
+    def pending(self):
+        return sum(len(entries) for _, entries in self._windows.values())
+
+    def _close(self, gateway):
+        _, entries = self._windows.pop(gateway)
+        self.capture(gateway, entries)
+        self.batches += 1
+        self.captured += len(entries)
+
+
+# Reconciler Class: streaming merge-join of our ledger against a gateway settlement file
+class Reconciler:
+    """Both inputs must be sorted by transaction id; memory use is constant in their length.
+
+    run() yields one (issue, transaction_id, ledger_amount, gateway_amount) tuple per discrepancy,
+    where issue is "missing_at_gateway", "missing_in_ledger" or "amount_mismatch". Counts of every
+    outcome, including matches, are kept in self.counts. Out-of-order input raises ValueError.
+    """
+
+    ISSUES = ("missing_at_gateway", "missing_in_ledger", "amount_mismatch")
+
+    def __init__(self):
+        self.counts = dict.fromkeys(("matched",) + self.ISSUES, 0)
+
+    @staticmethod
+    def _ordered(rows, source):
+        previous = None
+        for row in rows:
+            if previous is not None and row[0] <= previous:
+                raise ValueError(f"{source} is not sorted by transaction id at {row[0]!r}.")
+            previous = row[0]
+            yield row
+
+    def run(self, ledger_rows, gateway_rows):
+        ours = self._ordered(ledger_rows, "Ledger")
+        theirs = self._ordered(gateway_rows, "Settlement file")
+        mine, their = next(ours, None), next(theirs, None)
+        while mine is not None or their is not None:
+            if their is None or (mine is not None and mine[0] < their[0]):
+                self.counts["missing_at_gateway"] += 1
+                yield "missing_at_gateway", mine[0], mine[1], None
+                mine = next(ours, None)
+            elif mine is None or their[0] < mine[0]:
+                self.counts["missing_in_ledger"] += 1
+                yield "missing_in_ledger", their[0], None, their[1]
+                their = next(theirs, None)
+            else:
+                if mine[1] != their[1]:
+                    self.counts["amount_mismatch"] += 1
+                    yield "amount_mismatch", mine[0], mine[1], their[1]
+                else:
+                    self.counts["matched"] += 1
+                mine, their = next(ours, None), next(theirs, None)
 
 
 # Unit tests for PaymentProcessing class
@@ -70,5 +771,421 @@ class TestPaymentProcessing(unittest.TestCase):
             self.payment_processing.process_payment("bitcoin", 100.00, card_number="1234567812345678", expiry_date="12/25", cvv="123")
 
 
+# Unit tests for method dispatch and card validation
+class TestPaymentRegistry(unittest.TestCase):
+    def test_luhn(self):
+        self.assertTrue(luhn_valid("4111111111111111"))
+        self.assertFalse(luhn_valid("4111111111111112"))
+
+    def test_checksum_is_opt_in(self):
+        strict = PaymentProcessing(verify_card_checksum=True)
+        self.assertIsNone(strict.validate_card_details("4111111111111111", "12/25", "123"))
+        with self.assertRaises(ValueError):
+            strict.validate_card_details("1234567812345678", "12/25", "123")
+        with self.assertRaises(ValueError):
+            strict.validate_card_details("4111111111111111\n", "12/25", "123")
+
+    def test_registered_method_dispatch(self):
+        processing = PaymentProcessing()
+        processing.valid_payment_methods.add("venmo")
+        with self.assertRaises(ValueError) as raised:
+            processing.process_payment("venmo", 10.00, token="tok")
+        self.assertEqual(str(raised.exception), "Payment method not supported.")
+        handler = mock.Mock(return_value={"status": "success"})
+        processing.register_method("gift_card", handler, fields=("code",))
+        self.assertEqual(processing.process_payment("gift_card", 5.00, code="GIFT1")["status"], "success")
+        handler.assert_called_once_with(5.00, "GIFT1")
+
+    def test_paypal_dispatch(self):
+        result = PaymentProcessing().process_payment("paypal", 20.00, paypal_id="user@example.com")
+        self.assertEqual(result["status"], "success")
+
+
+# Unit tests for the async gateway client against a local fake gateway
+class TestGatewayClient(unittest.TestCase):
+    def setUp(self):
+        self.card = {"card_number": "4111111111111111", "expiry_date": "12/25", "cvv": "123"}
+
+    def test_charges_reuse_pooled_connections(self):
+        async def scenario():
+            async with FakeGatewayServer(latency_seconds=0.01) as server:
+                client = server.client(max_connections=4)
+                processing = PaymentProcessing(gateways={"credit_card": client})
+                results = await asyncio.gather(*[processing.process_payment_async("credit_card", 10.00, **self.card)
+                                                 for _ in range(40)])
+                await client.close()
+                return server, results
+
+        server, results = asyncio.run(scenario())
+        self.assertTrue(all(result["status"] == "success" for result in results))
+        self.assertEqual(len({result["transaction_id"] for result in results}), 40)
+        self.assertLessEqual(server.connections, 4)
+        self.assertLessEqual(server.max_in_flight, 4)
+        self.assertEqual(set(server.requests[0]), {"method", "amount", "idempotency_key", *self.card})
+        self.assertEqual(server.requests[0]["amount"], "10.00")
+
+    def test_timeout_discards_the_connection(self):
+        async def scenario():
+            async with FakeGatewayServer(latency_seconds=0.2) as server:
+                client = server.client(timeout=0.02, max_connections=1)
+                with self.assertRaises(GatewayTimeoutError):
+                    await client.charge({"method": "paypal", "amount": "1"})
+                server.latency_seconds = 0
+                result = await client.charge({"method": "paypal", "amount": "1"})
+                await client.close()
+                return server, result
+
+        server, result = asyncio.run(scenario())
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(server.connections, 2)
+
+    def test_declines_and_local_validation(self):
+        async def scenario():
+            async with FakeGatewayServer(decide=lambda request: "failure") as server:
+                client = server.client()
+                processing = PaymentProcessing(gateways={"credit_card": client})
+                with self.assertRaises(ValueError):
+                    await processing.process_payment_async("credit_card", 10.00, **{**self.card, "cvv": "1"})
+                with self.assertRaises(ValueError):
+                    await processing.process_payment_async("paypal", 10.00, paypal_id="user@example.com")
+                result = await processing.process_payment_async("credit_card", 10.00, **self.card)
+                await client.close()
+                return server, result
+
+        server, result = asyncio.run(scenario())
+        self.assertEqual(result["status"], "failure")
+        self.assertEqual(len(server.requests), 1)
+
+
+# Unit tests for idempotent, retrying charges and the circuit breaker
+class TestResilientPayments(unittest.TestCase):
+    def setUp(self):
+        self.card = {"card_number": "4111111111111111", "expiry_date": "12/25", "cvv": "123"}
+        self.no_wait = RetryPolicy(attempts=4, base_delay=0.001, rng=lambda: 1.0)
+
+    def test_apple_pay_has_a_dispatch_path(self):
+        processing = PaymentProcessing()
+        self.assertEqual(processing.process_payment("apple_pay", 15.00, payment_token="A" * 32)["status"], "success")
+        with self.assertRaises(ValueError):
+            processing.process_payment("apple_pay", 15.00, payment_token="short")
+
+    def test_sync_idempotency(self):
+        processing = PaymentProcessing()
+        with mock.patch.object(processing, 'process_paypal_payment', return_value={"status": "success"}) as charge:
+            first = processing.process_payment("paypal", 20.00, idempotency_key="k1", paypal_id="a@example.com")
+            second = processing.process_payment("paypal", 20.00, idempotency_key="k1", paypal_id="a@example.com")
+            with self.assertRaises(ValueError):
+                processing.process_payment("paypal", 25.00, idempotency_key="k1", paypal_id="a@example.com")
+        self.assertIs(first, second)
+        self.assertEqual(charge.call_count, 1)
+
+    def test_backoff_is_capped_and_jittered(self):
+        policy = RetryPolicy(base_delay=0.1, max_delay=0.3, rng=lambda: 1.0)
+        self.assertEqual([round(policy.delay(attempt), 3) for attempt in (1, 2, 3, 4)], [0.1, 0.2, 0.3, 0.3])
+        self.assertEqual(RetryPolicy(rng=lambda: 0.0).delay(3), 0.0)
+
+    def test_circuit_breaker_states(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        now[0] = 10
+        breaker.before_call()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_cancelled_or_broken_probes_reopen_the_circuit(self):
+        now = [0.0]
+
+        async def scenario():
+            async with FakeGatewayServer(latency_seconds=0.5) as server:
+                breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+                client = server.client(breaker=breaker)
+                breaker.record_failure()
+                now[0] = 10
+                probe = asyncio.ensure_future(client.charge({"amount": "1.00"}))
+                await asyncio.sleep(0.05)
+                self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+                probe.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await probe
+                states = [breaker.state]
+                now[0] = 20
+                with mock.patch.object(client, "_send", side_effect=json.JSONDecodeError("bad reply", "", 0)):
+                    with self.assertRaises(json.JSONDecodeError):
+                        await client.charge({"amount": "1.00"})
+                states.append(breaker.state)
+                now[0] = 30
+                server.latency_seconds = 0
+                response = await client.charge({"amount": "1.00"})
+                await client.close()
+                return states, response
+
+        states, response = asyncio.run(scenario())
+        self.assertEqual(states, [CircuitBreaker.OPEN, CircuitBreaker.OPEN])
+        self.assertEqual(response["status"], "success")
+
+    def test_timeouts_are_retried_without_double_charging(self):
+        async def scenario():
+            async with FaultyGatewayServer(hang_rate=0.3, hang_seconds=0.2, seed=7) as server:
+                client = server.client(timeout=0.05, breaker=CircuitBreaker(failure_threshold=1000))
+                processing = PaymentProcessing(gateways={"credit_card": client}, retry_policy=self.no_wait)
+                results = await asyncio.gather(*[
+                    processing.process_payment_async("credit_card", 10.00, idempotency_key=f"order-{number}",
+                                                     **self.card)
+                    for number in range(50)
+                ], return_exceptions=True)
+                await client.close()
+                return server, results
+
+        server, results = asyncio.run(scenario())
+        self.assertGreater(server.faults["hang"], 0)
+        succeeded = [result for result in results if isinstance(result, dict)]
+        self.assertGreater(len(succeeded), 45)
+        # However many times a key was retried, the gateway charged it at most once.
+        self.assertEqual(len(server.charges), 50)
+        self.assertEqual(len({result["transaction_id"] for result in succeeded}), len(succeeded))
+
+    def test_duplicate_concurrent_requests_share_one_charge(self):
+        async def scenario():
+            async with FakeGatewayServer(latency_seconds=0.02) as server:
+                client = server.client()
+                processing = PaymentProcessing(gateways={"credit_card": client})
+                results = await asyncio.gather(*[
+                    processing.process_payment_async("credit_card", 10.00, idempotency_key="same", **self.card)
+                    for _ in range(5)
+                ])
+                again = await processing.process_payment_async("credit_card", 10.00, idempotency_key="same",
+                                                               **self.card)
+                await client.close()
+                return server, results + [again]
+
+        server, results = asyncio.run(scenario())
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual({result["transaction_id"] for result in results}, {"TX1"})
+
+    def test_concurrent_reuse_of_a_key_for_another_payment_is_rejected(self):
+        async def scenario():
+            async with FakeGatewayServer(latency_seconds=0.02) as server:
+                client = server.client()
+                processing = PaymentProcessing(gateways={"credit_card": client})
+                outcomes = await asyncio.gather(
+                    processing.process_payment_async("credit_card", 10.00, idempotency_key="same", **self.card),
+                    processing.process_payment_async("credit_card", 99.00, idempotency_key="same", **self.card),
+                    return_exceptions=True,
+                )
+                await client.close()
+                return server, outcomes
+
+        server, (first, reused) = asyncio.run(scenario())
+        self.assertEqual(first["status"], "success")
+        self.assertIsInstance(reused, ValueError)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_open_circuit_fails_fast(self):
+        async def scenario():
+            async with FaultyGatewayServer() as server:
+                server.down = True
+                client = server.client(breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60))
+                processing = PaymentProcessing(gateways={"paypal": client}, retry_policy=self.no_wait)
+                with self.assertRaises(GatewayError):
+                    await processing.process_payment_async("paypal", 5.00, paypal_id="a@example.com")
+                seen = len(server.requests)
+                with self.assertRaises(CircuitOpenError):
+                    await processing.process_payment_async("paypal", 5.00, paypal_id="a@example.com")
+                await client.close()
+                return server, client, seen
+
+        server, client, seen = asyncio.run(scenario())
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(len(server.requests), seen)
+        self.assertEqual(seen, 3)
+        # The first charge tripped the breaker on its third failure, so its fourth attempt was rejected too.
+        self.assertEqual(client.breaker.rejected, 2)
+
+
+# Unit tests for settlement batching and reconciliation
+class TestSettlement(unittest.TestCase):
+    def test_ledger_is_append_only_on_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/ledger.csv"
+            ledger = SettlementLedger(path)
+            ledger.append(("TX2", Decimal("5.00"), "cards"))
+            ledger.append(("TX1", Decimal("7.50"), "cards"))
+            ledger.close()
+            reopened = SettlementLedger(path)
+            self.assertEqual(len(reopened), 2)
+            reopened.append(("TX3", Decimal("1.25"), "wallet"))
+            self.assertEqual(len(reopened), 3)
+            self.assertEqual([entry[0] for entry in reopened], ["TX2", "TX1", "TX3"])
+            self.assertEqual([entry[0] for entry in reopened.iter_sorted(run_size=2)], ["TX1", "TX2", "TX3"])
+            self.assertEqual(next(iter(reopened))[1], Decimal("5.00"))
+            reopened.close()
+
+    def test_ledger_fsyncs_in_batches(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ledger = SettlementLedger(f"{directory}/ledger.csv", sync_every=4)
+            with mock.patch.object(os, "fsync", wraps=os.fsync) as fsync:
+                for number in range(10):
+                    ledger.append((f"TX{number}", Decimal("1.00"), "cards"))
+                self.assertEqual(fsync.call_count, 2)
+                ledger.close()
+            self.assertEqual((fsync.call_count, ledger.syncs), (3, 3))
+
+    def test_synchronous_charges_reach_ledger_and_batches(self):
+        captured = []
+        ledger = SettlementLedger()
+        batcher = SettlementBatcher(lambda gateway, entries: captured.append((gateway, entries)), max_batch_size=2)
+        processing = PaymentProcessing(ledger=ledger, batcher=batcher)
+        processing.process_payment("paypal", 5.00, idempotency_key="order-1", paypal_id="a@example.com")
+        processing.process_payment("paypal", 5.00, idempotency_key="order-1", paypal_id="a@example.com")
+        processing.process_payment("paypal", 2.5, paypal_id="a@example.com")
+        with mock.patch.object(processing, "process_paypal_payment", return_value={"status": "failure"}):
+            processing.process_payment("paypal", 9.00, paypal_id="a@example.com")
+        entries = list(ledger)
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[0], ("order-1", Decimal("5.00"), "paypal"))
+        self.assertEqual(entries[1][1:], (Decimal("2.50"), "paypal"))
+        self.assertEqual(captured, [("paypal", entries)])
+
+    def test_external_sort_merges_spilled_runs(self):
+        rows = [(f"TX{number:06d}", Decimal(number), "cards") for number in random.Random(3).sample(range(1000), 1000)]
+        self.assertEqual(list(external_sort(iter(rows), run_size=64)), sorted(rows))
+
+    def test_batches_close_on_size_and_age(self):
+        now = [0.0]
+        captured = []
+        batcher = SettlementBatcher(lambda gateway, entries: captured.append((gateway, len(entries))),
+                                    max_batch_size=3, max_wait_seconds=10, clock=lambda: now[0])
+        for number in range(4):
+            batcher.add("cards", (f"TX{number}", Decimal("1"), "cards"))
+        batcher.add("wallet", ("TXW", Decimal("1"), "wallet"))
+        self.assertEqual(captured, [("cards", 3)])
+        now[0] = 9
+        batcher.poll()
+        self.assertEqual(batcher.pending(), 2)
+        now[0] = 10
+        batcher.poll()
+        self.assertEqual(sorted(captured), [("cards", 1), ("cards", 3), ("wallet", 1)])
+        self.assertEqual((batcher.batches, batcher.captured, batcher.pending()), (3, 5, 0))
+
+    def test_reconcile_reports_every_kind_of_discrepancy(self):
+        ledger = [("TX1", Decimal("5.00"), "cards"), ("TX2", Decimal("7.50"), "cards"), ("TX4", Decimal("1.00"), "cards")]
+        settlement = [("TX1", Decimal("5.00")), ("TX2", Decimal("7.05")), ("TX3", Decimal("2.00"))]
+        reconciler = Reconciler()
+        self.assertEqual(list(reconciler.run(ledger, settlement)), [
+            ("amount_mismatch", "TX2", Decimal("7.50"), Decimal("7.05")),
+            ("missing_in_ledger", "TX3", None, Decimal("2.00")),
+            ("missing_at_gateway", "TX4", Decimal("1.00"), None),
+        ])
+        self.assertEqual(reconciler.counts["matched"], 1)
+        with self.assertRaises(ValueError):
+            list(Reconciler().run(reversed(ledger), settlement))
+
+    def test_reconcile_streams_large_inputs(self):
+        count = 200_000
+        ledger = ((f"TX{number:09d}", Decimal(number % 100), "cards") for number in range(count))
+        settlement = ((f"TX{number:09d}", Decimal(number % 100)) for number in range(count) if number != 500)
+        reconciler = Reconciler()
+        self.assertEqual([issue[1] for issue in reconciler.run(ledger, settlement)], ["TX000000500"])
+        self.assertEqual(reconciler.counts["matched"], count - 1)
+
+    def test_successful_charges_reach_ledger_and_batches(self):
+        card = {"card_number": "4111111111111111", "expiry_date": "12/25", "cvv": "123"}
+        captured = []
+
+        async def scenario():
+            async with FakeGatewayServer(decide=lambda request: "failure" if request["amount"] == "0.50" else "success") as server:
+                client = server.client(name="cards")
+                ledger = SettlementLedger()
+                batcher = SettlementBatcher(lambda gateway, entries: captured.append((gateway, entries)), max_batch_size=2)
+                processing = PaymentProcessing(gateways={"credit_card": client}, ledger=ledger, batcher=batcher)
+                for key, amount in (("a", 10.00), ("a", 10.00), ("b", 0.50), ("c", 2.25)):
+                    await processing.process_payment_async("credit_card", amount, idempotency_key=key, **card)
+                await client.close()
+                return ledger
+
+        ledger = asyncio.run(scenario())
+        self.assertEqual(list(ledger), [("TX1", Decimal("10.00"), "cards"), ("TX3", Decimal("2.25"), "cards")])
+        self.assertEqual(captured, [("cards", list(ledger))])
+
+    def test_failed_settlement_reaches_duplicates_and_is_retried(self):
+        card = {"card_number": "4111111111111111", "expiry_date": "12/25", "cvv": "123"}
+
+        class BrokenLedger(SettlementLedger):
+            def append(self, entry):
+                raise OSError("disk full")
+
+        async def scenario():
+            async with FakeGatewayServer(latency_seconds=0.01) as server:
+                client = server.client(name="cards")
+                processing = PaymentProcessing(gateways={"credit_card": client}, ledger=BrokenLedger())
+                charges = [processing.process_payment_async("credit_card", 10.00, idempotency_key="a", **card)
+                           for _ in range(2)]
+                outcomes = await asyncio.wait_for(asyncio.gather(*charges, return_exceptions=True), 5)
+                processing.ledger = SettlementLedger()
+                retried = await processing.process_payment_async("credit_card", 10.00, idempotency_key="a", **card)
+                await client.close()
+                return outcomes, retried, processing.ledger, server.charges
+
+        outcomes, retried, ledger, charges = asyncio.run(scenario())
+        self.assertEqual([type(outcome) for outcome in outcomes], [OSError, OSError])
+        self.assertEqual(retried["status"], "success")
+        self.assertEqual(list(ledger), [(retried["transaction_id"], Decimal("10.00"), "cards")])
+        self.assertEqual(len(charges), 1)
+
+
+# Unit tests for payment metrics
+class TestPaymentInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, METRICS, "enabled", METRICS.enabled)
+        METRICS.enabled = True
+
+    def test_outcomes_and_latency_are_recorded_per_method(self):
+        processing = PaymentProcessing()
+        succeeded = METRICS.counter("payments_total", method="paypal", outcome="success").value
+        errors = METRICS.counter("payments_total", method="credit_card", outcome="error").value
+        latency = METRICS.histogram("payment_seconds", method="paypal").count
+        processing.process_payment("paypal", 20.00, paypal_id="a@example.com")
+        with self.assertRaises(ValueError):
+            processing.process_payment("credit_card", 20.00, card_number="1", expiry_date="12/25", cvv="123")
+        self.assertEqual(METRICS.counter("payments_total", method="paypal", outcome="success").value, succeeded + 1)
+        self.assertEqual(METRICS.counter("payments_total", method="credit_card", outcome="error").value, errors + 1)
+        self.assertEqual(METRICS.histogram("payment_seconds", method="paypal").count, latency + 1)
+        self.assertIn('payment_seconds_count{method="paypal"}', METRICS.prometheus_text())
+
+    def test_unknown_methods_share_one_label(self):
+        processing = PaymentProcessing()
+        invalid = METRICS.counter("payments_total", method="invalid", outcome="error").value
+        for number in range(20):
+            with self.assertRaises(ValueError):
+                processing.process_payment(f"bogus-{number}", 1.00)
+        self.assertEqual(METRICS.counter("payments_total", method="invalid", outcome="error").value, invalid + 20)
+        self.assertNotIn('method="bogus-', METRICS.prometheus_text())
+
+    def test_retries_and_circuit_rejections_are_counted(self):
+        retries, rejected = PAYMENT_RETRIES.value, PAYMENTS_REJECTED_BY_CIRCUIT.value
+
+        async def scenario():
+            async with FaultyGatewayServer() as server:
+                server.down = True
+                client = server.client(breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+                processing = PaymentProcessing(gateways={"paypal": client},
+                                               retry_policy=RetryPolicy(attempts=3, base_delay=0.001))
+                with self.assertRaises(CircuitOpenError):
+                    await processing.process_payment_async("paypal", 5.00, paypal_id="a@example.com")
+                await client.close()
+
+        asyncio.run(scenario())
+        self.assertEqual(PAYMENT_RETRIES.value, retries + 2)
+        self.assertEqual(PAYMENTS_REJECTED_BY_CIRCUIT.value, rejected + 1)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,19 +1,1148 @@
+import base64
+import bisect
+import heapq
+import itertools
+import json
+import math
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
 import unittest
+import zlib
+from array import array
+from collections import Counter, OrderedDict
+from collections.abc import Mapping, Sequence
+from unittest import mock
+
+from instrumentation import METRICS
+
+try:
+    import numpy as np
+except ImportError:  # columnar filtering falls back to per-row loops without NumPy
+    np = None
+
+SEARCH_CACHE_HITS = METRICS.counter("search_cache_requests_total", result="hit")
+SEARCH_CACHE_MISSES = METRICS.counter("search_cache_requests_total", result="miss")
+
+# Sample catalog used when a database is created without explicit rows
+SAMPLE_RESTAURANTS = [
+    {"name": "Italian Bistro", "cuisine": "Italian", "location": "Downtown", "rating": 4.5, "price_range": "$$", "delivery": True, "lat": 40.7075, "lon": -74.0113},
+    {"name": "Sushi House", "cuisine": "Japanese", "location": "Midtown", "rating": 4.8, "price_range": "$$$", "delivery": False, "lat": 40.7549, "lon": -73.9840},
+    {"name": "Burger King", "cuisine": "Fast Food", "location": "Uptown", "rating": 4.0, "price_range": "$", "delivery": True, "lat": 40.8007, "lon": -73.9614},
+    {"name": "Taco Town", "cuisine": "Mexican", "location": "Downtown", "rating": 4.2, "price_range": "$", "delivery": True, "lat": 40.7130, "lon": -74.0072},
+    {"name": "Pizza Palace", "cuisine": "Italian", "location": "Uptown", "rating": 3.9, "price_range": "$$", "delivery": True, "lat": 40.7968, "lon": -73.9700}
+]
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    half_dphi = (phi2 - phi1) / 2
+    half_dlambda = math.radians(lon2 - lon1) / 2
+    a = math.sin(half_dphi) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(half_dlambda) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+# RestaurantIndex keeps secondary indexes over the catalog so filters avoid full scans
+class RestaurantIndex:
+    def __init__(self):
+        self.cuisines = {}  # case-folded cuisine -> set of restaurant ids
+        self.locations = {}  # case-folded location -> set of restaurant ids
+        self.ratings = []  # sorted (rating, restaurant_id) pairs for range queries
+        self.rating_of = {}  # restaurant_id -> rating, used to probe the range predicate
+        self.deliveries = {}  # bool(delivery) -> set of restaurant ids
+
+    def add(self, restaurant_id, restaurant):
+        self.cuisines.setdefault(restaurant['cuisine'].lower(), set()).add(restaurant_id)
+        self.locations.setdefault(restaurant['location'].lower(), set()).add(restaurant_id)
+        bisect.insort(self.ratings, (restaurant['rating'], restaurant_id))
+        self.rating_of[restaurant_id] = restaurant['rating']
+        self.deliveries.setdefault(bool(restaurant['delivery']), set()).add(restaurant_id)
+
+    def bulk_load(self, items):
+        """Index many (restaurant_id, restaurant) pairs, sorting the rating list once at the end."""
+        for restaurant_id, restaurant in items:
+            self.cuisines.setdefault(restaurant['cuisine'].lower(), set()).add(restaurant_id)
+            self.locations.setdefault(restaurant['location'].lower(), set()).add(restaurant_id)
+            self.ratings.append((restaurant['rating'], restaurant_id))
+            self.rating_of[restaurant_id] = restaurant['rating']
+            self.deliveries.setdefault(bool(restaurant['delivery']), set()).add(restaurant_id)
+        self.ratings.sort()
+
+    def discard(self, restaurant_id, restaurant):
+        self._discard_posting(self.cuisines, restaurant['cuisine'].lower(), restaurant_id)
+        self._discard_posting(self.locations, restaurant['location'].lower(), restaurant_id)
+        entry = (restaurant['rating'], restaurant_id)
+        position = bisect.bisect_left(self.ratings, entry)
+        if position < len(self.ratings) and self.ratings[position] == entry:
+            del self.ratings[position]
+        self.rating_of.pop(restaurant_id, None)
+        self._discard_posting(self.deliveries, bool(restaurant['delivery']), restaurant_id)
+
+    def _discard_posting(self, postings, key, restaurant_id):
+        ids = postings.get(key)
+        if ids is not None:
+            ids.discard(restaurant_id)
+            if not ids:
+                del postings[key]
+
+    def _rating_start(self, min_rating):
+        # Every id is >= 0, so (min_rating, -1) sorts before any entry with that rating.
+        return bisect.bisect_left(self.ratings, (min_rating, -1))
+
+    def query(self, cuisine_type=None, location=None, min_rating=None, delivery=None, restaurant_ids=None):
+        """Return the sorted ids matching every given predicate (None means "no filter").
+
+        restaurant_ids, when given, is a set of candidate ids from another index (e.g. a name prefix).
+        """
+        predicates = []
+        if restaurant_ids is not None:
+            predicates.append(restaurant_ids)
+        if cuisine_type is not None:
+            predicates.append(self.cuisines.get(cuisine_type.lower(), set()))
+        if location is not None:
+            predicates.append(self.locations.get(location.lower(), set()))
+        rating_start = None
+        if min_rating is not None:
+            rating_start = self._rating_start(min_rating)
+            predicates.append(len(self.ratings) - rating_start)
+        if delivery is not None:
+            predicates.append(self.deliveries.get(bool(delivery), set()))
+        if not predicates:
+            return sorted(self.rating_of)
+
+        # Start from the most selective predicate and probe the others per candidate.
+        predicates.sort(key=lambda predicate: predicate if isinstance(predicate, int) else len(predicate))
+        first = predicates[0]
+        if isinstance(first, int):
+            candidates = [restaurant_id for _, restaurant_id in self.ratings[rating_start:]]
+        else:
+            candidates = first
+        rating_of = self.rating_of
+        for predicate in predicates[1:]:
+            if isinstance(predicate, int):
+                candidates = [restaurant_id for restaurant_id in candidates if rating_of[restaurant_id] >= min_rating]
+            else:
+                candidates = [restaurant_id for restaurant_id in candidates if restaurant_id in predicate]
+        return sorted(candidates)
+
+    def predicate(self, cuisine_type=None, location=None, min_rating=None, delivery=None):
+        """Return a per-id membership test for the given filters, or None when nothing is filtered."""
+        checks = []
+        if cuisine_type is not None:
+            checks.append(self.cuisines.get(cuisine_type.lower(), set()).__contains__)
+        if location is not None:
+            checks.append(self.locations.get(location.lower(), set()).__contains__)
+        if min_rating is not None:
+            rating_of = self.rating_of
+            checks.append(lambda restaurant_id: rating_of[restaurant_id] >= min_rating)
+        if delivery is not None:
+            checks.append(self.deliveries.get(bool(delivery), set()).__contains__)
+        if not checks:
+            return None
+        return lambda restaurant_id: all(check(restaurant_id) for check in checks)
+
+
+# GeoGridIndex buckets restaurant coordinates into fixed-size cells for radius and k-nearest queries
+class GeoGridIndex:
+    def __init__(self, cell_km=1.0):
+        self.cell_km = cell_km
+        self.cell_degrees = cell_km / KM_PER_DEGREE
+        self.cells = {}  # (row, column) -> {restaurant_id: (lat, lon)}
+        self.cell_of_id = {}  # restaurant_id -> (row, column)
+        self._extent = None  # occupied (min_row, max_row, min_column, max_column), grow-only
+
+    def __len__(self):
+        return len(self.cell_of_id)
+
+    def cell_of(self, lat, lon):
+        return (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees))
+
+    def add(self, restaurant_id, restaurant):
+        lat, lon = restaurant.get('lat'), restaurant.get('lon')
+        if lat is None or lon is None:
+            return
+        cell = self.cell_of(lat, lon)
+        self.cells.setdefault(cell, {})[restaurant_id] = (lat, lon)
+        self.cell_of_id[restaurant_id] = cell
+        self._grow_extent(cell, cell)
+
+    def discard(self, restaurant_id, restaurant):
+        cell = self.cell_of_id.pop(restaurant_id, None)
+        if cell is not None:
+            points = self.cells[cell]
+            del points[restaurant_id]
+            if not points:
+                del self.cells[cell]
+
+    def bulk_load(self, items):
+        """Index many (restaurant_id, restaurant) pairs, computing cells in one pass."""
+        cells, cell_of_id, cell_degrees, floor = self.cells, self.cell_of_id, self.cell_degrees, math.floor
+        for restaurant_id, restaurant in items:
+            lat, lon = restaurant.get('lat'), restaurant.get('lon')
+            if lat is None or lon is None:
+                continue
+            cell = (floor(lat / cell_degrees), floor(lon / cell_degrees))
+            points = cells.get(cell)
+            if points is None:
+                points = cells[cell] = {}
+            points[restaurant_id] = (lat, lon)
+            cell_of_id[restaurant_id] = cell
+        if cells:
+            rows = [row for row, _ in cells]
+            columns = [column for _, column in cells]
+            self._grow_extent((min(rows), min(columns)), (max(rows), max(columns)))
+
+    def _grow_extent(self, low, high):
+        if self._extent is None:
+            self._extent = (low[0], high[0], low[1], high[1])
+        else:
+            min_row, max_row, min_column, max_column = self._extent
+            self._extent = (min(min_row, low[0]), max(max_row, high[0]), min(min_column, low[1]), max(max_column, high[1]))
+
+    def _ring(self, center_row, center_column, ring):
+        if ring == 0:
+            yield (center_row, center_column)
+            return
+        for column in range(center_column - ring, center_column + ring + 1):
+            yield (center_row - ring, column)
+            yield (center_row + ring, column)
+        for row in range(center_row - ring + 1, center_row + ring):
+            yield (row, center_column - ring)
+            yield (row, center_column + ring)
+
+    def _ring_lower_bound_km(self, lat, ring):
+        # Points in ring r are at least r - 1 whole cells away; longitude cells narrow toward the poles.
+        if ring <= 1:
+            return 0.0
+        shrink = math.cos(math.radians(min(89.9, abs(lat) + ring * self.cell_degrees)))
+        return (ring - 1) * self.cell_km * shrink
+
+    def nearest(self, lat, lon, radius_km=None, k=None, predicate=None):
+        """Return up to k (distance_km, restaurant_id) pairs within radius_km, nearest first.
+
+        Cells are visited in rings around the query point, so the search stops as soon as
+        no unvisited cell can hold a closer match. Longitude wrap-around is not handled.
+        """
+        if radius_km is None and k is None:
+            raise ValueError("search_nearby needs a radius, a result count, or both")
+        if not self.cells or k == 0:
+            return []
+        center_row, center_column = self.cell_of(lat, lon)
+        min_row, max_row, min_column, max_column = self._extent
+        last_ring = max(abs(center_row - min_row), abs(center_row - max_row),
+                        abs(center_column - min_column), abs(center_column - max_column))
+        best = []  # max-heap of (-distance, -restaurant_id) when k is set, plain list otherwise
+
+        def consider(points):
+            for restaurant_id, (point_lat, point_lon) in points.items():
+                if predicate is not None and not predicate(restaurant_id):
+                    continue
+                distance = haversine_km(lat, lon, point_lat, point_lon)
+                if radius_km is not None and distance > radius_km:
+                    continue
+                if k is None:
+                    best.append((distance, restaurant_id))
+                elif len(best) < k:
+                    heapq.heappush(best, (-distance, -restaurant_id))
+                elif (-distance, -restaurant_id) > best[0]:
+                    heapq.heapreplace(best, (-distance, -restaurant_id))
+
+        for ring in range(last_ring + 1):
+            bound = self._ring_lower_bound_km(lat, ring)
+            if radius_km is not None and bound > radius_km:
+                break
+            if k is not None and len(best) == k and bound > -best[0][0]:
+                break
+            if 8 * ring > len(self.cells):
+                # The ring is wider than the occupied grid: sweep the remaining cells directly.
+                for (row, column), points in self.cells.items():
+                    if max(abs(row - center_row), abs(column - center_column)) >= ring:
+                        consider(points)
+                break
+            for cell in self._ring(center_row, center_column, ring):
+                points = self.cells.get(cell)
+                if points:
+                    consider(points)
+
+        if k is None:
+            return sorted(best)
+        return sorted((-distance, -restaurant_id) for distance, restaurant_id in best)
+
+
+# RestaurantNameIndex answers type-ahead prefix lookups and typo-tolerant trigram matches on names
+class RestaurantNameIndex:
+    def __init__(self):
+        self.prefixes = []  # sorted (folded name from a word start onward, restaurant_id)
+        self.trigrams = {}  # trigram -> set of restaurant ids
+        self.names = {}  # restaurant_id -> folded name
+        self.gram_counts = {}  # restaurant_id -> number of distinct trigrams in the name
+
+    @staticmethod
+    def fold(name):
+        return " ".join(name.lower().split())
+
+    @staticmethod
+    def trigrams_of(folded):
+        # Words are padded like pg_trgm ("  word "), so short words and word starts still produce grams.
+        grams = set()
+        for word in folded.split(" "):
+            if word:
+                padded = f"  {word} "
+                grams.update(padded[position:position + 3] for position in range(len(padded) - 2))
+        return grams
+
+    @staticmethod
+    def _word_suffixes(folded):
+        # One prefix entry per word start, so "bis" finds "Italian Bistro".
+        start = 0
+        for word in folded.split(" "):
+            yield folded[start:]
+            start += len(word) + 1
+
+    def add(self, restaurant_id, restaurant):
+        folded = self.fold(restaurant['name'])
+        self.names[restaurant_id] = folded
+        for suffix in self._word_suffixes(folded):
+            bisect.insort(self.prefixes, (suffix, restaurant_id))
+        grams = self.trigrams_of(folded)
+        self.gram_counts[restaurant_id] = len(grams)
+        for gram in grams:
+            self.trigrams.setdefault(gram, set()).add(restaurant_id)
+
+    def bulk_load(self, items):
+        """Index many (restaurant_id, restaurant) pairs, sorting the prefix list once at the end."""
+        for restaurant_id, restaurant in items:
+            folded = self.fold(restaurant['name'])
+            self.names[restaurant_id] = folded
+            self.prefixes.extend((suffix, restaurant_id) for suffix in self._word_suffixes(folded))
+            grams = self.trigrams_of(folded)
+            self.gram_counts[restaurant_id] = len(grams)
+            for gram in grams:
+                self.trigrams.setdefault(gram, set()).add(restaurant_id)
+        self.prefixes.sort()
+
+    def discard(self, restaurant_id, restaurant):
+        folded = self.names.pop(restaurant_id, None)
+        if folded is None:
+            return
+        del self.gram_counts[restaurant_id]
+        for suffix in self._word_suffixes(folded):
+            position = bisect.bisect_left(self.prefixes, (suffix, restaurant_id))
+            if position < len(self.prefixes) and self.prefixes[position] == (suffix, restaurant_id):
+                del self.prefixes[position]
+        for gram in self.trigrams_of(folded):
+            ids = self.trigrams.get(gram)
+            if ids is not None:
+                ids.discard(restaurant_id)
+                if not ids:
+                    del self.trigrams[gram]
+
+    def prefix_ids(self, prefix, limit=None):
+        """Return ids whose name has a word starting with prefix, ordered by the matched text, without duplicates."""
+        folded = self.fold(prefix)
+        prefixes = self.prefixes
+        position = bisect.bisect_left(prefixes, (folded,))
+        found = {}  # insertion-ordered set
+        while position < len(prefixes) and (limit is None or len(found) < limit):
+            suffix, restaurant_id = prefixes[position]
+            if not suffix.startswith(folded):
+                break
+            found[restaurant_id] = None
+            position += 1
+        return list(found)
+
+    def fuzzy(self, query, limit=10, threshold=0.3):
+        """Return up to limit (similarity, restaurant_id) pairs, best first.
+
+        Similarity is the Jaccard overlap of trigram sets. A match needs at least
+        ceil(threshold * |query grams|) shared grams, so it must contain one of the rarest
+        |query grams| - that + 1 grams; only those posting lists generate candidates, and the
+        remaining common grams are probed just for candidates that can still reach the threshold.
+        """
+        query_grams = self.trigrams_of(self.fold(query))
+        if not query_grams:
+            return []
+        query_size = len(query_grams)
+        needed = max(1, math.ceil(threshold * query_size))
+        rarest_first = sorted(query_grams, key=lambda gram: len(self.trigrams.get(gram, ())))
+        split = query_size - needed + 1
+        counts = Counter()
+        for gram in rarest_first[:split]:
+            counts.update(self.trigrams.get(gram, ()))
+        common = [self.trigrams.get(gram, set()) for gram in rarest_first[split:]]
+        # Jaccard >= t bounds the candidate's gram count to [t * |Q|, |Q| / t]; t = 0 leaves it unbounded.
+        smallest = threshold * query_size
+        largest = query_size / threshold if threshold > 0 else float("inf")
+        gram_counts = self.gram_counts
+        scored = []
+        for restaurant_id, shared in counts.items():
+            name_size = gram_counts[restaurant_id]
+            if name_size < smallest or name_size > largest:
+                continue
+            required = threshold * (query_size + name_size) / (1 + threshold)
+            if shared + len(common) < required:
+                continue
+            shared += sum(1 for ids in common if restaurant_id in ids)
+            similarity = shared / (query_size + name_size - shared)
+            if similarity >= threshold:
+                scored.append((similarity, -restaurant_id))
+        return [(similarity, -negated_id) for similarity, negated_id in heapq.nlargest(limit, scored)]
+
+
+# Catalog snapshot: CATALOG_HEADER, a directory of CATALOG_BLOCK entries, then the blocks, each 8-byte aligned.
+# Column blocks are the raw buffers of ColumnarRestaurantDatabase in the writer's native byte order, so opening
+# one is a cast of the mapped file; the header records that order and a machine with the other one refuses the
+# file. String tables are a u32 count, count + 1 u32 offsets and the UTF-8 bytes. The crc32 covers everything
+# after the header.
+CATALOG_HEADER = struct.Struct("<4sHHQIc")  # magic, version, block count, row count, crc32, b"<" or b">"
+CATALOG_BYTE_ORDER = b"<" if sys.byteorder == "little" else b">"
+CATALOG_BLOCK = struct.Struct("<4sQQ")  # tag, offset, length
+CATALOG_MAGIC = b"RCAT"
+CELL_KEY_BIAS = 1 << 31  # grid cells are stored as one u64, (row + bias) << 32 | (column + bias)
+
+
+def _cell_key(row, column):
+    return (row + CELL_KEY_BIAS) << 32 | (column + CELL_KEY_BIAS)
+
+
+def _pack_string_table(values):
+    encoded = [value.encode() for value in values]
+    offsets = array('I', [0])
+    offsets.extend(itertools.accumulate(len(value) for value in encoded))
+    return struct.pack("<I", len(encoded)) + offsets.tobytes() + b"".join(encoded)
+
+
+# StringTable is a read-only sequence over a string table block of a catalog snapshot
+class StringTable(Sequence):
+    def __init__(self, block):
+        count = struct.unpack_from("<I", block)[0]
+        self._offsets = block[4:8 + 4 * count].cast('I')
+        self._data = block[8 + 4 * count:]
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, position):
+        return str(self._data[self._offsets[position]:self._offsets[position + 1]], "utf-8")
+
+
+# SortedIds wraps a mapped posting list; membership is a binary search instead of a scan
+class SortedIds(Sequence):
+    __slots__ = ("_ids",)
+
+    def __init__(self, ids):
+        self._ids = ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, position):
+        return self._ids[position]
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __contains__(self, restaurant_id):
+        position = bisect.bisect_left(self._ids, restaurant_id)
+        return position < len(self._ids) and self._ids[position] == restaurant_id
+
+
+# SnapshotCells maps grid cells to {restaurant_id: (lat, lon)}, decoding a cell only when it is visited
+class SnapshotCells(Mapping):
+    def __init__(self, keys, starts, ids, lats, lons):
+        self._keys = keys  # sorted cell keys
+        self._starts = starts  # cell i holds ids[starts[i]:starts[i + 1]]
+        self._ids = ids
+        self._lats = lats
+        self._lons = lons
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        for key in self._keys:
+            yield (key >> 32) - CELL_KEY_BIAS, (key & 0xFFFFFFFF) - CELL_KEY_BIAS
+
+    def __getitem__(self, cell):
+        key = _cell_key(*cell)
+        position = bisect.bisect_left(self._keys, key)
+        if position == len(self._keys) or self._keys[position] != key:
+            raise KeyError(cell)
+        lats, lons = self._lats, self._lons
+        return {restaurant_id: (lats[restaurant_id], lons[restaurant_id])
+                for restaurant_id in self._ids[self._starts[position]:self._starts[position + 1]]}
+
+
+# SnapshotPrefixes is the sorted (suffix, restaurant_id) list of RestaurantNameIndex, read from a snapshot
+class SnapshotPrefixes(Sequence):
+    def __init__(self, folded, starts, ends, ids, offsets):
+        self._folded = folded  # folded UTF-8 names; row i is folded[starts[i]:ends[i]]
+        self._starts = starts
+        self._ends = ends
+        self._ids = ids
+        self._offsets = offsets  # byte offset of the word start inside the folded name
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, position):
+        restaurant_id = self._ids[position]
+        start = self._starts[restaurant_id] + self._offsets[position]
+        return str(self._folded[start:self._ends[restaurant_id]], "utf-8"), restaurant_id
+
+
+# SnapshotPostings maps a trigram to the sorted ids of the names that contain it
+class SnapshotPostings(Mapping):
+    def __init__(self, grams, starts, ids):
+        self._grams = grams  # sorted StringTable
+        self._starts = starts
+        self._ids = ids
+
+    def __len__(self):
+        return len(self._grams)
+
+    def __iter__(self):
+        return iter(self._grams)
+
+    def __getitem__(self, gram):
+        position = bisect.bisect_left(self._grams, gram)
+        if position == len(self._grams) or self._grams[position] != gram:
+            raise KeyError(gram)
+        return SortedIds(self._ids[self._starts[position]:self._starts[position + 1]])
+
+
+# SnapshotExtras maps restaurant ids to their extra fields, decoding a row's JSON the first time it is read
+class SnapshotExtras(Mapping):
+    def __init__(self, ids, table):
+        self._ids = ids  # sorted ids of the rows that have extras
+        self._table = table  # StringTable with each row's extras as JSON, in id order
+        self._decoded = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __contains__(self, restaurant_id):
+        return self._position(restaurant_id) is not None
+
+    def __getitem__(self, restaurant_id):
+        extras = self._decoded.get(restaurant_id)
+        if extras is None:
+            position = self._position(restaurant_id)
+            if position is None:
+                raise KeyError(restaurant_id)
+            extras = self._decoded[restaurant_id] = json.loads(self._table[position])
+        return extras
+
+    def _position(self, restaurant_id):
+        position = bisect.bisect_left(self._ids, restaurant_id)
+        if position < len(self._ids) and self._ids[position] == restaurant_id:
+            return position
+        return None
+
+
+# SnapshotGeoIndex is a read-only GeoGridIndex whose cells live in a mapped catalog snapshot
+class SnapshotGeoIndex(GeoGridIndex):
+    def __init__(self, cell_km, extent, cells, count):
+        super().__init__(cell_km)
+        self.cells = cells
+        self._extent = tuple(extent) if extent else None
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+
+# SnapshotNameIndex is a read-only RestaurantNameIndex whose lists live in a mapped catalog snapshot
+class SnapshotNameIndex(RestaurantNameIndex):
+    def __init__(self, prefixes, trigrams, gram_counts):
+        super().__init__()
+        self.prefixes = prefixes
+        self.trigrams = trigrams
+        self.gram_counts = gram_counts  # indexed by restaurant id
+
 
 # RestaurantDatabase class simulates an in-memory database storing restaurant information
 class RestaurantDatabase:
-    def __init__(self):
-        self.restaurants = [
-            {"name": "Italian Bistro", "cuisine": "Italian", "location": "Downtown", "rating": 4.5, "price_range": "$$", "delivery": True},
-            {"name": "Sushi House", "cuisine": "Japanese", "location": "Midtown", "rating": 4.8, "price_range": "$$$", "delivery": False},
-            {"name": "Burger King", "cuisine": "Fast Food", "location": "Uptown", "rating": 4.0, "price_range": "$", "delivery": True},
-            {"name": "Taco Town", "cuisine": "Mexican", "location": "Downtown", "rating": 4.2, "price_range": "$", "delivery": True},
-            {"name": "Pizza Palace", "cuisine": "Italian", "location": "Uptown", "rating": 3.9, "price_range": "$$", "delivery": True}
-        ]
+    def __init__(self, restaurants=None):
+        if restaurants is None:
+            restaurants = [dict(restaurant) for restaurant in SAMPLE_RESTAURANTS]
+        self.index = RestaurantIndex()
+        self.indexes = [self.index]  # every index here is told about each add/discard
+        self._geo_index = None
+        self._name_index = None
+        self._rows = {}  # restaurant_id -> restaurant; ids grow with insertion order, removal is one pop
+        self._next_id = 0
+        self.add_restaurants(restaurants)
+
+    @property
+    def geo_index(self):
+        # Built in bulk on first use, then maintained incrementally with the other indexes.
+        if self._geo_index is None:
+            self._geo_index = GeoGridIndex()
+            self._geo_index.bulk_load(self._rows.items())
+            self.indexes.append(self._geo_index)
+        return self._geo_index
+
+    @property
+    def name_index(self):
+        if self._name_index is None:
+            self._name_index = RestaurantNameIndex()
+            self._name_index.bulk_load(self._rows.items())
+            self.indexes.append(self._name_index)
+        return self._name_index
+
+    @property
+    def restaurants(self):
+        # A fresh list in insertion order, as ColumnarRestaurantDatabase.get_restaurants returns.
+        return list(self._rows.values())
 
     def get_restaurants(self):
         return self.restaurants
 
+    def get_restaurant(self, restaurant_id):
+        return self._rows[restaurant_id]
+
+    # Rows must be changed through these methods so the index stays in sync.
+    def add_restaurant(self, restaurant):
+        restaurant_id = self._next_id
+        self._next_id += 1
+        self._rows[restaurant_id] = restaurant
+        for index in self.indexes:
+            index.add(restaurant_id, restaurant)
+        return restaurant_id
+
+    def add_restaurants(self, restaurants):
+        """Bulk insert: each index is built in one pass instead of row by row."""
+        first_id = self._next_id
+        for restaurant in restaurants:
+            self._rows[self._next_id] = restaurant
+            self._next_id += 1
+        added = [(restaurant_id, self._rows[restaurant_id]) for restaurant_id in range(first_id, self._next_id)]
+        for index in self.indexes:
+            index.bulk_load(added)
+        return list(range(first_id, self._next_id))
+
+    def update_restaurant(self, restaurant_id, **changes):
+        restaurant = self._rows[restaurant_id]
+        for index in self.indexes:
+            index.discard(restaurant_id, restaurant)
+        restaurant.update(changes)
+        for index in self.indexes:
+            index.add(restaurant_id, restaurant)
+        return restaurant
+
+    def remove_restaurant(self, restaurant_id):
+        restaurant = self._rows.pop(restaurant_id)
+        for index in self.indexes:
+            index.discard(restaurant_id, restaurant)
+        return restaurant
+
+    def select_ids(self, cuisine_type=None, location=None, min_rating=None, delivery=None, restaurant_ids=None):
+        return self.index.query(cuisine_type=cuisine_type, location=location, min_rating=min_rating,
+                                delivery=delivery, restaurant_ids=restaurant_ids)
+
+    def select(self, cuisine_type=None, location=None, min_rating=None, delivery=None, restaurant_ids=None):
+        ids = self.select_ids(cuisine_type=cuisine_type, location=location, min_rating=min_rating,
+                              delivery=delivery, restaurant_ids=restaurant_ids)
+        return [self._rows[restaurant_id] for restaurant_id in ids]
+
+    def predicate(self, cuisine_type=None, location=None, min_rating=None, delivery=None):
+        return self.index.predicate(cuisine_type=cuisine_type, location=location, min_rating=min_rating, delivery=delivery)
+
+
+# StringDictionary encodes repeated strings as small integer codes
+class StringDictionary:
+    def __init__(self):
+        self.values = []  # code -> original spelling
+        self.codes = {}  # original spelling -> code
+        self.folded = {}  # case-folded spelling -> codes of every spelling that folds to it
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.codes[value] = code
+            self.folded.setdefault(value.lower(), []).append(code)
+        return code
+
+    def lookup(self, value):
+        return self.folded.get(value.lower(), [])
+
+
+# RestaurantRow is a read-only dict-like view that decodes a columnar row on access
+class RestaurantRow(Mapping):
+    __slots__ = ("_catalog", "restaurant_id")
+
+    def __init__(self, catalog, restaurant_id):
+        self._catalog = catalog
+        self.restaurant_id = restaurant_id
+
+    def __getitem__(self, key):
+        return self._catalog.get_value(self.restaurant_id, key)
+
+    def __iter__(self):
+        return iter(self._catalog.row_keys(self.restaurant_id))
+
+    def __len__(self):
+        return len(self._catalog.row_keys(self.restaurant_id))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+# ColumnarRestaurantDatabase stores the catalog as typed column arrays instead of one dict per row
+class ColumnarRestaurantDatabase:
+    COLUMNS = ("name", "cuisine", "location", "rating", "price_range", "delivery")
+    COORDINATES = ("lat", "lon")  # optional float64 columns; NaN marks a row without coordinates
+    SNAPSHOT_VERSION = 2
+    SNAPSHOT_COLUMNS = (  # attribute, block tag, array typecode
+        ("_name_starts", b"NSTA", 'I'), ("_name_ends", b"NEND", 'I'), ("_cuisine_codes", b"CUIC", 'i'),
+        ("_location_codes", b"LOCC", 'i'), ("_price_codes", b"PRCC", 'i'), ("_ratings", b"RATE", 'f'),
+        ("_delivery", b"DLVR", 'B'), ("_lats", b"LATS", 'd'), ("_lons", b"LONS", 'd'), ("_alive", b"ALIV", 'B'),
+    )
+
+    def __init__(self, restaurants=None):
+        if restaurants is None:
+            restaurants = SAMPLE_RESTAURANTS
+        self.cuisines = StringDictionary()
+        self.locations = StringDictionary()
+        self.price_ranges = StringDictionary()
+        self._name_bytes = bytearray()  # UTF-8 names laid end to end
+        self._name_starts = array('I')
+        self._name_ends = array('I')
+        self._cuisine_codes = array('i')
+        self._location_codes = array('i')
+        self._price_codes = array('i')
+        self._ratings = array('f')  # float32: ratings come back rounded to 7 significant digits
+        self._delivery = array('B')
+        self._lats = array('d')
+        self._lons = array('d')
+        self._alive = array('B')  # removed rows are tombstoned so ids stay stable
+        self._extras = {}  # restaurant_id -> fields outside the fixed columns
+        self._live_count = 0
+        self.indexes = []  # secondary indexes told about each add/discard
+        self._geo_index = None
+        self._name_index = None
+        self._snapshot = None  # mmap backing the columns while they are still read-only views
+        self.add_restaurants(restaurants)
+
+    def __len__(self):
+        return self._live_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Unmap the snapshot this database was opened from; it is empty afterwards. A no-op otherwise."""
+        if self._snapshot is None:
+            return
+        snapshot = self._snapshot
+        # Every view into the mapping has to go before it can be closed.
+        self.__init__([])
+        snapshot.close()
+
+    @property
+    def geo_index(self):
+        if self._geo_index is None:
+            self._geo_index = GeoGridIndex()
+            self._geo_index.bulk_load((row.restaurant_id, row) for row in self.get_restaurants())
+            self.indexes.append(self._geo_index)
+        return self._geo_index
+
+    @property
+    def name_index(self):
+        if self._name_index is None:
+            self._name_index = RestaurantNameIndex()
+            self._name_index.bulk_load((row.restaurant_id, row) for row in self.get_restaurants())
+            self.indexes.append(self._name_index)
+        return self._name_index
+
+    def get_restaurants(self):
+        return [RestaurantRow(self, restaurant_id) for restaurant_id, alive in enumerate(self._alive) if alive]
+
+    def get_restaurant(self, restaurant_id):
+        self._check_alive(restaurant_id)
+        return RestaurantRow(self, restaurant_id)
+
+    def get_value(self, restaurant_id, key):
+        if key == "name":
+            return str(self._name_bytes[self._name_starts[restaurant_id]:self._name_ends[restaurant_id]], "utf-8")
+        if key == "cuisine":
+            return self.cuisines.values[self._cuisine_codes[restaurant_id]]
+        if key == "location":
+            return self.locations.values[self._location_codes[restaurant_id]]
+        if key == "rating":
+            return float(f"{self._ratings[restaurant_id]:.7g}")
+        if key == "price_range":
+            return self.price_ranges.values[self._price_codes[restaurant_id]]
+        if key == "delivery":
+            return bool(self._delivery[restaurant_id])
+        if key in self.COORDINATES:
+            value = (self._lats if key == "lat" else self._lons)[restaurant_id]
+            if math.isnan(value):
+                raise KeyError(key)
+            return value
+        return self._extras[restaurant_id][key]
+
+    def row_keys(self, restaurant_id):
+        keys = self.COLUMNS
+        if not math.isnan(self._lats[restaurant_id]):
+            keys += self.COORDINATES
+        extras = self._extras.get(restaurant_id)
+        return keys + tuple(extras) if extras else keys
+
+    def add_restaurant(self, restaurant):
+        self._make_writable()
+        restaurant_id = len(self._alive)
+        self._name_starts.append(0)
+        self._name_ends.append(0)
+        self._set_name(restaurant_id, restaurant['name'])
+        self._cuisine_codes.append(self.cuisines.encode(restaurant['cuisine']))
+        self._location_codes.append(self.locations.encode(restaurant['location']))
+        self._price_codes.append(self.price_ranges.encode(restaurant['price_range']))
+        self._ratings.append(restaurant['rating'])
+        self._delivery.append(bool(restaurant['delivery']))
+        lat, lon = restaurant.get('lat'), restaurant.get('lon')
+        has_coordinates = lat is not None and lon is not None
+        self._lats.append(lat if has_coordinates else math.nan)
+        self._lons.append(lon if has_coordinates else math.nan)
+        self._alive.append(1)
+        extras = {key: value for key, value in restaurant.items()
+                  if key not in self.COLUMNS and key not in self.COORDINATES}
+        if extras:
+            self._extras[restaurant_id] = extras
+        self._live_count += 1
+        for index in self.indexes:
+            index.add(restaurant_id, RestaurantRow(self, restaurant_id))
+        return restaurant_id
+
+    def add_restaurants(self, restaurants):
+        """Bulk insert: rows are appended to the columns first, then each index is loaded in one pass."""
+        self._make_writable()
+        indexes, self.indexes = self.indexes, []
+        restaurant_ids = []
+        try:
+            for restaurant in restaurants:
+                restaurant_ids.append(self.add_restaurant(restaurant))
+        finally:
+            self.indexes = indexes
+            if indexes:
+                added = [(restaurant_id, RestaurantRow(self, restaurant_id)) for restaurant_id in restaurant_ids]
+                for index in indexes:
+                    index.bulk_load(added)
+        return restaurant_ids
+
+    def update_restaurant(self, restaurant_id, **changes):
+        self._check_alive(restaurant_id)
+        self._make_writable()
+        if self.indexes:
+            previous = dict(RestaurantRow(self, restaurant_id))
+            for index in self.indexes:
+                index.discard(restaurant_id, previous)
+        for key, value in changes.items():
+            if key == "name":
+                self._set_name(restaurant_id, value)
+            elif key == "cuisine":
+                self._cuisine_codes[restaurant_id] = self.cuisines.encode(value)
+            elif key == "location":
+                self._location_codes[restaurant_id] = self.locations.encode(value)
+            elif key == "rating":
+                self._ratings[restaurant_id] = value
+            elif key == "price_range":
+                self._price_codes[restaurant_id] = self.price_ranges.encode(value)
+            elif key == "delivery":
+                self._delivery[restaurant_id] = bool(value)
+            elif key == "lat":
+                self._lats[restaurant_id] = math.nan if value is None else value
+            elif key == "lon":
+                self._lons[restaurant_id] = math.nan if value is None else value
+            else:
+                self._extras.setdefault(restaurant_id, {})[key] = value
+        row = RestaurantRow(self, restaurant_id)
+        for index in self.indexes:
+            index.add(restaurant_id, row)
+        return row
+
+    def remove_restaurant(self, restaurant_id):
+        self._check_alive(restaurant_id)
+        self._make_writable()
+        restaurant = dict(RestaurantRow(self, restaurant_id))
+        for index in self.indexes:
+            index.discard(restaurant_id, restaurant)
+        self._alive[restaurant_id] = 0
+        self._extras.pop(restaurant_id, None)
+        self._live_count -= 1
+        return restaurant
+
+    def _check_alive(self, restaurant_id):
+        if not 0 <= restaurant_id < len(self._alive) or not self._alive[restaurant_id]:
+            raise KeyError(restaurant_id)
+
+    def _set_name(self, restaurant_id, name):
+        # Renames append the new bytes; the old ones stay until the catalog is rebuilt.
+        encoded = name.encode()
+        self._name_starts[restaurant_id] = len(self._name_bytes)
+        self._name_bytes += encoded
+        self._name_ends[restaurant_id] = len(self._name_bytes)
+
+    def _make_writable(self):
+        # The first write after open_snapshot copies the mapped columns into private arrays and drops the
+        # read-only snapshot indexes; they are rebuilt from the columns on next use.
+        if self._snapshot is None:
+            return
+        self._name_bytes = bytearray(self._name_bytes)
+        for attribute, _, typecode in self.SNAPSHOT_COLUMNS:
+            column = array(typecode)
+            column.frombytes(getattr(self, attribute).cast('B'))
+            setattr(self, attribute, column)
+        self._extras = {restaurant_id: self._extras[restaurant_id] for restaurant_id in self._extras}
+        self._geo_index = None
+        self._name_index = None
+        self._snapshot = None
+
+    def save_snapshot(self, path):
+        """Write the catalog and its geo and name indexes to path as one binary file (see open_snapshot).
+
+        The file is written to a temp file and renamed over path, so readers never see a partial snapshot.
+        """
+        live_ids = [restaurant_id for restaurant_id, alive in enumerate(self._alive) if alive]
+        geo_index = self.geo_index
+        cells = sorted(geo_index.cells)
+        cell_starts = array('I', [0])
+        cell_ids = array('I')
+        for cell in cells:
+            cell_ids.extend(sorted(geo_index.cells[cell]))
+            cell_starts.append(len(cell_ids))
+
+        name_index = self.name_index
+        folded = bytearray()
+        folded_starts = array('I', bytes(4 * len(self._alive)))
+        folded_ends = array('I', bytes(4 * len(self._alive)))
+        gram_counts = array('I', bytes(4 * len(self._alive)))
+        for restaurant_id in live_ids:
+            folded_starts[restaurant_id] = len(folded)
+            folded += RestaurantNameIndex.fold(self.get_value(restaurant_id, "name")).encode()
+            folded_ends[restaurant_id] = len(folded)
+            gram_counts[restaurant_id] = name_index.gram_counts[restaurant_id]
+        prefix_ids = array('I')
+        prefix_offsets = array('I')
+        for suffix, restaurant_id in name_index.prefixes:
+            prefix_ids.append(restaurant_id)
+            prefix_offsets.append(folded_ends[restaurant_id] - folded_starts[restaurant_id] - len(suffix.encode()))
+        grams = sorted(name_index.trigrams)
+        gram_starts = array('I', [0])
+        gram_ids = array('I')
+        for gram in grams:
+            gram_ids.extend(sorted(name_index.trigrams[gram]))
+            gram_starts.append(len(gram_ids))
+
+        extra_ids = sorted(self._extras)
+        meta = {"live_count": self._live_count, "cell_km": geo_index.cell_km, "extent": geo_index._extent,
+                "geo_count": len(geo_index)}
+        blocks = [
+            (b"META", json.dumps(meta).encode()),
+            (b"CUIS", _pack_string_table(self.cuisines.values)),
+            (b"LOCS", _pack_string_table(self.locations.values)),
+            (b"PRIC", _pack_string_table(self.price_ranges.values)),
+            (b"NAME", self._name_bytes),
+        ]
+        blocks += [(tag, getattr(self, attribute)) for attribute, tag, _ in self.SNAPSHOT_COLUMNS]
+        blocks += [
+            (b"EXID", array('I', extra_ids)),
+            (b"EXTR", _pack_string_table([json.dumps(self._extras[restaurant_id], separators=(",", ":"))
+                                          for restaurant_id in extra_ids])),
+            (b"GKEY", array('Q', [_cell_key(*cell) for cell in cells])),
+            (b"GSTA", cell_starts),
+            (b"GIDS", cell_ids),
+            (b"FOLD", folded),
+            (b"FSTA", folded_starts),
+            (b"FEND", folded_ends),
+            (b"PFXI", prefix_ids),
+            (b"PFXO", prefix_offsets),
+            (b"TGRM", _pack_string_table(grams)),
+            (b"TGST", gram_starts),
+            (b"TGID", gram_ids),
+            (b"GCNT", gram_counts),
+        ]
+
+        directory = bytearray()
+        chunks = []
+        position = CATALOG_HEADER.size + CATALOG_BLOCK.size * len(blocks)
+        for tag, data in blocks:
+            data = memoryview(data).cast('B')
+            padding = -position % 8
+            position += padding
+            directory += CATALOG_BLOCK.pack(tag, position, data.nbytes)
+            chunks += [bytes(padding), data]
+            position += data.nbytes
+        checksum = zlib.crc32(directory)
+        for chunk in chunks:
+            checksum = zlib.crc32(chunk, checksum)
+        descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".catalog-")
+        with os.fdopen(descriptor, "wb") as snapshot_file:
+            snapshot_file.write(CATALOG_HEADER.pack(CATALOG_MAGIC, self.SNAPSHOT_VERSION, len(blocks),
+                                                    len(self._alive), checksum, CATALOG_BYTE_ORDER))
+            snapshot_file.write(directory)
+            for chunk in chunks:
+                snapshot_file.write(chunk)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def open_snapshot(cls, path, verify=True):
+        """Open a file written by save_snapshot without decoding it.
+
+        The file is mapped read-only and every column and index is a typed memoryview over the mapping, so
+        startup cost does not grow with the catalog, processes opening the same file share its page-cache
+        pages, and only the pages a query touches are read; extra fields are decoded per row on first
+        access. Writes copy the columns first (see _make_writable). close(), or a with block, unmaps the
+        file. verify=False skips the crc32 pass over the file, e.g. in workers opening a
+        snapshot the parent has already checked.
+        """
+        with open(path, "rb") as snapshot_file:
+            view = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(view)
+        if len(buffer) < CATALOG_HEADER.size:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        magic, version, block_count, row_count, checksum, byte_order = CATALOG_HEADER.unpack_from(buffer)
+        if magic != CATALOG_MAGIC or version != cls.SNAPSHOT_VERSION:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        if byte_order != CATALOG_BYTE_ORDER:
+            raise ValueError(f"{path} was written with the other byte order; rebuild it on this machine")
+        if verify and zlib.crc32(buffer[CATALOG_HEADER.size:]) != checksum:
+            raise ValueError(f"{path} failed its checksum")
+        directory_end = CATALOG_HEADER.size + CATALOG_BLOCK.size * block_count
+        blocks = {tag: buffer[offset:offset + length]
+                  for tag, offset, length in CATALOG_BLOCK.iter_unpack(buffer[CATALOG_HEADER.size:directory_end])}
+        meta = json.loads(bytes(blocks[b"META"]))
+
+        database = cls([])
+        database._snapshot = view
+        for dictionary, tag in ((database.cuisines, b"CUIS"), (database.locations, b"LOCS"),
+                                (database.price_ranges, b"PRIC")):
+            for value in StringTable(blocks[tag]):
+                dictionary.encode(value)
+        database._name_bytes = blocks[b"NAME"]
+        for attribute, tag, typecode in cls.SNAPSHOT_COLUMNS:
+            setattr(database, attribute, blocks[tag].cast(typecode))
+        database._extras = SnapshotExtras(blocks[b"EXID"].cast('I'), StringTable(blocks[b"EXTR"]))
+        database._live_count = meta["live_count"]
+        cells = SnapshotCells(blocks[b"GKEY"].cast('Q'), blocks[b"GSTA"].cast('I'), blocks[b"GIDS"].cast('I'),
+                              database._lats, database._lons)
+        database._geo_index = SnapshotGeoIndex(meta["cell_km"], meta["extent"], cells, meta["geo_count"])
+        folded_starts, folded_ends = blocks[b"FSTA"].cast('I'), blocks[b"FEND"].cast('I')
+        prefixes = SnapshotPrefixes(blocks[b"FOLD"], folded_starts, folded_ends,
+                                    blocks[b"PFXI"].cast('I'), blocks[b"PFXO"].cast('I'))
+        trigrams = SnapshotPostings(StringTable(blocks[b"TGRM"]), blocks[b"TGST"].cast('I'),
+                                    blocks[b"TGID"].cast('I'))
+        database._name_index = SnapshotNameIndex(prefixes, trigrams, blocks[b"GCNT"].cast('I'))
+        if len(database._alive) != row_count:
+            raise ValueError(f"{path} has {len(database._alive)} rows, expected {row_count}")
+        return database
+
+    def memory_usage(self):
+        """Approximate bytes held by the column buffers."""
+        columns = (self._name_starts, self._name_ends, self._cuisine_codes, self._location_codes,
+                   self._price_codes, self._ratings, self._delivery, self._lats, self._lons, self._alive)
+        return len(self._name_bytes) + sum(column.itemsize * len(column) for column in columns)
+
+    def select_ids(self, cuisine_type=None, location=None, min_rating=None, delivery=None, restaurant_ids=None):
+        if np is None:
+            return self._select_ids_python(cuisine_type, location, min_rating, delivery, restaurant_ids)
+        if not self._alive:
+            return []
+        # With candidate ids from another index, only those rows are gathered and masked.
+        rows = None
+        if restaurant_ids is not None:
+            rows = np.array(sorted(restaurant_ids), dtype=np.intp)
+
+        def column(values, dtype):
+            view = np.frombuffer(values, dtype=dtype)
+            return view.copy() if rows is None else view[rows]
+
+        mask = column(self._alive, np.bool_)
+        if cuisine_type is not None:
+            mask &= self._code_mask(column(self._cuisine_codes, np.int32), self.cuisines.lookup(cuisine_type))
+        if location is not None:
+            mask &= self._code_mask(column(self._location_codes, np.int32), self.locations.lookup(location))
+        if min_rating is not None:
+            mask &= column(self._ratings, np.float32) >= np.float32(min_rating)
+        if delivery is not None:
+            mask &= column(self._delivery, np.bool_) == bool(delivery)
+        matches = np.flatnonzero(mask)
+        return (matches if rows is None else rows[matches]).tolist()
+
+    def _code_mask(self, values, codes):
+        if len(codes) == 1:
+            return values == codes[0]
+        return np.isin(values, codes)
+
+    def _select_ids_python(self, cuisine_type, location, min_rating, delivery, restaurant_ids=None):
+        cuisine_codes = set(self.cuisines.lookup(cuisine_type)) if cuisine_type is not None else None
+        location_codes = set(self.locations.lookup(location)) if location is not None else None
+        if cuisine_codes == set() or location_codes == set():
+            return []
+        # Compare at float32 precision, the same precision the ratings are stored at.
+        threshold = array('f', [min_rating])[0] if min_rating is not None else None
+        wanted_delivery = bool(delivery) if delivery is not None else None
+        candidates = range(len(self._alive)) if restaurant_ids is None else sorted(restaurant_ids)
+        ids = []
+        for restaurant_id in candidates:
+            if not self._alive[restaurant_id]:
+                continue
+            if cuisine_codes is not None and self._cuisine_codes[restaurant_id] not in cuisine_codes:
+                continue
+            if location_codes is not None and self._location_codes[restaurant_id] not in location_codes:
+                continue
+            if threshold is not None and self._ratings[restaurant_id] < threshold:
+                continue
+            if wanted_delivery is not None and bool(self._delivery[restaurant_id]) != wanted_delivery:
+                continue
+            ids.append(restaurant_id)
+        return ids
+
+    def select(self, cuisine_type=None, location=None, min_rating=None, delivery=None, restaurant_ids=None):
+        ids = self.select_ids(cuisine_type=cuisine_type, location=location, min_rating=min_rating,
+                              delivery=delivery, restaurant_ids=restaurant_ids)
+        return [RestaurantRow(self, restaurant_id) for restaurant_id in ids]
+
+    def predicate(self, cuisine_type=None, location=None, min_rating=None, delivery=None):
+        """Return a per-id test over the code columns, or None when nothing is filtered."""
+        checks = []
+        if cuisine_type is not None:
+            cuisine_codes, cuisine_column = set(self.cuisines.lookup(cuisine_type)), self._cuisine_codes
+            checks.append(lambda restaurant_id: cuisine_column[restaurant_id] in cuisine_codes)
+        if location is not None:
+            location_codes, location_column = set(self.locations.lookup(location)), self._location_codes
+            checks.append(lambda restaurant_id: location_column[restaurant_id] in location_codes)
+        if min_rating is not None:
+            threshold, ratings = array('f', [min_rating])[0], self._ratings
+            checks.append(lambda restaurant_id: ratings[restaurant_id] >= threshold)
+        if delivery is not None:
+            wanted, deliveries = bool(delivery), self._delivery
+            checks.append(lambda restaurant_id: bool(deliveries[restaurant_id]) == wanted)
+        if not checks:
+            return None
+        return lambda restaurant_id: all(check(restaurant_id) for check in checks)
+
 
 # RestaurantBrowsing class handles the logic for filtering restaurants based on user criteria
 class RestaurantBrowsing:
@@ -21,32 +1150,299 @@ class RestaurantBrowsing:
         self.database = database
 
     def search_by_cuisine(self, cuisine_type):
-        return [restaurant for restaurant in self.database.get_restaurants() if restaurant['cuisine'].lower() == cuisine_type.lower()]
+        return self.database.select(cuisine_type=cuisine_type)
 
     def search_by_location(self, location):
-        return [restaurant for restaurant in self.database.get_restaurants() if restaurant['location'].lower() == location.lower()]
+        return self.database.select(location=location)
 
     def search_by_rating(self, min_rating):
-        return [restaurant for restaurant in self.database.get_restaurants() if restaurant['rating'] >= min_rating]
+        return self.database.select(min_rating=min_rating)
 
-    def search_by_filters(self, cuisine_type=None, location=None, min_rating=None):
-        results = self.database.get_restaurants()
-        if cuisine_type:
-            results = [restaurant for restaurant in results if restaurant['cuisine'].lower() == cuisine_type.lower()]
-        if location:
-            results = [restaurant for restaurant in results if restaurant['location'].lower() == location.lower()]
-        if min_rating:
-            results = [restaurant for restaurant in results if restaurant['rating'] >= min_rating]
-        return results
+    @METRICS.timed("restaurant_search_seconds", operation="search_by_name")
+    def search_by_name(self, query, limit=10, min_similarity=0.3):
+        """Typo-tolerant name search, best trigram similarity first."""
+        matches = self.database.name_index.fuzzy(query, limit=limit, threshold=min_similarity)
+        return [self.database.get_restaurant(restaurant_id) for _, restaurant_id in matches]
+
+    @METRICS.timed("restaurant_search_seconds", operation="autocomplete")
+    def autocomplete(self, prefix, limit=10):
+        """Restaurants with a name word starting with prefix, ordered by the matched text."""
+        ids = self.database.name_index.prefix_ids(prefix, limit=limit)
+        return [self.database.get_restaurant(restaurant_id) for restaurant_id in ids]
+
+    @METRICS.timed("restaurant_search_seconds", operation="search_by_filters")
+    def search_by_filters(self, cuisine_type=None, location=None, min_rating=None, delivery=None, name=None):
+        # Falsy text/rating filters are ignored, matching the original list-comprehension chain;
+        # delivery=False is a real filter, so only None disables it.
+        return self.database.select(
+            cuisine_type=cuisine_type or None,
+            location=location or None,
+            min_rating=min_rating or None,
+            delivery=delivery,
+            restaurant_ids=self._name_candidates(name),
+        )
+
+    def search_ids_by_filters(self, cuisine_type=None, location=None, min_rating=None, delivery=None, name=None):
+        return self.database.select_ids(
+            cuisine_type=cuisine_type or None,
+            location=location or None,
+            min_rating=min_rating or None,
+            delivery=delivery,
+            restaurant_ids=self._name_candidates(name),
+        )
+
+    def _name_candidates(self, name):
+        # The name filter is a word-prefix match, the same one autocomplete uses.
+        if not name:
+            return None
+        return set(self.database.name_index.prefix_ids(name))
+
+    @METRICS.timed("restaurant_search_seconds", operation="search_nearby")
+    def search_nearby(self, lat, lon, radius_km, k=None, cuisine_type=None, location=None, min_rating=None, delivery=None):
+        """Return restaurants within radius_km of (lat, lon), nearest first, at most k of them.
+
+        Filters are probed per candidate pulled from the spatial index rather than by scanning the catalog.
+        """
+        predicate = self.database.predicate(
+            cuisine_type=cuisine_type or None,
+            location=location or None,
+            min_rating=min_rating or None,
+            delivery=delivery,
+        )
+        matches = self.database.geo_index.nearest(lat, lon, radius_km=radius_km, k=k, predicate=predicate)
+        return [self.database.get_restaurant(restaurant_id) for _, restaurant_id in matches]
+
+
+# SearchResultCache memoizes RestaurantSearch results with LRU eviction, a TTL and write-driven invalidation
+class SearchResultCache:
+    def __init__(self, max_entries=1024, ttl_seconds=30.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (expires_at, results), least recently used first
+        self._by_cuisine = {}  # cuisine filter (None = any) -> keys, so a write only checks plausible entries
+        self._in_flight = {}  # key -> threading.Event set when the computing caller finishes
+        self._generation = 0  # bumped by every write; results computed across a write are not stored
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(cuisine=None, location=None, rating=None, delivery=None, name=None, sort_by=None, limit=None):
+        # Same normalization as the filters themselves: falsy means "no filter", text is case-folded.
+        return (
+            cuisine.lower() if cuisine else None,
+            location.lower() if location else None,
+            rating or None,
+            None if delivery is None else bool(delivery),
+            RestaurantNameIndex.fold(name) if name else None,
+            sort_by,
+            limit,
+        )
+
+    def get_or_compute(self, key, compute):
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry[0] > self.clock():
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        SEARCH_CACHE_HITS.inc()
+                        return list(entry[1])
+                    self._remove(key)
+                    self.expirations += 1
+                waiting_on = self._in_flight.get(key)
+                if waiting_on is None:
+                    # This caller recomputes; concurrent callers for the same key wait for it
+                    # instead of stampeding the database when a popular entry expires.
+                    self.misses += 1
+                    SEARCH_CACHE_MISSES.inc()
+                    done = self._in_flight[key] = threading.Event()
+                    generation = self._generation
+                    break
+            waiting_on.wait()
+        try:
+            results = compute()
+            with self._lock:
+                if generation == self._generation:
+                    self._store(key, results)
+            return list(results)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            done.set()
+
+    def _store(self, key, results):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (self.clock() + self.ttl_seconds, results)
+        self._by_cuisine.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        del self._entries[key]
+        keys = self._by_cuisine[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._by_cuisine[key[0]]
+
+    @staticmethod
+    def _could_match(key, restaurant):
+        cuisine, location, rating, delivery, name = key[:5]
+        if location is not None and restaurant['location'].lower() != location:
+            return False
+        if rating is not None and restaurant['rating'] < rating:
+            return False
+        if delivery is not None and bool(restaurant['delivery']) != delivery:
+            return False
+        if name is not None:
+            folded = RestaurantNameIndex.fold(restaurant['name'])
+            return any(suffix.startswith(name) for suffix in RestaurantNameIndex._word_suffixes(folded))
+        return True
+
+    def _invalidate_for(self, restaurant):
+        with self._lock:
+            self._generation += 1
+            for cuisine in (None, restaurant['cuisine'].lower()):
+                for key in list(self._by_cuisine.get(cuisine, ())):
+                    if self._could_match(key, restaurant):
+                        self._remove(key)
+                        self.invalidations += 1
+
+    # The database calls these like any other index, with the row before and after a change.
+    def add(self, restaurant_id, restaurant):
+        self._invalidate_for(restaurant)
+
+    def discard(self, restaurant_id, restaurant):
+        self._invalidate_for(restaurant)
+
+    def bulk_load(self, items):
+        for restaurant_id, restaurant in items:
+            self._invalidate_for(restaurant)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_cuisine.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
 
 
 # RestaurantSearch class interacts with RestaurantBrowsing to apply user-provided filters
 class RestaurantSearch:
-    def __init__(self, browsing):
+    # Each sort key maps a row to an ascending sort value; ties fall back to catalog order (restaurant id).
+    SORT_KEYS = {
+        "rating": lambda restaurant: -restaurant['rating'],  # best rated first
+        "price_range": lambda restaurant: len(restaurant['price_range']),  # cheapest first
+        "name": lambda restaurant: restaurant['name'].lower(),
+    }
+    CURSOR_VALUE_TYPES = {"rating": (int, float), "price_range": (int,), "name": (str,)}  # what each sort key yields
+
+    def __init__(self, browsing, cache=None):
         self.browsing = browsing
+        self.cache = cache
+        if cache is not None:
+            # The cache listens to row changes like an index does, to drop entries a write could affect.
+            browsing.database.indexes.append(cache)
+
+    @METRICS.timed("restaurant_search_seconds", operation="search_restaurants")
+    def search_restaurants(self, cuisine=None, location=None, rating=None, delivery=None, sort_by=None, limit=None, name=None):
+        if self.cache is None:
+            return self._search_restaurants(cuisine, location, rating, delivery, sort_by, limit, name)
+        key = self.cache.make_key(cuisine, location, rating, delivery, name, sort_by, limit)
+        return self.cache.get_or_compute(
+            key, lambda: self._search_restaurants(cuisine, location, rating, delivery, sort_by, limit, name))
+
+    def _search_restaurants(self, cuisine, location, rating, delivery, sort_by, limit, name):
+        if sort_by is None and limit is None:
+            return self.browsing.search_by_filters(cuisine_type=cuisine, location=location, min_rating=rating,
+                                                   delivery=delivery, name=name)
+        ids = self.browsing.search_ids_by_filters(cuisine_type=cuisine, location=location, min_rating=rating,
+                                                  delivery=delivery, name=name)
+        if sort_by is None:
+            ids = ids[:limit]
+        else:
+            keys = self._keys(sort_by, ids)
+            # heapq.nsmallest keeps only `limit` entries alive instead of sorting every match.
+            keys = sorted(keys) if limit is None else heapq.nsmallest(limit, keys)
+            ids = [restaurant_id for _, restaurant_id in keys]
+        return [self.browsing.database.get_restaurant(restaurant_id) for restaurant_id in ids]
+
+    def search_page(self, cuisine=None, location=None, rating=None, delivery=None, sort_by="rating", page_size=20, cursor=None,
+                    name=None):
+        """Return one page of results and an opaque cursor for the next page (None on the last page).
+
+        Pages are cut by keyset: the cursor holds the sort key of the last row returned, so rows
+        added or removed between calls never shift later pages or repeat earlier ones.
+        """
+        if page_size <= 0:
+            raise ValueError("page_size must be positive")
+        ids = self.browsing.search_ids_by_filters(cuisine_type=cuisine, location=location, min_rating=rating,
+                                                  delivery=delivery, name=name)
+        keys = self._keys(sort_by, ids)
+        if cursor is not None:
+            after = self._decode_cursor(cursor, sort_by)
+            keys = (key for key in keys if key > after)
+        page = heapq.nsmallest(page_size + 1, keys)
+        next_cursor = self._encode_cursor(sort_by, page[page_size - 1]) if len(page) > page_size else None
+        return {
+            "results": [self.browsing.database.get_restaurant(restaurant_id) for _, restaurant_id in page[:page_size]],
+            "next_cursor": next_cursor,
+        }
+
+    def iter_restaurants(self, cuisine=None, location=None, rating=None, delivery=None, sort_by=None, name=None):
+        """Yield matching restaurants one at a time; rows are only fetched as the caller consumes them."""
+        ids = self.browsing.search_ids_by_filters(cuisine_type=cuisine, location=location, min_rating=rating,
+                                                  delivery=delivery, name=name)
+        database = self.browsing.database
+        if sort_by is None:
+            for restaurant_id in ids:
+                yield database.get_restaurant(restaurant_id)
+            return
+        # heapify is O(n); each row then costs one O(log n) pop, so short reads never pay for a full sort.
+        heap = list(self._keys(sort_by, ids))
+        heapq.heapify(heap)
+        while heap:
+            yield database.get_restaurant(heapq.heappop(heap)[1])
 
-    def search_restaurants(self, cuisine=None, location=None, rating=None):
-        return self.browsing.search_by_filters(cuisine_type=cuisine, location=location, min_rating=rating)
+    def _keys(self, sort_by, ids):
+        if sort_by not in self.SORT_KEYS:
+            raise ValueError(f"Cannot sort by {sort_by!r}")
+        sort_key, database = self.SORT_KEYS[sort_by], self.browsing.database
+        return ((sort_key(database.get_restaurant(restaurant_id)), restaurant_id) for restaurant_id in ids)
+
+    def _encode_cursor(self, sort_by, key):
+        payload = json.dumps([sort_by, key[0], key[1]], separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(payload).decode()
+
+    def _decode_cursor(self, cursor, sort_by):
+        try:
+            cursor_sort_by, value, restaurant_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError):
+            raise ValueError("Invalid cursor")
+        if cursor_sort_by != sort_by:
+            raise ValueError("Cursor was issued for a different sort order")
+        # A forged cursor with values of the wrong type would otherwise fail later, comparing against real keys.
+        if (isinstance(value, bool) or not isinstance(value, self.CURSOR_VALUE_TYPES.get(sort_by, ()))
+                or isinstance(restaurant_id, bool) or not isinstance(restaurant_id, int)):
+            raise ValueError("Invalid cursor")
+        return (value, restaurant_id)
 
 
 # Unit tests for RestaurantBrowsing class
@@ -76,6 +1472,330 @@ class TestRestaurantBrowsing(unittest.TestCase):
         self.assertEqual(results[0]['name'], "Italian Bistro")
 
 
+# Unit tests for RestaurantIndex maintenance and query planning
+class TestRestaurantIndex(unittest.TestCase):
+    def setUp(self):
+        self.database = RestaurantDatabase()
+        self.browsing = RestaurantBrowsing(self.database)
+
+    def linear_scan(self, cuisine_type=None, location=None, min_rating=None):
+        results = self.database.get_restaurants()
+        if cuisine_type:
+            results = [restaurant for restaurant in results if restaurant['cuisine'].lower() == cuisine_type.lower()]
+        if location:
+            results = [restaurant for restaurant in results if restaurant['location'].lower() == location.lower()]
+        if min_rating:
+            results = [restaurant for restaurant in results if restaurant['rating'] >= min_rating]
+        return results
+
+    def test_add_restaurant_is_indexed(self):
+        self.database.add_restaurant({"name": "Pasta Corner", "cuisine": "ITALIAN", "location": "downtown", "rating": 4.1, "price_range": "$", "delivery": False})
+        results = self.browsing.search_by_filters(cuisine_type="italian", location="Downtown", min_rating=4.0)
+        self.assertEqual([restaurant['name'] for restaurant in results], ["Italian Bistro", "Pasta Corner"])
+
+    def test_update_restaurant_moves_postings(self):
+        self.database.update_restaurant(0, cuisine="French", rating=3.0)
+        self.assertEqual(len(self.browsing.search_by_cuisine("Italian")), 1)
+        self.assertEqual(self.browsing.search_by_cuisine("french")[0]['name'], "Italian Bistro")
+        self.assertEqual(len(self.browsing.search_by_rating(4.0)), 3)
+
+    def test_add_restaurants_bulk(self):
+        ids = self.database.add_restaurants([
+            {"name": "Trattoria", "cuisine": "Italian", "location": "Midtown", "rating": 4.6, "price_range": "$$", "delivery": True},
+            {"name": "Noodle Bar", "cuisine": "Japanese", "location": "Downtown", "rating": 3.1, "price_range": "$", "delivery": False},
+        ])
+        self.assertEqual(ids, [5, 6])
+        self.assertEqual(self.browsing.search_by_rating(4.5), self.linear_scan(min_rating=4.5))
+        self.assertEqual(self.browsing.search_by_filters(cuisine_type="japanese"), self.linear_scan(cuisine_type="japanese"))
+
+    def test_remove_restaurant(self):
+        self.database.remove_restaurant(3)
+        self.assertEqual(len(self.database.get_restaurants()), 4)
+        self.assertEqual([restaurant['name'] for restaurant in self.browsing.search_by_location("Downtown")], ["Italian Bistro"])
+
+    def test_matches_linear_scan(self):
+        rng = random.Random(7)
+        cuisines = ["Italian", "Japanese", "Mexican", "Thai", "Fast Food"]
+        locations = ["Downtown", "Midtown", "Uptown", "Harbor"]
+        for number in range(500):
+            self.database.add_restaurant({
+                "name": f"Restaurant {number}",
+                "cuisine": rng.choice(cuisines).upper() if number % 3 == 0 else rng.choice(cuisines),
+                "location": rng.choice(locations),
+                "rating": round(rng.uniform(1.0, 5.0), 1),
+                "price_range": rng.choice(["$", "$$", "$$$"]),
+                "delivery": rng.random() < 0.5,
+            })
+        for restaurant_id in rng.sample(range(505), 50):
+            self.database.remove_restaurant(restaurant_id)
+        for cuisine_type in [None, "", "italian", "Thai", "Korean"]:
+            for location in [None, "uptown", "Harbor"]:
+                for min_rating in [None, 0, 3.5, 4.8]:
+                    self.assertEqual(
+                        self.browsing.search_by_filters(cuisine_type=cuisine_type, location=location, min_rating=min_rating),
+                        self.linear_scan(cuisine_type, location, min_rating),
+                    )
+
+
+# Runs the browsing tests against the columnar storage mode
+class TestColumnarRestaurantBrowsing(TestRestaurantBrowsing):
+    def setUp(self):
+        self.database = ColumnarRestaurantDatabase()
+        self.browsing = RestaurantBrowsing(self.database)
+
+
+# Unit tests for ColumnarRestaurantDatabase storage and filtering
+class TestColumnarRestaurantDatabase(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(11)
+        self.rows = [{
+            "name": f"Restaurant {number}",
+            "cuisine": rng.choice(["Italian", "ITALIAN", "Thai", "Mexican"]),
+            "location": rng.choice(["Downtown", "Uptown", "Harbor"]),
+            "rating": round(rng.uniform(1.0, 5.0), 1),
+            "price_range": rng.choice(["$", "$$", "$$$"]),
+            "delivery": rng.random() < 0.5,
+        } for number in range(2000)]
+        self.row_database = RestaurantDatabase([dict(row) for row in self.rows])
+        self.columnar_database = ColumnarRestaurantDatabase(self.rows)
+
+    def assert_same_results(self):
+        for cuisine_type in [None, "italian", "Korean"]:
+            for location in [None, "harbor"]:
+                for min_rating in [None, 4.2]:
+                    for delivery in [None, False]:
+                        filters = dict(cuisine_type=cuisine_type, location=location, min_rating=min_rating, delivery=delivery)
+                        self.assertEqual(self.columnar_database.select(**filters), self.row_database.select(**filters))
+
+    def test_matches_row_database(self):
+        self.assert_same_results()
+
+    def test_matches_row_database_without_numpy(self):
+        with mock.patch.dict(globals(), {"np": None}):
+            self.assert_same_results()
+
+    def test_update_and_remove(self):
+        for database in (self.row_database, self.columnar_database):
+            database.update_restaurant(5, name="Renamed", cuisine="Korean", rating=4.9, delivery=True)
+            database.remove_restaurant(6)
+        row = self.columnar_database.get_restaurant(5)
+        self.assertEqual(row, {"name": "Renamed", "cuisine": "Korean", "location": self.rows[5]["location"],
+                               "rating": 4.9, "price_range": self.rows[5]["price_range"], "delivery": True})
+        with self.assertRaises(KeyError):
+            self.columnar_database.get_restaurant(6)
+        self.assertEqual(len(self.columnar_database.get_restaurants()), 1999)
+        self.assertEqual(self.row_database.get_restaurants()[6]["name"], self.rows[7]["name"])
+        self.assert_same_results()
+
+    def test_bulk_add_loads_every_index(self):
+        browsing = {database: RestaurantBrowsing(database) for database in (self.row_database, self.columnar_database)}
+        for database in browsing:
+            database.geo_index, database.name_index
+        extra = [{**row, "name": f"Bulk {row['name']}", "lat": 40.7 + index * 1e-4, "lon": -74.0}
+                 for index, row in enumerate(self.rows[:50])]
+        ids = [database.add_restaurants([dict(row) for row in extra]) for database in browsing]
+        self.assertEqual(ids[0], ids[1])
+        self.assertEqual(ids[0], list(range(2000, 2050)))
+        answers = [(search.autocomplete("bulk", limit=100), search.search_nearby(40.7, -74.0, 1.0, k=100))
+                   for search in browsing.values()]
+        self.assertEqual(len(answers[0][0]), 50)
+        self.assertEqual(answers[0], answers[1])
+        self.assert_same_results()
+
+    def test_uses_far_less_memory_than_row_storage(self):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            row_database = RestaurantDatabase([dict(row) for row in self.rows])
+            row_bytes = tracemalloc.get_traced_memory()[0] - before
+            before = tracemalloc.get_traced_memory()[0]
+            columnar_database = ColumnarRestaurantDatabase(self.rows)
+            columnar_bytes = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(columnar_database), len(row_database.get_restaurants()))
+        self.assertLess(columnar_bytes * 8, row_bytes)
+
+
+# Unit tests for catalog snapshots written by save_snapshot and mapped by open_snapshot
+class TestCatalogSnapshot(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "catalog.bin")
+        rng = random.Random(5)
+        words = ["Golden", "Garden", "Café", "Bistro", "Grill", "Sushi", "Taco", "Palace"]
+        self.database = ColumnarRestaurantDatabase([{
+            "name": f"{rng.choice(words)}  {rng.choice(words)} {number}",
+            "cuisine": rng.choice(["Italian", "ITALIAN", "Thai", "Mexican"]),
+            "location": rng.choice(["Downtown", "Uptown", "Harbor"]),
+            "rating": round(rng.uniform(1.0, 5.0), 1),
+            "price_range": rng.choice(["$", "$$", "$$$"]),
+            "delivery": rng.random() < 0.5,
+            **({"lat": rng.uniform(40.6, 40.9), "lon": rng.uniform(-74.05, -73.8)} if number % 7 else {}),
+            **({"tags": ["late night"]} if number % 50 == 0 else {}),
+        } for number in range(1000)])
+        self.database.update_restaurant(3, name="Renamed Trattoria", rating=4.9)
+        self.database.remove_restaurant(4)
+        self.database.save_snapshot(self.path)
+        self.opened = ColumnarRestaurantDatabase.open_snapshot(self.path)
+        self.addCleanup(self.opened.close)
+
+    def assert_same_answers(self, expected, actual):
+        expected_browsing, actual_browsing = RestaurantBrowsing(expected), RestaurantBrowsing(actual)
+        self.assertEqual(actual.get_restaurants(), expected.get_restaurants())
+        for filters in [{}, {"cuisine_type": "italian", "min_rating": 3.5}, {"location": "Harbor", "delivery": False},
+                        {"name": "gar", "min_rating": 2.0}]:
+            self.assertEqual(actual_browsing.search_by_filters(**filters), expected_browsing.search_by_filters(**filters))
+        for prefix in ["caf", "golden g", "renamed", "zzz"]:
+            self.assertEqual(actual_browsing.autocomplete(prefix), expected_browsing.autocomplete(prefix))
+        for query in ["sushi palase", "trattoria", "cafe bistro"]:
+            self.assertEqual(actual_browsing.search_by_name(query), expected_browsing.search_by_name(query))
+        self.assertEqual(actual_browsing.search_nearby(40.75, -73.95, 3.0, cuisine_type="thai"),
+                         expected_browsing.search_nearby(40.75, -73.95, 3.0, cuisine_type="thai"))
+        self.assertEqual(actual_browsing.search_nearby(40.75, -73.95, None, k=5),
+                         expected_browsing.search_nearby(40.75, -73.95, None, k=5))
+
+    def test_round_trip_answers_every_query_like_the_original(self):
+        self.assertEqual(len(self.opened), 999)
+        self.assertEqual(len(self.opened.geo_index), len(self.database.geo_index))
+        self.assertEqual(self.opened.get_restaurant(0)["tags"], ["late night"])
+        self.assert_same_answers(self.database, self.opened)
+
+    def test_columns_and_indexes_are_views_of_the_mapping(self):
+        self.assertIsInstance(self.opened._ratings, memoryview)
+        self.assertIsInstance(self.opened.geo_index, SnapshotGeoIndex)
+        self.assertIsInstance(self.opened.name_index, SnapshotNameIndex)
+        with self.assertRaises(KeyError):
+            self.opened.get_restaurant(4)
+
+    def test_writes_copy_the_columns_and_rebuild_indexes(self):
+        restaurant = {"name": "Harbor Noodles", "cuisine": "Thai", "location": "Harbor", "rating": 4.4,
+                      "price_range": "$", "delivery": True, "lat": 40.75, "lon": -73.95}
+        for database in (self.database, self.opened):
+            database.add_restaurant(dict(restaurant))
+            database.update_restaurant(10, cuisine="Korean")
+            database.remove_restaurant(11)
+        self.assertIsInstance(self.opened._ratings, array)
+        self.assert_same_answers(self.database, self.opened)
+        with ColumnarRestaurantDatabase.open_snapshot(self.path) as reopened:
+            self.assertEqual(len(reopened), 999)
+
+    def test_resaving_an_opened_snapshot(self):
+        path = self.path + ".copy"
+        self.opened.save_snapshot(path)
+        with ColumnarRestaurantDatabase.open_snapshot(path) as copy:
+            self.assert_same_answers(self.database, copy)
+
+    def test_extras_are_decoded_on_first_access(self):
+        extras = self.opened._extras
+        self.assertIsInstance(extras, SnapshotExtras)
+        self.assertEqual((len(extras), extras._decoded), (20, {}))
+        self.assertEqual(self.opened.get_restaurant(50)["tags"], ["late night"])
+        self.assertNotIn(51, extras)
+        self.assertEqual(list(extras._decoded), [50])
+
+    def test_close_unmaps_the_snapshot(self):
+        with ColumnarRestaurantDatabase.open_snapshot(self.path) as database:
+            mapping = database._snapshot
+            RestaurantBrowsing(database).search_by_name("sushi palase")
+            self.assertFalse(mapping.closed)
+        self.assertTrue(mapping.closed)
+        self.assertEqual(len(database), 0)
+        database.close()
+
+    def test_rejects_corrupt_and_foreign_files(self):
+        with open(self.path, "r+b") as snapshot_file:
+            snapshot_file.seek(os.path.getsize(self.path) // 2)
+            byte = snapshot_file.read(1)
+            snapshot_file.seek(-1, os.SEEK_CUR)
+            snapshot_file.write(bytes([byte[0] ^ 0xFF]))
+        with self.assertRaisesRegex(ValueError, "checksum"):
+            ColumnarRestaurantDatabase.open_snapshot(self.path)
+        ColumnarRestaurantDatabase.open_snapshot(self.path, verify=False).close()
+        with open(self.path, "wb") as snapshot_file:
+            snapshot_file.write(b"not a catalog snapshot")
+        with self.assertRaisesRegex(ValueError, "not a catalog snapshot"):
+            ColumnarRestaurantDatabase.open_snapshot(self.path)
+
+    def test_rejects_the_other_byte_order(self):
+        with open(self.path, "r+b") as snapshot_file:
+            snapshot_file.seek(CATALOG_HEADER.size - 1)
+            snapshot_file.write(b">" if CATALOG_BYTE_ORDER == b"<" else b"<")
+        with self.assertRaisesRegex(ValueError, "byte order"):
+            ColumnarRestaurantDatabase.open_snapshot(self.path)
+
+    def test_empty_catalog(self):
+        ColumnarRestaurantDatabase([]).save_snapshot(self.path)
+        empty = ColumnarRestaurantDatabase.open_snapshot(self.path)
+        self.addCleanup(empty.close)
+        self.assertEqual((len(empty), empty.select(), RestaurantBrowsing(empty).autocomplete("a")), (0, [], []))
+
+
+# Unit tests for the spatial index and RestaurantBrowsing.search_nearby
+class TestNearbySearch(unittest.TestCase):
+    def setUp(self):
+        self.database = RestaurantDatabase()
+        self.browsing = RestaurantBrowsing(self.database)
+
+    def random_rows(self, count, seed=5):
+        rng = random.Random(seed)
+        return [{
+            "name": f"Restaurant {number}",
+            "cuisine": rng.choice(["Italian", "Thai", "Mexican"]),
+            "location": rng.choice(["Downtown", "Uptown"]),
+            "rating": round(rng.uniform(1.0, 5.0), 1),
+            "price_range": "$",
+            "delivery": rng.random() < 0.5,
+            "lat": rng.uniform(40.6, 40.9),
+            "lon": rng.uniform(-74.1, -73.8),
+        } for number in range(count)]
+
+    def brute_force(self, rows, lat, lon, radius_km, k, cuisine_type=None, min_rating=None, delivery=None):
+        matches = sorted(
+            (haversine_km(lat, lon, row['lat'], row['lon']), number) for number, row in enumerate(rows)
+            if (cuisine_type is None or row['cuisine'].lower() == cuisine_type.lower())
+            and (min_rating is None or row['rating'] >= min_rating)
+            and (delivery is None or row['delivery'] == delivery)
+        )
+        matches = [(distance, number) for distance, number in matches if radius_km is None or distance <= radius_km]
+        return [rows[number]['name'] for _, number in matches[:k]]
+
+    def test_nearest_sample_restaurants(self):
+        results = self.browsing.search_nearby(40.7125, -74.0075, radius_km=2.0)
+        self.assertEqual([restaurant['name'] for restaurant in results], ["Taco Town", "Italian Bistro"])
+        results = self.browsing.search_nearby(40.7125, -74.0075, radius_km=None, k=1, cuisine_type="italian")
+        self.assertEqual(results[0]['name'], "Italian Bistro")
+
+    def test_matches_brute_force(self):
+        rows = self.random_rows(3000)
+        for database in (RestaurantDatabase([dict(row) for row in rows]), ColumnarRestaurantDatabase(rows)):
+            browsing = RestaurantBrowsing(database)
+            for radius_km, k in [(1.5, None), (3.0, 10), (None, 25), (50.0, 5)]:
+                for filters in [{}, {"cuisine_type": "thai", "min_rating": 3.5, "delivery": False}]:
+                    results = browsing.search_nearby(40.75, -73.95, radius_km=radius_km, k=k, **filters)
+                    self.assertEqual([restaurant['name'] for restaurant in results],
+                                     self.brute_force(rows, 40.75, -73.95, radius_km, k, **filters))
+
+    def test_incremental_maintenance(self):
+        self.browsing.search_nearby(40.7125, -74.0075, radius_km=1.0)
+        restaurant_id = self.database.add_restaurant({"name": "Dumpling Den", "cuisine": "Chinese", "location": "Downtown",
+                                                      "rating": 4.4, "price_range": "$", "delivery": True,
+                                                      "lat": 40.7126, "lon": -74.0076})
+        self.assertEqual(self.browsing.search_nearby(40.7125, -74.0075, radius_km=None, k=1)[0]['name'], "Dumpling Den")
+        self.database.update_restaurant(restaurant_id, lat=40.9, lon=-73.7)
+        self.assertEqual(self.browsing.search_nearby(40.7125, -74.0075, radius_km=None, k=1)[0]['name'], "Taco Town")
+        self.database.remove_restaurant(3)
+        self.assertEqual(self.browsing.search_nearby(40.7125, -74.0075, radius_km=None, k=1)[0]['name'], "Italian Bistro")
+
+    def test_rows_without_coordinates_are_skipped(self):
+        self.database.add_restaurant({"name": "Ghost Kitchen", "cuisine": "Thai", "location": "Downtown",
+                                      "rating": 5.0, "price_range": "$", "delivery": True})
+        self.assertEqual(len(self.database.geo_index), 5)
+        with self.assertRaises(ValueError):
+            self.browsing.search_nearby(40.71, -74.01, radius_km=None)
+
+
 # Unit tests for RestaurantSearch class
 class TestRestaurantSearch(unittest.TestCase):
     def setUp(self):
@@ -89,5 +1809,220 @@ class TestRestaurantSearch(unittest.TestCase):
         self.assertEqual(results[0]['name'], "Pizza Palace")
 
 
+# Unit tests for ranked, paginated and streamed RestaurantSearch results
+class TestRankedSearch(unittest.TestCase):
+    def setUp(self):
+        self.database = RestaurantDatabase()
+        self.search = RestaurantSearch(RestaurantBrowsing(self.database))
+
+    def names(self, results):
+        return [restaurant['name'] for restaurant in results]
+
+    def test_sorted_with_limit(self):
+        self.assertEqual(self.names(self.search.search_restaurants(rating=4.0, sort_by="rating", limit=2)),
+                         ["Sushi House", "Italian Bistro"])
+        self.assertEqual(self.names(self.search.search_restaurants(sort_by="price_range", limit=3)),
+                         ["Burger King", "Taco Town", "Italian Bistro"])
+        self.assertEqual(self.names(self.search.search_restaurants(cuisine="Italian", sort_by="name")),
+                         ["Italian Bistro", "Pizza Palace"])
+        self.assertEqual(self.names(self.search.search_restaurants(limit=2)), ["Italian Bistro", "Sushi House"])
+
+    def test_unknown_sort_key(self):
+        with self.assertRaises(ValueError):
+            self.search.search_restaurants(sort_by="distance")
+
+    def test_pages_cover_every_match_once(self):
+        rng = random.Random(3)
+        self.database.add_restaurants([{"name": f"Diner {number}", "cuisine": "American", "location": "Uptown",
+                                        "rating": rng.choice([3.0, 3.5, 4.0, 4.5]), "price_range": "$",
+                                        "delivery": True} for number in range(95)])
+        expected = self.names(self.search.search_restaurants(rating=3.5, sort_by="rating"))
+        seen, cursor = [], None
+        while True:
+            page = self.search.search_page(rating=3.5, sort_by="rating", page_size=10, cursor=cursor)
+            seen.extend(self.names(page["results"]))
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_cursor_is_stable_across_inserts(self):
+        first = self.search.search_page(sort_by="name", page_size=2)
+        self.assertEqual(self.names(first["results"]), ["Burger King", "Italian Bistro"])
+        self.database.add_restaurant({"name": "Arepa Stand", "cuisine": "Venezuelan", "location": "Downtown",
+                                      "rating": 4.1, "price_range": "$", "delivery": True})
+        second = self.search.search_page(sort_by="name", page_size=2, cursor=first["next_cursor"])
+        self.assertEqual(self.names(second["results"]), ["Pizza Palace", "Sushi House"])
+
+    def test_invalid_cursor(self):
+        cursor = self.search.search_page(sort_by="name", page_size=1)["next_cursor"]
+        with self.assertRaises(ValueError):
+            self.search.search_page(sort_by="rating", cursor=cursor)
+        with self.assertRaises(ValueError):
+            self.search.search_page(sort_by="name", cursor="not-a-cursor")
+        for forged in (["name", 3, 0], ["name", "pizza", "0"], ["rating", "high", 0], ["rating", -4.5, None],
+                       ["price_range", True, 1], {"name": 1, "x": 2, "y": 3}):
+            cursor = base64.urlsafe_b64encode(json.dumps(forged).encode()).decode()
+            with self.assertRaisesRegex(ValueError, "cursor"):
+                self.search.search_page(sort_by=forged[0] if isinstance(forged, list) else "name", cursor=cursor)
+        valid = base64.urlsafe_b64encode(json.dumps(["rating", -4.5, 0]).encode()).decode()
+        self.assertEqual(len(self.search.search_page(sort_by="rating", cursor=valid)["results"]), 3)
+
+    def test_iter_restaurants_is_lazy_and_ordered(self):
+        stream = self.search.iter_restaurants(sort_by="rating")
+        self.assertEqual(self.names(itertools.islice(stream, 2)), ["Sushi House", "Italian Bistro"])
+        self.assertEqual(self.names(stream), ["Taco Town", "Burger King", "Pizza Palace"])
+        self.assertEqual(self.names(self.search.iter_restaurants(location="Uptown")), ["Burger King", "Pizza Palace"])
+
+
+# Unit tests for name autocomplete, fuzzy matching and the name filter
+class TestNameSearch(unittest.TestCase):
+    def setUp(self):
+        self.database = RestaurantDatabase()
+        self.browsing = RestaurantBrowsing(self.database)
+
+    def names(self, results):
+        return [restaurant['name'] for restaurant in results]
+
+    def test_autocomplete_matches_any_word_start(self):
+        self.assertEqual(self.names(self.browsing.autocomplete("bis")), ["Italian Bistro"])
+        self.assertEqual(self.names(self.browsing.autocomplete("  P")), ["Pizza Palace"])
+        self.assertEqual(self.names(self.browsing.autocomplete("", limit=2)), ["Italian Bistro", "Burger King"])
+        self.assertEqual(self.browsing.autocomplete("zzz"), [])
+
+    def test_fuzzy_search_tolerates_typos(self):
+        self.assertEqual(self.names(self.browsing.search_by_name("Suhsi Huose")), [])
+        self.assertEqual(self.names(self.browsing.search_by_name("sushi hous", min_similarity=0.4)), ["Sushi House"])
+        self.assertEqual(self.names(self.browsing.search_by_name("Pizza Pallace"))[0], "Pizza Palace")
+
+    def test_zero_similarity_accepts_any_shared_trigram(self):
+        names = self.names(self.browsing.search_by_name("house", limit=10, min_similarity=0))
+        self.assertEqual(names[0], "Sushi House")
+        self.assertEqual(self.browsing.search_by_name("zzz", min_similarity=0), [])
+
+    def test_fuzzy_ranking_matches_exhaustive_scoring(self):
+        rng = random.Random(9)
+        words = ["golden", "dragon", "palace", "garden", "bistro", "grill", "house", "kitchen", "taqueria", "noodle"]
+        self.database.add_restaurants([{"name": " ".join(rng.sample(words, 2)) + f" {number}", "cuisine": "Mixed",
+                                        "location": "Uptown", "rating": 4.0, "price_range": "$", "delivery": True}
+                                       for number in range(400)])
+        index = self.database.name_index
+        query_grams = index.trigrams_of(index.fold("golden dragn"))
+        expected = []
+        for restaurant_id, folded in index.names.items():
+            grams = index.trigrams_of(folded)
+            shared = len(query_grams & grams)
+            similarity = shared / (len(query_grams) + len(grams) - shared)
+            if similarity >= 0.3:
+                expected.append((-similarity, restaurant_id))
+        expected = [restaurant_id for _, restaurant_id in sorted(expected)[:15]]
+        self.assertEqual([restaurant_id for _, restaurant_id in index.fuzzy("golden dragn", limit=15)], expected)
+
+    def test_index_follows_row_changes(self):
+        self.browsing.autocomplete("taco")
+        self.database.update_restaurant(3, name="Burrito Barn")
+        self.assertEqual(self.browsing.autocomplete("taco"), [])
+        self.assertEqual(self.names(self.browsing.autocomplete("bur")), ["Burger King", "Burrito Barn"])
+        self.database.remove_restaurant(2)
+        self.assertEqual(self.names(self.browsing.autocomplete("bur")), ["Burrito Barn"])
+
+    def test_name_filter_combines_with_other_filters(self):
+        for database in (self.database, ColumnarRestaurantDatabase()):
+            browsing = RestaurantBrowsing(database)
+            self.assertEqual(self.names(browsing.search_by_filters(name="p", cuisine_type="italian")), ["Pizza Palace"])
+            self.assertEqual(self.names(browsing.search_by_filters(name="house", min_rating=4.9)), [])
+            self.assertEqual(self.names(RestaurantSearch(browsing).search_restaurants(name="b", sort_by="rating")),
+                             ["Italian Bistro", "Burger King"])
+
+
+# Unit tests for the RestaurantSearch result cache
+class TestSearchResultCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.database = RestaurantDatabase()
+        self.cache = SearchResultCache(max_entries=3, ttl_seconds=10.0, clock=lambda: self.now)
+        self.search = RestaurantSearch(RestaurantBrowsing(self.database), cache=self.cache)
+
+    def test_hits_share_case_folded_key(self):
+        first = self.search.search_restaurants(cuisine="Italian", location="Uptown")
+        second = self.search.search_restaurants(cuisine="ITALIAN", location="uptown")
+        self.assertEqual(first, second)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_lru_eviction(self):
+        for cuisine in ["Italian", "Mexican", "Japanese"]:
+            self.search.search_restaurants(cuisine=cuisine)
+        self.search.search_restaurants(cuisine="Italian")
+        self.search.search_restaurants(cuisine="Fast Food")
+        self.assertEqual(self.cache.evictions, 1)
+        self.search.search_restaurants(cuisine="Italian")
+        self.search.search_restaurants(cuisine="Mexican")
+        self.assertEqual(self.cache.stats()["hits"], 2)
+        self.assertEqual(self.cache.stats()["misses"], 5)
+
+    def test_entries_expire(self):
+        self.search.search_restaurants(rating=4.0)
+        self.now = 10.5
+        self.search.search_restaurants(rating=4.0)
+        self.assertEqual((self.cache.hits, self.cache.misses, self.cache.expirations), (0, 2, 1))
+
+    def test_writes_invalidate_only_affected_entries(self):
+        self.search.search_restaurants(cuisine="Italian")
+        self.search.search_restaurants(cuisine="Japanese")
+        self.search.search_restaurants(location="Downtown", rating=4.0)
+        self.database.add_restaurant({"name": "Osteria", "cuisine": "italian", "location": "Midtown",
+                                      "rating": 3.0, "price_range": "$$", "delivery": True})
+        self.assertEqual(self.cache.invalidations, 1)
+        self.assertEqual(len(self.search.search_restaurants(cuisine="Italian")), 3)
+        self.database.update_restaurant(3, rating=3.0)
+        self.assertEqual(self.cache.invalidations, 2)
+        self.assertEqual([restaurant['name'] for restaurant in self.search.search_restaurants(location="Downtown", rating=4.0)],
+                         ["Italian Bistro"])
+        self.search.search_restaurants(cuisine="Japanese")
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_concurrent_misses_compute_once(self):
+        calls, release = [], threading.Event()
+
+        def slow_search():
+            calls.append(1)
+            release.wait(5)
+            return ["result"]
+
+        key = self.cache.make_key(cuisine="Thai")
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_or_compute(key, slow_search)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        while not calls:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [["result"]] * 8)
+        self.assertEqual((self.cache.misses, self.cache.hits), (1, 7))
+
+
+# Unit tests for search metrics
+class TestSearchInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, METRICS, "enabled", METRICS.enabled)
+        METRICS.enabled = True
+        self.search = RestaurantSearch(RestaurantBrowsing(RestaurantDatabase()), cache=SearchResultCache())
+
+    def test_searches_and_cache_lookups_are_recorded(self):
+        latency = METRICS.histogram("restaurant_search_seconds", operation="search_restaurants")
+        calls, hits, misses = latency.count, SEARCH_CACHE_HITS.value, SEARCH_CACHE_MISSES.value
+        self.search.search_restaurants(cuisine="Italian")
+        self.search.search_restaurants(cuisine="Italian")
+        self.assertEqual(latency.count, calls + 2)
+        self.assertEqual((SEARCH_CACHE_HITS.value, SEARCH_CACHE_MISSES.value), (hits + 1, misses + 1))
+        METRICS.enabled = False
+        self.search.search_restaurants(cuisine="Italian")
+        self.assertEqual((latency.count, SEARCH_CACHE_HITS.value), (calls + 2, hits + 1))
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
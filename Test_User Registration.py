@@ -1,9 +1,43 @@
 import re
+import os
+import abc
+import hmac
+import json
+import time
+import base64
+import asyncio
+import sqlite3
 import hashlib
+import tempfile
+import itertools
+import threading
 import unittest
+from unittest import mock
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+# 用户存储接口：add_user 必须原子地完成“检查并插入”；缺少方法的实现在实例化时就会报错
+class UserStore(abc.ABC):
+    @abc.abstractmethod
+    def get_user(self, email):
+        """Return the user's record, or None if the email is not registered."""
+
+    @abc.abstractmethod
+    def save_user(self, email, password):
+        """Insert or overwrite a user's password hash."""
+
+    @abc.abstractmethod
+    def add_user(self, email, password):
+        """Insert the user only if the email is new; return False if it was already registered."""
+
+    def add_users(self, users):
+        """Bulk add_user over (email, password) pairs; returns one inserted flag per pair."""
+        return [self.add_user(email, password) for email, password in users]
+
 
 # 模拟数据库类
-class Database:
+class Database(UserStore):
     def __init__(self):
         self.users = {}
 
@@ -14,14 +48,307 @@ class Database:
         self.users[email] = {'email': email, 'password': password}
         return True
 
+    def add_user(self, email, password):
+        # dict.setdefault is a single atomic step under the GIL
+        record = {'email': email, 'password': password}
+        return self.users.setdefault(email, record) is record
+
+
+# 分片的线程安全内存存储：按邮箱哈希分到多个分片，每个分片一把锁
+class ShardedUserStore(UserStore):
+    def __init__(self, shard_count=16):
+        self.shards = [{} for _ in range(shard_count)]
+        self.locks = [threading.Lock() for _ in range(shard_count)]
+
+    def _shard(self, email):
+        position = hash(email) % len(self.shards)
+        return self.shards[position], self.locks[position]
+
+    def get_user(self, email):
+        shard, lock = self._shard(email)
+        with lock:
+            return shard.get(email)
+
+    def save_user(self, email, password):
+        shard, lock = self._shard(email)
+        with lock:
+            shard[email] = {'email': email, 'password': password}
+        return True
+
+    def add_user(self, email, password):
+        shard, lock = self._shard(email)
+        with lock:
+            if email in shard:
+                return False
+            shard[email] = {'email': email, 'password': password}
+            return True
+
+    def add_users(self, users):
+        # 按分片分组，每个分片只加一次锁
+        users = list(users)
+        by_shard = {}
+        for position, (email, password) in enumerate(users):
+            by_shard.setdefault(hash(email) % len(self.shards), []).append((position, email, password))
+        inserted = [False] * len(users)
+        for shard_number, entries in by_shard.items():
+            shard = self.shards[shard_number]
+            with self.locks[shard_number]:
+                for position, email, password in entries:
+                    if email not in shard:
+                        shard[email] = {'email': email, 'password': password}
+                        inserted[position] = True
+        return inserted
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+
+# SQLite 持久化存储：WAL 模式，固定 SQL 语句（由 sqlite3 的语句缓存复用），写入按批提交
+class SQLiteUserStore(UserStore):
+    CREATE_TABLE = "CREATE TABLE IF NOT EXISTS users (email TEXT PRIMARY KEY, password TEXT NOT NULL)"
+    SELECT_USER = "SELECT email, password FROM users WHERE email = ?"
+    INSERT_USER = "INSERT OR IGNORE INTO users (email, password) VALUES (?, ?)"
+    UPSERT_USER = ("INSERT INTO users (email, password) VALUES (?, ?) "
+                   "ON CONFLICT(email) DO UPDATE SET password = excluded.password")
+    COUNT_USERS = "SELECT COUNT(*) FROM users"
+
+    def __init__(self, path, batch_size=100):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = 0  # writes in the open transaction
+        self._lock = threading.Lock()  # one connection shared by every thread
+        self._connection = sqlite3.connect(path, check_same_thread=False, cached_statements=32)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(self.CREATE_TABLE)
+        self._connection.commit()
+
+    def get_user(self, email):
+        with self._lock:
+            row = self._connection.execute(self.SELECT_USER, (email,)).fetchone()
+        if row is None:
+            return None
+        return {'email': row[0], 'password': row[1]}
+
+    def save_user(self, email, password):
+        with self._lock:
+            self._connection.execute(self.UPSERT_USER, (email, password))
+            self._wrote(1)
+        return True
+
+    def add_user(self, email, password):
+        with self._lock:
+            inserted = self._connection.execute(self.INSERT_USER, (email, password)).rowcount == 1
+            self._wrote(1)
+        return inserted
+
+    def add_users(self, users):
+        # 整批写入同一个事务，结束后提交一次
+        with self._lock:
+            inserted = [self._connection.execute(self.INSERT_USER, (email, password)).rowcount == 1
+                        for email, password in users]
+            self._connection.commit()
+            self._pending = 0
+        return inserted
+
+    def _wrote(self, count):
+        # Writes stay in one open transaction until batch_size of them have accumulated.
+        self._pending += count
+        if self._pending >= self.batch_size:
+            self._connection.commit()
+            self._pending = 0
+
+    def flush(self):
+        with self._lock:
+            self._connection.commit()
+            self._pending = 0
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(self.COUNT_USERS).fetchone()[0]
+
+
+# 密码哈希编码工具：盐和摘要以无填充的 base64 存储
+def _b64encode(raw):
+    return base64.b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+# scrypt 哈希器（内存困难型），存储格式 scrypt$n$r$p$salt$hash
+class ScryptHasher:
+    algorithm = "scrypt"
+
+    def __init__(self, n=2 ** 14, r=8, p=1, salt_size=16, dklen=32):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.salt_size = salt_size
+        self.dklen = dklen
+
+    def _derive(self, password, salt, n, r, p, dklen):
+        # scrypt needs about 128 * n * r * p bytes; leave headroom over OpenSSL's 32 MiB default.
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=dklen,
+                              maxmem=256 * n * r * p + 1024 * 1024)
+
+    def hash(self, password):
+        salt = os.urandom(self.salt_size)
+        digest = self._derive(password, salt, self.n, self.r, self.p, self.dklen)
+        return f"{self.algorithm}${self.n}${self.r}${self.p}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def verify(self, password, encoded):
+        _, n, r, p, salt, digest = encoded.split("$")
+        expected = _b64decode(digest)
+        actual = self._derive(password, _b64decode(salt), int(n), int(r), int(p), len(expected))
+        return hmac.compare_digest(actual, expected)
+
+    def needs_rehash(self, encoded):
+        _, n, r, p, _, _ = encoded.split("$")
+        return (int(n), int(r), int(p)) != (self.n, self.r, self.p)
+
+
+# PBKDF2-SHA256 哈希器，存储格式 pbkdf2_sha256$iterations$salt$hash
+class PBKDF2Hasher:
+    algorithm = "pbkdf2_sha256"
+
+    def __init__(self, iterations=600000, salt_size=16, dklen=32):
+        self.iterations = iterations
+        self.salt_size = salt_size
+        self.dklen = dklen
+
+    def hash(self, password):
+        salt = os.urandom(self.salt_size)
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, self.iterations, self.dklen)
+        return f"{self.algorithm}${self.iterations}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def verify(self, password, encoded):
+        _, iterations, salt, digest = encoded.split("$")
+        expected = _b64decode(digest)
+        actual = hashlib.pbkdf2_hmac("sha256", password.encode(), _b64decode(salt), int(iterations), len(expected))
+        return hmac.compare_digest(actual, expected)
+
+    def needs_rehash(self, encoded):
+        return int(encoded.split("$")[1]) != self.iterations
+
+
+# 旧版无盐 SHA-256 哈希（64 位十六进制），只用于校验，登录成功后会被升级
+class LegacySHA256Hasher:
+    algorithm = "sha256"
+
+    def hash(self, password):
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    def verify(self, password, encoded):
+        return hmac.compare_digest(self.hash(password), encoded)
+
+    def needs_rehash(self, encoded):
+        return True
+
+
+# 可插拔密码哈希：用首选算法生成哈希，并能校验任何已知格式的旧哈希
+class PasswordHasher:
+    def __init__(self, preferred=None, fallbacks=None):
+        self.preferred = preferred or ScryptHasher()
+        self.hashers = {hasher.algorithm: hasher for hasher in (fallbacks or [ScryptHasher(), PBKDF2Hasher()])}
+        self.hashers[LegacySHA256Hasher.algorithm] = LegacySHA256Hasher()
+        self.hashers[self.preferred.algorithm] = self.preferred
+
+    def identify(self, encoded):
+        # Legacy hashes are bare hex digests; every newer format starts with "<algorithm>$".
+        if "$" not in encoded:
+            return LegacySHA256Hasher.algorithm
+        return encoded.split("$", 1)[0]
+
+    def hash(self, password):
+        return self.preferred.hash(password)
+
+    def verify(self, password, encoded):
+        hasher = self.hashers.get(self.identify(encoded))
+        if hasher is None:
+            return False
+        try:
+            return hasher.verify(password, encoded)
+        except ValueError:  # malformed stored hash
+            return False
+
+    def needs_rehash(self, encoded):
+        if self.identify(encoded) != self.preferred.algorithm:
+            return True
+        return self.preferred.needs_rehash(encoded)
+
+
+class HashingOverloadedError(RuntimeError):
+    pass
+
+
+# 进程池里执行的函数必须是模块级的，才能被 pickle
+def _hash_in_worker(hasher, password):
+    return hasher.hash(password)
+
+
+def _verify_in_worker(hasher, password, encoded):
+    return hasher.verify(password, encoded)
+
+
+# 有界的密码哈希进程池：请求数超过上限时立即拒绝，而不是无限排队
+class PasswordHashingPool:
+    def __init__(self, hasher=None, max_workers=None, max_pending=None, executor=None):
+        self.hasher = hasher or PasswordHasher()
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending if max_pending is not None else self.max_workers * 4
+        self._executor = executor or ProcessPoolExecutor(max_workers=self.max_workers)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def _submit(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingOverloadedError("Password hashing is overloaded, try again later")
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def submit_hash(self, password):
+        return self._submit(_hash_in_worker, self.hasher, password)
+
+    def submit_verify(self, password, encoded):
+        return self._submit(_verify_in_worker, self.hasher, password, encoded)
+
+    def hash_many(self, passwords):
+        """Hash a batch across the workers; bulk jobs bypass admission control since the caller sizes them."""
+        chunksize = max(1, len(passwords) // (self.max_workers * 4))
+        return list(self._executor.map(_hash_in_worker, itertools.repeat(self.hasher), passwords, chunksize=chunksize))
+
+    async def hash_async(self, password):
+        return await asyncio.wrap_future(self.submit_hash(password))
+
+    async def verify_async(self, password, encoded):
+        return await asyncio.wrap_future(self.submit_verify(password, encoded))
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+
 
 # 用户注册类
 class UserRegistration:
-    def __init__(self, database):
+    def __init__(self, database, hasher=None, pool=None):
         self.database = database
+        self.hasher = hasher or (pool.hasher if pool is not None else PasswordHasher())
+        self.pool = pool
 
     def validate_email(self, email):
-        if re.match(r"[^@]+@[^@]+\.[^@]+", email):
+        if EMAIL_PATTERN.match(email):
             return True
         else:
             raise ValueError("Invalid email format")
@@ -32,7 +359,7 @@ class UserRegistration:
         return True
 
     def encrypt_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest()
+        return self.hasher.hash(password)
 
     def register(self, email, password, confirm_password):
         self.validate_email(email)
@@ -42,21 +369,200 @@ class UserRegistration:
         if self.database.get_user(email):
             raise ValueError("User already registered")
         encrypted_password = self.encrypt_password(password)
-        self.database.save_user(email, encrypted_password)
+        # The early lookup skips hashing for known emails; add_user is what rules out duplicates.
+        if not self.database.add_user(email, encrypted_password):
+            raise ValueError("User already registered")
+        return "Registration successful"
+
+    def register_many(self, rows, chunk_size=1000):
+        """Register a stream of (email, password[, confirm_password]) rows.
+
+        Rows are consumed chunk by chunk, so memory stays bounded by chunk_size. Duplicates inside a
+        chunk are rejected up front; later duplicates are caught by the store's atomic insert. Returns
+        {"registered": count, "errors": [{"row", "email", "error"}, ...]} instead of raising.
+        """
+        report = {"registered": 0, "errors": []}
+        chunk = []
+        for row_number, row in enumerate(rows):
+            chunk.append((row_number, row))
+            if len(chunk) >= chunk_size:
+                self._register_chunk(chunk, report)
+                chunk = []
+        if chunk:
+            self._register_chunk(chunk, report)
+        return report
+
+    def _register_chunk(self, chunk, report):
+        accepted = {}  # email -> (row_number, password), in row order
+        errors = []
+        for row_number, row in chunk:
+            email = row[0] if row else None
+            try:
+                if len(row) < 2:
+                    raise ValueError("Missing password.")
+                email, password = row[0], row[1]
+                confirm_password = row[2] if len(row) > 2 else password
+                self.validate_email(email)
+                self.validate_password(password)
+                if password != confirm_password:
+                    raise ValueError("Passwords do not match")
+                if email in accepted:
+                    raise ValueError("Duplicate email in batch")
+                if self.database.get_user(email):
+                    raise ValueError("User already registered")
+            except (ValueError, TypeError) as error:
+                errors.append({"row": row_number, "email": email, "error": str(error)})
+                continue
+            accepted[email] = (row_number, password)
+
+        if accepted:
+            emails = list(accepted)
+            passwords = [accepted[email][1] for email in emails]
+            if self.pool is not None:
+                hashes = self.pool.hash_many(passwords)
+            else:
+                hashes = [self.hasher.hash(password) for password in passwords]
+            inserted = self.database.add_users(zip(emails, hashes))
+            for email, was_inserted in zip(emails, inserted):
+                if was_inserted:
+                    report["registered"] += 1
+                else:
+                    errors.append({"row": accepted[email][0], "email": email, "error": "User already registered"})
+        report["errors"].extend(sorted(errors, key=lambda error: error["row"]))
+
+    async def register_async(self, email, password, confirm_password):
+        # 哈希在进程池中执行，不阻塞事件循环
+        self.validate_email(email)
+        self.validate_password(password)
+        if password != confirm_password:
+            raise ValueError("Passwords do not match")
+        if self.database.get_user(email):
+            raise ValueError("User already registered")
+        encrypted_password = await self.pool.hash_async(password)
+        if not self.database.add_user(email, encrypted_password):
+            raise ValueError("User already registered")
         return "Registration successful"
 
 
+# 会话管理：HMAC 签名的不透明令牌，校验时不查用户库；撤销集合 + 最近校验过的令牌的 LRU 缓存
+class SessionManager:
+    def __init__(self, secret=None, ttl_seconds=3600, cache_size=10000, clock=time.time):
+        self.secret = secret or os.urandom(32)
+        self.ttl_seconds = ttl_seconds
+        self.cache_size = cache_size
+        self.clock = clock
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._revoked = {}  # token id -> expiry; kept only until the token would have expired anyway
+        self._revocations_since_purge = 0
+        self._cache = OrderedDict()  # token -> (email, expires_at, token_id), least recently used first
+        self._lock = threading.Lock()
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.secret, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, email):
+        claims = {"sub": email, "exp": int(self.clock() + self.ttl_seconds), "jti": _b64encode(os.urandom(12))}
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        return f"{payload}.{self._sign(payload)}"
+
+    def _decode(self, token):
+        payload, _, signature = token.partition(".")
+        if not hmac.compare_digest(self._sign(payload), signature):
+            return None
+        claims = json.loads(_b64decode(payload))
+        return claims["sub"], claims["exp"], claims["jti"]
+
+    def verify(self, token):
+        """Return the session's email, or None if the token is forged, expired or revoked."""
+        now = self.clock()
+        with self._lock:
+            cached = self._cache.get(token)
+            if cached is not None:
+                email, expires_at, token_id = cached
+                if expires_at <= now or token_id in self._revoked:
+                    del self._cache[token]
+                    return None
+                self._cache.move_to_end(token)
+                self.cache_hits += 1
+                return email
+            self.cache_misses += 1
+        try:
+            decoded = self._decode(token)
+        except (ValueError, KeyError, TypeError):
+            return None
+        if decoded is None:
+            return None
+        email, expires_at, token_id = decoded
+        with self._lock:
+            if expires_at <= now or token_id in self._revoked:
+                return None
+            self._cache[token] = decoded
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return email
+
+    def revoke(self, token):
+        try:
+            decoded = self._decode(token)
+        except (ValueError, KeyError, TypeError):
+            return False
+        if decoded is None:
+            return False
+        _, expires_at, token_id = decoded
+        with self._lock:
+            self._revoked[token_id] = expires_at
+            self._cache.pop(token, None)
+            self._revocations_since_purge += 1
+            if self._revocations_since_purge >= 1024:
+                self._purge_revoked()
+        return True
+
+    def _purge_revoked(self):
+        now = self.clock()
+        self._revoked = {token_id: expires_at for token_id, expires_at in self._revoked.items() if expires_at > now}
+        self._revocations_since_purge = 0
+
+
 # 用户登录类
 class UserLogin:
-    def __init__(self, database):
+    def __init__(self, database, hasher=None, pool=None, sessions=None):
         self.database = database
+        self.hasher = hasher or (pool.hasher if pool is not None else PasswordHasher())
+        self.pool = pool
+        self.sessions = sessions or SessionManager()
 
     def authenticate(self, email, password):
-        encrypted_password = hashlib.sha256(password.encode()).hexdigest()
         user = self.database.get_user(email)
-        if user and user['password'] == encrypted_password:
-            return True
-        return False
+        if not user or not self.hasher.verify(password, user['password']):
+            return False
+        self._upgrade_hash(email, password, user['password'])
+        return True
+
+    def login(self, email, password):
+        """Authenticate once and return a session token, or None if the credentials are wrong."""
+        if not self.authenticate(email, password):
+            return None
+        return self.sessions.issue(email)
+
+    def verify_session(self, token):
+        return self.sessions.verify(token)
+
+    def logout(self, token):
+        return self.sessions.revoke(token)
+
+    async def authenticate_async(self, email, password):
+        user = self.database.get_user(email)
+        if not user or not await self.pool.verify_async(password, user['password']):
+            return False
+        if self.hasher.needs_rehash(user['password']):
+            self.database.save_user(email, await self.pool.hash_async(password))
+        return True
+
+    def _upgrade_hash(self, email, password, stored_password):
+        # 旧格式或旧参数的哈希在登录成功时用明文密码重新哈希
+        if self.hasher.needs_rehash(stored_password):
+            self.database.save_user(email, self.hasher.hash(password))
 
 
 # 用户注册测试类
@@ -109,5 +615,244 @@ class TestUserLogin(unittest.TestCase):
         self.assertFalse(result)
 
 
+# 密码哈希测试类
+class TestPasswordHashing(unittest.TestCase):
+    def setUp(self):
+        self.hasher = PasswordHasher(preferred=ScryptHasher(n=2 ** 10))
+        self.database = Database()
+        self.user_registration = UserRegistration(self.database, hasher=self.hasher)
+        self.user_login = UserLogin(self.database, hasher=self.hasher)
+
+    def test_hashes_are_salted_and_self_describing(self):
+        first = self.hasher.hash("password123")
+        second = self.hasher.hash("password123")
+        self.assertNotEqual(first, second)
+        self.assertTrue(first.startswith("scrypt$1024$8$1$"))
+        self.assertTrue(self.hasher.verify("password123", first))
+        self.assertFalse(self.hasher.verify("password124", first))
+        self.assertFalse(self.hasher.verify("password123", "scrypt$garbage"))
+
+    def test_pbkdf2_hasher(self):
+        hasher = PasswordHasher(preferred=PBKDF2Hasher(iterations=1000))
+        encoded = hasher.hash("password123")
+        self.assertTrue(encoded.startswith("pbkdf2_sha256$1000$"))
+        self.assertTrue(hasher.verify("password123", encoded))
+        self.assertTrue(self.hasher.verify("password123", encoded))
+        self.assertTrue(self.hasher.needs_rehash(encoded))
+
+    def test_legacy_hash_is_upgraded_on_login(self):
+        self.database.save_user("old@example.com", hashlib.sha256(b"password123").hexdigest())
+        self.assertFalse(self.user_login.authenticate("old@example.com", "wrongpassword"))
+        self.assertEqual(len(self.database.get_user("old@example.com")['password']), 64)
+        self.assertTrue(self.user_login.authenticate("old@example.com", "password123"))
+        upgraded = self.database.get_user("old@example.com")['password']
+        self.assertTrue(upgraded.startswith("scrypt$"))
+        self.assertTrue(self.user_login.authenticate("old@example.com", "password123"))
+        self.assertEqual(self.database.get_user("old@example.com")['password'], upgraded)
+
+    def test_changed_cost_parameters_trigger_rehash(self):
+        self.user_registration.register("user@example.com", "password123", "password123")
+        stronger = PasswordHasher(preferred=ScryptHasher(n=2 ** 11))
+        self.assertTrue(UserLogin(self.database, hasher=stronger).authenticate("user@example.com", "password123"))
+        self.assertTrue(self.database.get_user("user@example.com")['password'].startswith("scrypt$2048$"))
+
+
+# 哈希进程池测试类
+class TestPasswordHashingPool(unittest.TestCase):
+    def test_async_register_and_login_use_the_pool(self):
+        pool = PasswordHashingPool(hasher=PasswordHasher(preferred=ScryptHasher(n=2 ** 10)), max_workers=2)
+        self.addCleanup(pool.shutdown)
+        database = Database()
+        registration = UserRegistration(database, pool=pool)
+        login = UserLogin(database, pool=pool)
+
+        async def scenario():
+            await registration.register_async("async@example.com", "password123", "password123")
+            return await asyncio.gather(login.authenticate_async("async@example.com", "password123"),
+                                        login.authenticate_async("async@example.com", "wrongpassword"))
+
+        self.assertEqual(asyncio.run(scenario()), [True, False])
+
+    def test_admission_control_rejects_overload(self):
+        release = threading.Event()
+
+        class BlockingHasher:
+            def hash(self, password):
+                release.wait(5)
+                return password
+
+        pool = PasswordHashingPool(hasher=BlockingHasher(), max_workers=1, max_pending=2,
+                                   executor=ThreadPoolExecutor(max_workers=1))
+        self.addCleanup(pool.shutdown)
+        futures = [pool.submit_hash("a"), pool.submit_hash("b")]
+        with self.assertRaises(HashingOverloadedError):
+            pool.submit_hash("c")
+        release.set()
+        self.assertEqual([future.result() for future in futures], ["a", "b"])
+
+
+# 用户存储测试类
+class TestUserStores(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "users.db")
+        self.hasher = PasswordHasher(preferred=PBKDF2Hasher(iterations=1))
+
+    def open_sqlite(self, batch_size=100):
+        store = SQLiteUserStore(self.path, batch_size=batch_size)
+        self.addCleanup(store._connection.close)
+        return store
+
+    def test_add_user_is_insert_if_absent(self):
+        for store in (Database(), ShardedUserStore(), self.open_sqlite()):
+            self.assertTrue(store.add_user("user@example.com", "hash1"))
+            self.assertFalse(store.add_user("user@example.com", "hash2"))
+            self.assertEqual(store.get_user("user@example.com")['password'], "hash1")
+            store.save_user("user@example.com", "hash3")
+            self.assertEqual(store.get_user("user@example.com")['password'], "hash3")
+            self.assertIsNone(store.get_user("missing@example.com"))
+
+    def test_incomplete_store_fails_when_created(self):
+        class ReadOnlyStore(UserStore):
+            def get_user(self, email):
+                return None
+
+        with self.assertRaises(TypeError):
+            ReadOnlyStore()
+
+    def test_sqlite_store_persists_and_uses_wal(self):
+        store = self.open_sqlite(batch_size=2)
+        journal_mode = store._connection.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(journal_mode, "wal")
+        UserRegistration(store, hasher=self.hasher).register("user@example.com", "password123", "password123")
+        store.close()
+        reopened = self.open_sqlite()
+        self.assertTrue(UserLogin(reopened, hasher=self.hasher).authenticate("user@example.com", "password123"))
+
+    def test_concurrent_registrations_never_duplicate(self):
+        emails = [f"user{number}@example.com" for number in range(40)]
+        for store in (Database(), ShardedUserStore(shard_count=4), self.open_sqlite(batch_size=7)):
+            registration = UserRegistration(store, hasher=self.hasher)
+            successes, barrier = [], threading.Barrier(16)
+
+            def sign_up_everyone():
+                barrier.wait()
+                for email in emails:
+                    try:
+                        registration.register(email, "password123", "password123")
+                        successes.append(email)
+                    except ValueError:
+                        pass
+
+            threads = [threading.Thread(target=sign_up_everyone) for _ in range(16)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(sorted(successes), sorted(emails))
+            self.assertTrue(all(store.get_user(email) for email in emails))
+
+
+# 批量注册测试类
+class TestBulkRegistration(unittest.TestCase):
+    def setUp(self):
+        self.hasher = PasswordHasher(preferred=PBKDF2Hasher(iterations=1))
+
+    def rows(self):
+        yield ("a@example.com", "password123")
+        yield ("not-an-email", "password123")
+        yield ("b@example.com", "short")
+        yield ("c@example.com", "password123", "password321")
+        yield ("a@example.com", "password456")
+        yield ("existing@example.com", "password123")
+        yield ("d@example.com",)
+        yield ("e@example.com", "password123", "password123")
+        yield ("b@example.com", "password123")
+
+    def test_report_lists_every_failed_row(self):
+        database = ShardedUserStore()
+        database.add_user("existing@example.com", "hash")
+        report = UserRegistration(database, hasher=self.hasher).register_many(self.rows(), chunk_size=4)
+        self.assertEqual(report["registered"], 3)
+        self.assertEqual([(error["row"], error["error"]) for error in report["errors"]], [
+            (1, "Invalid email format"),
+            (2, "Password must be at least 8 characters long"),
+            (3, "Passwords do not match"),
+            (4, "User already registered"),
+            (5, "User already registered"),
+            (6, "Missing password."),
+        ])
+        self.assertTrue(UserLogin(database, hasher=self.hasher).authenticate("b@example.com", "password123"))
+
+    def test_duplicates_inside_a_chunk(self):
+        report = UserRegistration(Database(), hasher=self.hasher).register_many(self.rows(), chunk_size=100)
+        self.assertIn({"row": 4, "email": "a@example.com", "error": "Duplicate email in batch"}, report["errors"])
+        self.assertEqual(report["registered"], 4)
+
+    def test_parallel_hashing_into_sqlite(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = SQLiteUserStore(os.path.join(directory.name, "users.db"))
+        self.addCleanup(store.close)
+        pool = PasswordHashingPool(hasher=self.hasher, max_workers=2)
+        self.addCleanup(pool.shutdown)
+        rows = ((f"user{number}@example.com", "password123") for number in range(250))
+        report = UserRegistration(store, pool=pool).register_many(rows, chunk_size=64)
+        self.assertEqual(report, {"registered": 250, "errors": []})
+        self.assertEqual(len(store), 250)
+        self.assertTrue(UserLogin(store, hasher=self.hasher).authenticate("user249@example.com", "password123"))
+
+
+# 会话测试类
+class TestSessions(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.database = Database()
+        hasher = PasswordHasher(preferred=PBKDF2Hasher(iterations=1000))
+        self.sessions = SessionManager(secret=b"test-secret", ttl_seconds=60, cache_size=2, clock=lambda: self.now)
+        UserRegistration(self.database, hasher=hasher).register("test@example.com", "password123", "password123")
+        self.user_login = UserLogin(self.database, hasher=hasher, sessions=self.sessions)
+
+    def test_login_issues_verifiable_token(self):
+        self.assertIsNone(self.user_login.login("test@example.com", "wrongpassword"))
+        token = self.user_login.login("test@example.com", "password123")
+        self.assertEqual(self.user_login.verify_session(token), "test@example.com")
+        self.assertEqual(self.user_login.verify_session(token), "test@example.com")
+        self.assertEqual((self.sessions.cache_misses, self.sessions.cache_hits), (1, 1))
+
+    def test_verification_needs_no_store_lookup(self):
+        token = self.user_login.login("test@example.com", "password123")
+        other_process = SessionManager(secret=b"test-secret", clock=lambda: self.now)
+        with mock.patch.object(self.database, "get_user", side_effect=AssertionError("store was queried")):
+            self.assertEqual(other_process.verify(token), "test@example.com")
+
+    def test_tampered_and_foreign_tokens_are_rejected(self):
+        token = self.user_login.login("test@example.com", "password123")
+        payload, signature = token.split(".")
+        forged = _b64encode(json.dumps({"sub": "admin@example.com", "exp": 10 ** 10, "jti": "x"}).encode())
+        self.assertIsNone(self.sessions.verify(f"{forged}.{signature}"))
+        self.assertIsNone(self.sessions.verify("garbage"))
+        self.assertIsNone(SessionManager(secret=b"other-secret").verify(token))
+
+    def test_expiry_and_revocation(self):
+        token = self.user_login.login("test@example.com", "password123")
+        self.assertEqual(self.sessions.verify(token), "test@example.com")
+        self.assertTrue(self.user_login.logout(token))
+        self.assertIsNone(self.sessions.verify(token))
+        fresh = self.user_login.login("test@example.com", "password123")
+        self.sessions.verify(fresh)
+        self.now += 61
+        self.assertIsNone(self.sessions.verify(fresh))
+
+    def test_cache_is_bounded(self):
+        tokens = [self.sessions.issue(f"user{number}@example.com") for number in range(3)]
+        for token in tokens:
+            self.sessions.verify(token)
+        self.assertEqual(len(self.sessions._cache), 2)
+        self.assertEqual(self.sessions.verify(tokens[0]), "user0@example.com")
+        self.assertEqual(self.sessions.cache_misses, 4)
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,347 @@
+import collections
+import functools
+import sys
+import threading
+import time
+
+
+# Histogram Class: HDR-style log-linear latency histogram with per-thread buckets
+class Histogram:
+    """Values (nanoseconds) below 2**sub_bucket_bits are counted exactly; above that every power of
+    two is split into 2**(sub_bucket_bits - 1) equal buckets, so any recorded value is reported
+    within about 1 / 2**(sub_bucket_bits - 1) of its true value (about 3% by default).
+
+    Each thread increments its own bucket list, so record() takes no lock and loses no updates;
+    readers merge the per-thread lists on demand. record() is a closure over its constants rather
+    than a method, which keeps it around a third of a microsecond.
+    """
+
+    def __init__(self, sub_bucket_bits=5, max_bits=64):
+        self.sub_bucket_bits = sub_bucket_bits
+        self._half = 1 << (sub_bucket_bits - 1)
+        self._size = ((max_bits - sub_bucket_bits + 1) << (sub_bucket_bits - 1)) + (1 << sub_bucket_bits)
+        self._local = threading.local()
+        self._shards = []  # one [bucket counts..., count, sum] list per recording thread
+        self._shards_lock = threading.Lock()
+        self.record = self._make_record()
+
+    def _new_shard(self):
+        shard = [0] * (self._size + 2)
+        with self._shards_lock:
+            self._shards.append(shard)
+        self._local.shard = shard
+        return shard
+
+    def _make_record(self):
+        local = self._local
+        new_shard = self._new_shard
+        bits = self.sub_bucket_bits
+        half_bits = bits - 1
+
+        def record(value):
+            try:
+                shard = local.shard
+            except AttributeError:
+                shard = new_shard()
+            shift = value.bit_length() - bits
+            shard[value if shift <= 0 else (shift << half_bits) + (value >> shift)] += 1
+            shard[-2] += 1
+            shard[-1] += value
+        return record
+
+    def bucket_value(self, index):
+        """Midpoint of the values that land in bucket `index`."""
+        if index < (1 << self.sub_bucket_bits):
+            return index
+        shift, offset = divmod(index, self._half)
+        shift -= 1
+        low = (self._half + offset) << shift
+        return low + ((1 << shift) >> 1)
+
+    def merged(self):
+        with self._shards_lock:
+            shards = list(self._shards)
+        totals = [0] * (self._size + 2)
+        for shard in shards:
+            for index, value in enumerate(shard):
+                if value:
+                    totals[index] += value
+        return totals
+
+    @property
+    def count(self):
+        with self._shards_lock:
+            return sum(shard[-2] for shard in self._shards)
+
+    def summary(self, quantiles=(0.5, 0.9, 0.99, 0.999)):
+        totals = self.merged()
+        count, total = totals[-2], totals[-1]
+        results = {"count": count, "sum": total}
+        if not count:
+            return {**results, **{quantile: 0 for quantile in quantiles}}
+        targets = sorted(quantiles)
+        seen = 0
+        pending = iter(targets)
+        quantile = next(pending)
+        for index, bucket_count in enumerate(totals[:-2]):
+            seen += bucket_count
+            while quantile is not None and seen >= quantile * count:
+                results[quantile] = self.bucket_value(index)
+                quantile = next(pending, None)
+            if quantile is None:
+                break
+        return results
+
+    def percentile(self, quantile):
+        return self.summary((quantile,))[quantile]
+
+    def reset(self):
+        with self._shards_lock:
+            for shard in self._shards:
+                shard[:] = [0] * len(shard)
+
+
+# Counter Class: monotonically increasing count, per-thread like Histogram
+class Counter:
+    """inc() is a no-op while the owning registry (if any) is disabled."""
+
+    def __init__(self, registry=None):
+        self._registry = registry
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if self._registry is not None and not self._registry.enabled:
+            return
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._local.shard = [0]
+            with self._shards_lock:
+                self._shards.append(shard)
+        shard[0] += amount
+
+    @property
+    def value(self):
+        with self._shards_lock:
+            return sum(shard[0] for shard in self._shards)
+
+    def reset(self):
+        with self._shards_lock:
+            for shard in self._shards:
+                shard[0] = 0
+
+
+# _Timer Class: context manager form of MetricsRegistry.timed
+class _Timer:
+    __slots__ = ("registry", "histogram", "started")
+
+    def __init__(self, registry, histogram):
+        self.registry = registry
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns() if self.registry.enabled else None
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.started is not None:
+            self.histogram.record(time.perf_counter_ns() - self.started)
+        return False
+
+
+# MetricsRegistry Class: named, labelled counters and histograms plus span tracing
+class MetricsRegistry:
+    """Metrics are created on first use and keyed by (name, sorted labels).
+
+    Histograms hold nanoseconds and are exported in seconds. Set `enabled` to False at runtime to
+    turn recording off: timers and spans then skip the clock reads entirely. Finished spans go into a
+    bounded deque (appends are atomic) as (trace_id, stage, start_ns, duration_ns) tuples, and their
+    durations into the "span_duration_seconds" histogram.
+    """
+
+    def __init__(self, enabled=True, max_spans=10000):
+        self.enabled = enabled
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.spans = collections.deque(maxlen=max_spans)
+        self._span_records = {}  # stage name -> record() of its span_duration_seconds histogram
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items())) if len(labels) > 1 else tuple(labels.items())
+
+    def histogram(self, name, **labels):
+        key = self._key(name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        return histogram
+
+    def counter(self, name, **labels):
+        key = self._key(name, labels)
+        counter = self._counters.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(key, Counter(self))
+        return counter
+
+    def inc(self, name, amount=1, **labels):
+        """One-off increment; hot paths should keep the counter() object and call its inc()."""
+        if self.enabled:
+            self.counter(name, **labels).inc(amount)
+
+    def timer(self, name, **labels):
+        """Context manager recording the duration of its block into histogram `name`."""
+        return _Timer(self, self.histogram(name, **labels))
+
+    def timed(self, name, **labels):
+        """Decorator recording each call's duration into histogram `name`."""
+        record = self.histogram(name, **labels).record
+
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                started = time.perf_counter_ns()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    record(time.perf_counter_ns() - started)
+            return wrapper
+        return decorate
+
+    def span(self, trace_id, name):
+        return _SpanContext(self, trace_id, name)
+
+    def trace(self, trace_id):
+        return [span for span in list(self.spans) if span[0] == trace_id]
+
+    def reset(self):
+        with self._lock:
+            histograms = list(self._histograms.values())
+            counters = list(self._counters.values())
+        for metric in histograms + counters:
+            metric.reset()
+        self.spans.clear()
+
+    def prometheus_text(self, quantiles=(0.5, 0.9, 0.99, 0.999)):
+        """Counters as `counter` and histograms as `summary` in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        typed = set()
+        for (name, labels), counter in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {counter.value}")
+        for (name, labels), histogram in histograms:
+            summary = histogram.summary(quantiles)
+            if not summary["count"]:
+                continue
+            if name not in typed:
+                lines.append(f"# TYPE {name} summary")
+                typed.add(name)
+            for quantile in quantiles:
+                lines.append(f"{name}{_format_labels(labels + (('quantile', str(quantile)),))} {summary[quantile] / 1e9:.9f}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {summary['sum'] / 1e9:.9f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def profile(self, seconds, interval=0.005):
+        """Sample every thread's stack for `seconds` and return collapsed stacks (flamegraph input)."""
+        profiler = SamplingProfiler(interval)
+        profiler.start()
+        time.sleep(seconds)
+        profiler.stop()
+        return profiler.collapsed()
+
+
+class _SpanContext:
+    __slots__ = ("registry", "trace_id", "name", "started")
+
+    def __init__(self, registry, trace_id, name):
+        self.registry = registry
+        self.trace_id = trace_id
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns() if self.registry.enabled else None
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.started is not None:
+            registry = self.registry
+            duration = time.perf_counter_ns() - self.started
+            registry.spans.append((self.trace_id, self.name, self.started, duration))
+            record = registry._span_records.get(self.name)
+            if record is None:
+                record = registry._span_records[self.name] = registry.histogram(
+                    "span_duration_seconds", stage=self.name).record
+            record(duration)
+        return False
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+# SamplingProfiler Class: on-demand statistical profiler over sys._current_frames()
+class SamplingProfiler:
+    """A daemon thread wakes every `interval` seconds and counts each other thread's stack.
+
+    It costs nothing until started. collapsed() renders "outer;inner;leaf count" lines, the input
+    format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return self.stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+METRICS = MetricsRegistry()
@@ -0,0 +1,17 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+
+# Money helpers shared by order placement and payment processing: amounts are integer cents
+# internally and Decimal dollars at the edges (prices, the wire, the settlement ledger)
+CENT = Decimal("0.01")
+
+
+def to_cents(amount):
+    """Convert a dollar amount (float, str, int or Decimal) to integer cents, rounding half up."""
+    if isinstance(amount, float):
+        amount = repr(amount)  # the shortest repr round-trips, so 8.99 stays exactly 8.99
+    return int((Decimal(amount) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return (Decimal(cents) * CENT).quantize(CENT)